@@ -1,8 +1,41 @@
 from django.contrib import admin
 from django.contrib.contenttypes import admin as ct_admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from django.utils.translation import gettext as _
 from ordered_model.admin import OrderedModelAdmin
 
 from unicef_attachments import models as app_models
+from unicef_attachments.utils import denormalize_many
+
+
+class ApproximateCountPaginator(Paginator):
+    """Use the planner row estimate to count large unfiltered tables
+
+    Exact counts of filtered querysets and small tables are kept.
+    """
+
+    exact_count_threshold = 10000
+
+    def get_estimate(self):
+        queryset = self.object_list
+        with connections[queryset.db].cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        return row[0] if row else -1
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, "query", None)
+        if query is not None and not query.where:
+            estimate = self.get_estimate()
+            if estimate > self.exact_count_threshold:
+                return estimate
+        return super().count
 
 
 @admin.register(app_models.FileType)
@@ -25,10 +58,39 @@ class AttachmentAdmin(admin.ModelAdmin):
     ]
     list_filter = [
         "file_type",
+        "is_active",
     ]
     raw_id_fields = [
         "uploaded_by",
     ]
+    list_select_related = [
+        "file_type",
+        "uploaded_by",
+    ]
+    paginator = ApproximateCountPaginator
+    show_full_result_count = False
+    actions = [
+        "denormalize_selected",
+        "deactivate_selected",
+    ]
+
+    @admin.action(description=_("Re-denormalize selected attachments"))
+    def denormalize_selected(self, request, queryset):
+        flats = denormalize_many(queryset)
+        self.message_user(request, _("Denormalized {} attachments.").format(len(flats)))
+
+    @admin.action(description=_("Deactivate selected attachments"))
+    def deactivate_selected(self, request, queryset):
+        count = queryset.deactivate()
+        self.message_user(request, _("Deactivated {} attachments.").format(count))
+
+    def get_queryset(self, request):
+        # include inactive attachments
+        qs = self.model.all_objects.get_queryset()
+        ordering = self.get_ordering(request)
+        if ordering:
+            qs = qs.order_by(*ordering)
+        return qs
 
 
 class AttachmentInlineAdminMixin:
@@ -55,7 +117,7 @@ class AttachmentInline(ct_admin.GenericTabularInline):
 
     def get_queryset(self, request):
         qs = super().get_queryset(request)
-        return qs.filter(code=self.code)
+        return qs.filter(code=self.code).select_related("uploaded_by")
 
     def get_formset(self, request, obj=None, **kwargs):
         formset = super().get_formset(request, obj, **kwargs)
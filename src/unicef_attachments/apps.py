@@ -0,0 +1,8 @@
+from django.apps import AppConfig
+
+
+class AttachmentsConfig(AppConfig):
+    name = "unicef_attachments"
+
+    def ready(self):
+        from unicef_attachments import signals  # noqa: F401
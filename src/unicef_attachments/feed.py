@@ -0,0 +1,104 @@
+import base64
+import json
+from datetime import datetime, timedelta
+from heapq import merge
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from unicef_attachments.models import Attachment, AttachmentTombstone
+from unicef_attachments.utils import get_attachment_flat_model
+
+
+def encode_cursor(modified, pk):
+    value = json.dumps([modified.isoformat(), pk])
+    return base64.urlsafe_b64encode(value.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """Position in the feed as a (modified, id) tuple
+
+    Raises ValueError for malformed cursors
+    """
+    try:
+        modified, pk = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(modified), int(pk)
+    except (TypeError, ValueError, UnicodeError) as e:
+        raise ValueError(str(e))
+
+
+def get_feed_lag():
+    """Seconds the most recent changes are held back
+
+    `modified` is set before the transaction commits, so a slow
+    transaction may commit changes behind a cursor already returned.
+    Only changes older than the lag are returned, transactions
+    taking longer than it can still be missed.
+    """
+    return getattr(settings, "ATTACHMENT_FEED_LAG", 5)
+
+
+def after_cursor(position, modified_field, pk_field):
+    if position is None:
+        return Q()
+    modified, pk = position
+    return Q(**{"{}__gt".format(modified_field): modified}) | Q(
+        **{modified_field: modified, "{}__gt".format(pk_field): pk}
+    )
+
+
+def get_changes(position=None, limit=500, using=None, queryset=None, before=None):
+    """Attachment changes after position, ordered by (modified, id)
+
+    Only changes modified before `before` are returned,
+    now minus the feed lag by default.
+
+    Changes are read from queryset, all attachments by default,
+    so it can be restricted to the attachments a request may access.
+    Returns a list of (modified, id, attachment, flat, tombstone reason)
+    tuples, attachment and flat are None for deleted attachments,
+    deactivated attachments are tombstones too.
+    Each source is queried through the (modified, id) indexes
+    for at most limit rows and merged.
+    """
+    if queryset is None:
+        queryset = Attachment.all_objects.all()
+    if before is None:
+        before = timezone.now() - timedelta(seconds=get_feed_lag())
+    attachments = (
+        queryset.using(using)
+        .filter(after_cursor(position, "modified", "id"), modified__lt=before)
+        .select_related("file_type", "uploaded_by")
+        .order_by("modified", "id")[:limit]
+    )
+    tombstones = (
+        AttachmentTombstone.objects.db_manager(using)
+        .filter(after_cursor(position, "modified", "attachment_id"), modified__lt=before)
+        .order_by("modified", "attachment_id")
+        .values_list("modified", "attachment_id")[:limit]
+    )
+    changes = merge(
+        ((attachment.modified, attachment.pk, attachment) for attachment in attachments),
+        ((modified, pk, None) for modified, pk in tombstones),
+        key=lambda change: change[:2],
+    )
+    changes = list(changes)[:limit]
+
+    active = [attachment for __, __, attachment in changes if attachment is not None and attachment.is_active]
+    flat_model = get_attachment_flat_model()
+    flats = {flat.attachment_id: flat for flat in flat_model.objects.db_manager(using).filter(attachment__in=active)}
+
+    results = []
+    for modified, pk, attachment in changes:
+        if attachment is None:
+            results.append((modified, pk, None, None, "deleted"))
+        elif not attachment.is_active:
+            results.append((modified, pk, None, None, "deactivated"))
+        else:
+            flat = flats.get(pk)
+            if flat is not None:
+                # already loaded with its file type, for the flat serializer
+                flat.attachment = attachment
+            results.append((modified, pk, attachment, flat, None))
+    return results
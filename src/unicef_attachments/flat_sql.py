@@ -0,0 +1,508 @@
+"""SQL used to maintain attachment flat data inside PostgreSQL
+
+Mirrors `get_attachment_flat_values` for the values that can be derived
+from the attachment, file type and user tables.
+The object link needs the content object's `get_object_url`,
+so it can not be computed in SQL.
+"""
+
+import re
+from datetime import datetime
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AbstractUser
+from django.db import connection
+from django.urls import reverse
+from django.utils import timezone
+
+USER_NAME_FIELDS = {"first_name", "last_name"}
+
+
+def get_url_prefix(name):
+    # urls end with "<pk>/", strip the sample pk
+    return reverse(name, args=[0])[: -len("0/")]
+
+
+def get_filename_sql(alias="a"):
+    return (
+        "CASE WHEN {a}.file IS NOT NULL AND {a}.file <> '' "
+        "THEN regexp_replace({a}.file, '^.*/', '') "
+        "ELSE regexp_replace(split_part(split_part(regexp_replace("
+        "{a}.hyperlink, '^[a-zA-Z][a-zA-Z0-9+.-]*://[^/]*', ''), '?', 1), '#', 1), '^.*/', '') END"
+    ).format(a=alias)
+
+
+def get_url_quote_sql(value):
+    """Percent encode the SQL value as `reverse` quotes url arguments
+
+    Characters other than unreserved, sub-delims, "/", ":" and "@"
+    are encoded as their bytes in the database encoding, UTF-8 text
+    for both UTF8 and SQL_ASCII databases. `chr(37)` is "%", kept out
+    of the SQL so it is not taken for a query parameter.
+    """
+    return (
+        "(SELECT string_agg(CASE WHEN q.c ~ '[A-Za-z0-9_.~!$&''()*+,;=:@/-]' THEN q.c "
+        "ELSE regexp_replace(upper(encode(convert_to(q.c, getdatabaseencoding()), 'hex')), "
+        "'(..)', chr(37) || '\\1', 'g') END, '' ORDER BY q.i) "
+        "FROM regexp_split_to_table({value}, '') WITH ORDINALITY AS q(c, i))"
+    ).format(value=value)
+
+
+def get_flat_columns(attachment="a", file_type="ft", user="u"):
+    """Column name to SQL expression, for the flat values computed in SQL"""
+    filename = get_filename_sql(attachment)
+    file_prefix = get_url_prefix("attachments:file")
+    preview_prefix = get_url_prefix("attachments:preview")
+    return {
+        "file_type": "COALESCE({ft}.label, '')".format(ft=file_type),
+        "file_link": (
+            "CASE WHEN {filename} <> '' THEN '{prefix}' || {a}.id || '/' || {quoted} "
+            "WHEN {a}.hyperlink <> '' THEN '{prefix}' || {a}.id || '/' "
+            "ELSE '' END"
+        ).format(a=attachment, filename=filename, quoted=get_url_quote_sql(filename), prefix=file_prefix),
+        "filename": filename,
+        "uploaded_by": "COALESCE(btrim(concat({u}.first_name, ' ', {u}.last_name)), '')".format(u=user),
+        "ip_address": "{a}.ip_address".format(a=attachment),
+        "created": "to_char({a}.created AT TIME ZONE 'UTC', 'DD Mon YYYY')".format(a=attachment),
+        "preview_link": (
+            "CASE WHEN {a}.preview IS NOT NULL AND {a}.preview <> '' THEN '{prefix}' || {a}.id || '/' ELSE '' END"
+        ).format(a=attachment, prefix=preview_prefix),
+        "is_active": "{a}.is_active".format(a=attachment),
+        "created_at": "{a}.created".format(a=attachment),
+        "modified_at": "{a}.modified".format(a=attachment),
+    }
+
+
+def get_flat_joins(attachment="a", file_type="ft", user="u"):
+    from unicef_attachments.models import FileType
+
+    return (
+        "LEFT OUTER JOIN {file_type_table} {ft} ON {ft}.id = {a}.file_type_id "
+        "LEFT OUTER JOIN {user_table} {u} ON {u}.{user_pk} = {a}.uploaded_by_id"
+    ).format(
+        a=attachment,
+        ft=file_type,
+        u=user,
+        file_type_table=connection.ops.quote_name(FileType._meta.db_table),
+        user_table=connection.ops.quote_name(get_user_model()._meta.db_table),
+        user_pk=get_user_model()._meta.pk.column,
+    )
+
+
+def get_flat_view_select():
+    from unicef_attachments.models import Attachment
+
+    columns = get_flat_columns()
+    return (
+        "SELECT a.id AS id, a.id AS attachment_id, ''::varchar AS object_link, {columns} FROM {table} a {joins}".format(
+            columns=", ".join("{} AS {}".format(sql, name) for name, sql in columns.items()),
+            table=connection.ops.quote_name(Attachment._meta.db_table),
+            joins=get_flat_joins(),
+        )
+    )
+
+
+def create_flat_view(view):
+    with connection.cursor() as cursor:
+        cursor.execute("CREATE MATERIALIZED VIEW {} AS {}".format(view, get_flat_view_select()))
+        cursor.execute("CREATE UNIQUE INDEX {0}_attachment_idx ON {0} (attachment_id)".format(view))
+
+
+def refresh_flat_view(view, concurrently=True):
+    with connection.cursor() as cursor:
+        cursor.execute("REFRESH MATERIALIZED VIEW {}{}".format("CONCURRENTLY " if concurrently else "", view))
+
+
+def drop_flat_view(view):
+    with connection.cursor() as cursor:
+        cursor.execute("DROP MATERIALIZED VIEW IF EXISTS {}".format(view))
+
+
+TRIGGER_FUNCTION = "unicef_attachments_flat_sync"
+TRIGGERS = {
+    "unicef_attachments_flat_insert": "INSERT",
+    "unicef_attachments_flat_update": "UPDATE",
+}
+
+
+def get_flat_trigger_function():
+    """Statement level trigger function, refreshing flat rows of changed attachments
+
+    Flat rows are updated, and created if missing, with one statement each
+    for all the attachments changed by the triggering statement.
+    Object link is left to application code.
+    """
+    from unicef_attachments.models import Attachment
+    from unicef_attachments.utils import get_attachment_flat_model
+
+    flat_model = get_attachment_flat_model()
+    flat_columns = {field.column for field in flat_model._meta.concrete_fields}
+    columns = {name: sql for name, sql in get_flat_columns().items() if name in flat_columns}
+    source = "FROM changed c JOIN {table} a ON a.id = c.id {joins}".format(
+        table=connection.ops.quote_name(Attachment._meta.db_table),
+        joins=get_flat_joins(),
+    )
+    flat_table = connection.ops.quote_name(flat_model._meta.db_table)
+    return """
+CREATE OR REPLACE FUNCTION {function}() RETURNS trigger AS $$
+BEGIN
+    UPDATE {flat} f SET {assignments}
+    FROM (SELECT a.id AS attachment_id, {select} {source}) v
+    WHERE f.attachment_id = v.attachment_id;
+
+    INSERT INTO {flat} (attachment_id, object_link, {names})
+    SELECT a.id, '', {expressions} {source}
+    WHERE NOT EXISTS (SELECT 1 FROM {flat} f WHERE f.attachment_id = a.id);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql""".format(
+        function=TRIGGER_FUNCTION,
+        flat=flat_table,
+        assignments=", ".join("{0} = v.{0}".format(name) for name in columns),
+        select=", ".join("{} AS {}".format(sql, name) for name, sql in columns.items()),
+        names=", ".join(columns),
+        expressions=", ".join(columns.values()),
+        source=source,
+    )
+
+
+def install_flat_triggers():
+    from unicef_attachments.models import Attachment
+
+    table = connection.ops.quote_name(Attachment._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(get_flat_trigger_function())
+        for name, event in TRIGGERS.items():
+            cursor.execute("DROP TRIGGER IF EXISTS {} ON {}".format(name, table))
+            cursor.execute(
+                "CREATE TRIGGER {name} AFTER {event} ON {table} REFERENCING NEW TABLE AS changed "
+                "FOR EACH STATEMENT EXECUTE FUNCTION {function}()".format(
+                    name=name,
+                    event=event,
+                    table=table,
+                    function=TRIGGER_FUNCTION,
+                )
+            )
+
+
+def uninstall_flat_triggers():
+    from unicef_attachments.models import Attachment
+
+    table = connection.ops.quote_name(Attachment._meta.db_table)
+    with connection.cursor() as cursor:
+        for name in TRIGGERS:
+            cursor.execute("DROP TRIGGER IF EXISTS {} ON {}".format(name, table))
+        cursor.execute("DROP FUNCTION IF EXISTS {}()".format(TRIGGER_FUNCTION))
+
+
+PARTITION_KEY = "created_at"
+PARTITION_BOUND_RE = re.compile(r"FROM \((?:'([^']+)'|MINVALUE)\) TO \((?:'([^']+)'|MAXVALUE)\)")
+
+
+def month_start(value, months=0):
+    """First instant of the month of value, moved by months"""
+    month = value.year * 12 + value.month - 1 + months
+    return value.replace(year=month // 12, month=month % 12 + 1, day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def get_partition_name(table, start):
+    return "{}_p{}".format(table, start.strftime("%Y%m"))
+
+
+def is_partitioned(table):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass", [table])
+        return cursor.fetchone() is not None
+
+
+def get_partitions(table):
+    """Range partitions of the table as (name, start, end) tuples
+
+    Unbounded start or end is None, the default partition is left out
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = %s::regclass ORDER BY c.relname",
+            [table],
+        )
+        rows = cursor.fetchall()
+    partitions = []
+    for name, bound in rows:
+        match = PARTITION_BOUND_RE.search(bound)
+        if match is None:
+            continue
+        start, end = (datetime.fromisoformat(value) if value else None for value in match.groups())
+        partitions.append((name, start, end))
+    return partitions
+
+
+def convert_flat_to_partitioned(model, now=None):
+    """Turn the flat table into a table partitioned by month of creation
+
+    The existing table is kept as the partition of everything created
+    before next month, indexes and foreign keys are recreated on the
+    partitioned table. Takes an exclusive lock on the table.
+    """
+    from unicef_attachments.models import Attachment
+
+    table = model._meta.db_table
+    quoted = connection.ops.quote_name(table)
+    legacy = "{}_legacy".format(table)
+    quoted_legacy = connection.ops.quote_name(legacy)
+    end = month_start(now or timezone.now(), 1)
+    with connection.cursor() as cursor:
+        cursor.execute("LOCK TABLE {} IN ACCESS EXCLUSIVE MODE".format(quoted))
+        # the table can not be altered with deferred foreign key checks pending
+        cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        cursor.execute(
+            "SELECT conname, contype, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = %s::regclass AND contype IN ('p', 'f')",
+            [table],
+        )
+        constraints = cursor.fetchall()
+        cursor.execute(
+            "SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s AND indexname NOT IN "
+            "(SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype IN ('p', 'u'))",
+            [table, table],
+        )
+        indexes = cursor.fetchall()
+        cursor.execute(
+            "SELECT attidentity <> '' FROM pg_attribute WHERE attrelid = %s::regclass AND attname = 'id'",
+            [table],
+        )
+        identity = cursor.fetchone()[0]
+
+        cursor.execute(
+            "UPDATE {flat} f SET {key} = a.created FROM {attachment} a "
+            "WHERE a.id = f.attachment_id AND f.{key} IS NULL".format(
+                flat=quoted,
+                key=PARTITION_KEY,
+                attachment=connection.ops.quote_name(Attachment._meta.db_table),
+            )
+        )
+        cursor.execute("ALTER TABLE {} RENAME TO {}".format(quoted, quoted_legacy))
+        for name, __ in indexes:
+            cursor.execute("ALTER INDEX {} RENAME TO {}".format(name, connection.ops.quote_name(name + "_legacy")))
+        for name, contype, __ in constraints:
+            if contype == "p":
+                # replaced by the (id, created_at) key of the partitioned table
+                cursor.execute(
+                    "ALTER TABLE {} DROP CONSTRAINT {}".format(quoted_legacy, connection.ops.quote_name(name))
+                )
+            else:
+                cursor.execute(
+                    "ALTER TABLE {} RENAME CONSTRAINT {} TO {}".format(
+                        quoted_legacy,
+                        connection.ops.quote_name(name),
+                        connection.ops.quote_name(name + "_legacy"),
+                    )
+                )
+        cursor.execute("ALTER TABLE {} ALTER COLUMN {} SET NOT NULL".format(quoted_legacy, PARTITION_KEY))
+
+        if identity:
+            # partitioned tables cannot have identity columns before PostgreSQL 17
+            sequence = connection.ops.quote_name("{}_id_seq".format(table))
+            cursor.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM {}".format(quoted_legacy))
+            next_id = cursor.fetchone()[0]
+            cursor.execute("ALTER TABLE {} ALTER COLUMN id DROP IDENTITY".format(quoted_legacy))
+        cursor.execute(
+            "CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS) PARTITION BY RANGE ({})".format(
+                quoted, quoted_legacy, PARTITION_KEY
+            )
+        )
+        if identity:
+            cursor.execute("CREATE SEQUENCE {} START WITH {} OWNED BY {}.id".format(sequence, next_id, quoted))
+            cursor.execute("ALTER TABLE {} ALTER COLUMN id SET DEFAULT nextval('{}')".format(quoted, sequence))
+        else:
+            cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [legacy])
+            sequence = cursor.fetchone()[0]
+            if sequence:
+                cursor.execute("ALTER SEQUENCE {} OWNED BY {}.id".format(sequence, quoted))
+
+        for name, contype, definition in constraints:
+            if contype == "p":
+                cursor.execute(
+                    "ALTER TABLE {} ADD CONSTRAINT {} PRIMARY KEY (id, {})".format(
+                        quoted, connection.ops.quote_name(name), PARTITION_KEY
+                    )
+                )
+        cursor.execute(
+            "ALTER TABLE {} ATTACH PARTITION {} FOR VALUES FROM (MINVALUE) TO (%s)".format(quoted, quoted_legacy),
+            [end],
+        )
+        cursor.execute(
+            "CREATE TABLE {} PARTITION OF {} DEFAULT".format(
+                connection.ops.quote_name("{}_default".format(table)),
+                quoted,
+            )
+        )
+        for __, definition in indexes:
+            cursor.execute(definition)
+        for name, contype, definition in constraints:
+            if contype == "f":
+                cursor.execute(
+                    "ALTER TABLE {} ADD CONSTRAINT {} {}".format(quoted, connection.ops.quote_name(name), definition)
+                )
+        cursor.execute("SET CONSTRAINTS ALL DEFERRED")
+
+
+def create_flat_partitions(model, months=3, now=None):
+    """Create monthly partitions from this month on, returns their names
+
+    Months already covered by a partition are skipped
+    """
+    table = model._meta.db_table
+    now = now or timezone.now()
+    partitions = get_partitions(table)
+    created = []
+    with connection.cursor() as cursor:
+        for offset in range(months + 1):
+            start, end = month_start(now, offset), month_start(now, offset + 1)
+            if any(
+                (lower is None or lower < end) and (upper is None or upper > start) for __, lower, upper in partitions
+            ):
+                continue
+            name = get_partition_name(table, start)
+            cursor.execute(
+                "CREATE TABLE {} PARTITION OF {} FOR VALUES FROM (%s) TO (%s)".format(
+                    connection.ops.quote_name(name),
+                    connection.ops.quote_name(table),
+                ),
+                [start, end],
+            )
+            created.append(name)
+    return created
+
+
+def detach_flat_partitions(model, before, drop=False):
+    """Detach partitions holding only rows created before the given time
+
+    Detached tables are kept for archiving, unless drop is set
+    """
+    table = model._meta.db_table
+    detached = []
+    with connection.cursor() as cursor:
+        for name, __, upper in get_partitions(table):
+            if upper is None or upper > before:
+                continue
+            cursor.execute(
+                "ALTER TABLE {} DETACH PARTITION {}".format(
+                    connection.ops.quote_name(table),
+                    connection.ops.quote_name(name),
+                )
+            )
+            if drop:
+                cursor.execute("DROP TABLE {}".format(connection.ops.quote_name(name)))
+            detached.append(name)
+    return detached
+
+
+def update_flat_columns(names, condition, params, batch_size=5000):
+    """Recompute flat columns of the attachments matching the condition
+
+    One `UPDATE ... FROM` statement per batch of attachment ids,
+    rows already holding the values are not written.
+    Condition is SQL on the attachment table aliased as `a`.
+    The `modified` of the attachments of updated rows is bumped.
+    Returns the number of flat rows updated.
+    """
+    from unicef_attachments.models import Attachment
+    from unicef_attachments.utils import get_attachment_flat_model
+
+    flat_model = get_attachment_flat_model()
+    flat_columns = {field.column for field in flat_model._meta.concrete_fields}
+    columns = {name: sql for name, sql in get_flat_columns().items() if name in names and name in flat_columns}
+    if not columns or not flat_model._meta.managed:
+        return 0
+
+    attachment_table = connection.ops.quote_name(Attachment._meta.db_table)
+    bounds_sql = (
+        "SELECT MAX(id) FROM (SELECT a.id FROM {table} a WHERE ({condition}) AND a.id > %s " "ORDER BY a.id LIMIT %s) s"
+    ).format(table=attachment_table, condition=condition)
+    # touch the attachments of the updated rows, so the change feed reports them,
+    # clock_timestamp() as now() is the start of a possibly long transaction
+    update_sql = (
+        "WITH updated AS (UPDATE {flat} f SET {assignments} "
+        "FROM (SELECT a.id AS attachment_id, {select} FROM {table} a {joins} "
+        "WHERE ({condition}) AND a.id > %s AND a.id <= %s) v "
+        "WHERE f.attachment_id = v.attachment_id AND ({changed}) RETURNING f.attachment_id) "
+        "UPDATE {table} t SET modified = clock_timestamp() FROM updated WHERE t.id = updated.attachment_id"
+    ).format(
+        flat=connection.ops.quote_name(flat_model._meta.db_table),
+        assignments=", ".join("{0} = v.{0}".format(name) for name in columns),
+        select=", ".join("{} AS {}".format(sql, name) for name, sql in columns.items()),
+        table=attachment_table,
+        joins=get_flat_joins(),
+        condition=condition,
+        changed=" OR ".join("f.{0} IS DISTINCT FROM v.{0}".format(name) for name in columns),
+    )
+    updated = 0
+    last_id = 0
+    with connection.cursor() as cursor:
+        while True:
+            cursor.execute(bounds_sql, params + [last_id, batch_size])
+            upper = cursor.fetchone()[0]
+            if upper is None:
+                break
+            cursor.execute(update_sql, params + [last_id, upper])
+            updated += cursor.rowcount
+            last_id = upper
+    return updated
+
+
+def get_propagate_batch_size():
+    return getattr(settings, "ATTACHMENT_FLAT_PROPAGATE_BATCH_SIZE", 5000)
+
+
+def update_flat_file_type(file_type_id):
+    """Set the file type label on the flat rows of its attachments"""
+    return update_flat_columns(["file_type"], "a.file_type_id = %s", [file_type_id], get_propagate_batch_size())
+
+
+def user_name_in_sql():
+    """Whether the user name SQL matches `get_full_name` of the user model"""
+    user_model = get_user_model()
+    field_names = {field.name for field in user_model._meta.concrete_fields}
+    return USER_NAME_FIELDS <= field_names and getattr(user_model, "get_full_name", None) is AbstractUser.get_full_name
+
+
+def update_flat_user_name(user_id, batch_size=5000):
+    """Set `get_full_name` of the user on the flat rows of their attachments
+
+    Used when the name of the user model can not be computed in SQL.
+    """
+    from unicef_attachments.models import Attachment
+    from unicef_attachments.utils import get_attachment_flat_model
+
+    flat_model = get_attachment_flat_model()
+    user = get_user_model()._default_manager.filter(pk=user_id).first()
+    if user is None or not flat_model._meta.managed:
+        return 0
+
+    name = user.get_full_name()
+    ids = Attachment.all_objects.filter(uploaded_by_id=user_id).order_by("pk").values_list("pk", flat=True)
+    updated = 0
+    last_id = 0
+    while True:
+        batch = list(ids.filter(pk__gt=last_id)[:batch_size])
+        if not batch:
+            break
+        changed = list(
+            flat_model.objects.filter(attachment_id__in=batch)
+            .exclude(uploaded_by=name)
+            .values_list("attachment_id", flat=True)
+        )
+        if changed:
+            updated += flat_model.objects.filter(attachment_id__in=changed).update(uploaded_by=name)
+            Attachment.all_objects.filter(pk__in=changed).update(modified=timezone.now())
+        last_id = batch[-1]
+    return updated
+
+
+def update_flat_uploaded_by(user_id):
+    """Set the user name on the flat rows of the attachments they uploaded"""
+    if not user_name_in_sql():
+        return update_flat_user_name(user_id, get_propagate_batch_size())
+    return update_flat_columns(["uploaded_by"], "a.uploaded_by_id = %s", [user_id], get_propagate_batch_size())
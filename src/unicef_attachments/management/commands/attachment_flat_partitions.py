@@ -0,0 +1,47 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from unicef_attachments import flat_sql
+from unicef_attachments.utils import get_attachment_flat_model
+
+
+class Command(BaseCommand):
+    help = "Partition the attachment flat table by month of creation and maintain its partitions"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--convert",
+            action="store_true",
+            help="Convert the flat table to a partitioned table, locks the table while running",
+        )
+        parser.add_argument("--months", type=int, default=3, help="Months ahead to create partitions for")
+        parser.add_argument("--retain-months", type=int, help="Detach partitions older than this many months")
+        parser.add_argument("--drop", action="store_true", help="Drop detached partitions instead of keeping them")
+        parser.add_argument("--now", type=datetime.fromisoformat, help="Reference time, defaults to now")
+
+    def handle(self, *args, **options):
+        model = get_attachment_flat_model()
+        table = model._meta.db_table
+        now = options["now"] or timezone.now()
+        if timezone.is_naive(now):
+            now = timezone.make_aware(now)
+
+        with transaction.atomic():
+            if options["convert"]:
+                if flat_sql.is_partitioned(table):
+                    raise CommandError("{} is already partitioned".format(table))
+                flat_sql.convert_flat_to_partitioned(model, now=now)
+                self.stdout.write("Partitioned {}".format(table))
+            elif not flat_sql.is_partitioned(table):
+                raise CommandError("{} is not partitioned, run with --convert first".format(table))
+
+            for name in flat_sql.create_flat_partitions(model, months=options["months"], now=now):
+                self.stdout.write("Created {}".format(name))
+
+            if options["retain_months"] is not None:
+                before = flat_sql.month_start(now, -options["retain_months"])
+                for name in flat_sql.detach_flat_partitions(model, before, drop=options["drop"]):
+                    self.stdout.write("{} {}".format("Dropped" if options["drop"] else "Detached", name))
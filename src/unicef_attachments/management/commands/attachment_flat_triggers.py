@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from unicef_attachments import flat_sql
+
+
+class Command(BaseCommand):
+    help = "Install or remove the database triggers maintaining attachment flat data"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--uninstall", action="store_true", help="Remove the triggers")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if options["uninstall"]:
+                flat_sql.uninstall_flat_triggers()
+                self.stdout.write("Removed attachment flat triggers")
+            else:
+                flat_sql.install_flat_triggers()
+                self.stdout.write("Installed attachment flat triggers")
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from unicef_attachments import flat_sql
+from unicef_attachments.models import AttachmentFlatView
+
+
+class Command(BaseCommand):
+    help = "Create, refresh or drop the attachment flat materialized view"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--create", action="store_true", help="(Re)create the view")
+        parser.add_argument("--drop", action="store_true", help="Drop the view")
+        parser.add_argument(
+            "--no-concurrently",
+            action="store_false",
+            dest="concurrently",
+            help="Refresh without CONCURRENTLY, locking out reads",
+        )
+
+    def handle(self, *args, **options):
+        view = AttachmentFlatView._meta.db_table
+        if options["drop"] or options["create"]:
+            with transaction.atomic():
+                flat_sql.drop_flat_view(view)
+                if options["create"]:
+                    flat_sql.create_flat_view(view)
+            self.stdout.write("{} {}".format("Created" if options["create"] else "Dropped", view))
+        else:
+            flat_sql.refresh_flat_view(view, concurrently=options["concurrently"])
+            self.stdout.write("Refreshed {}".format(view))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Max, Min, OuterRef, Q, Subquery
+
+from unicef_attachments.models import Attachment
+from unicef_attachments.utils import flat_model_has_field, flat_model_is_managed, get_attachment_flat_model
+
+
+class Command(BaseCommand):
+    help = "Set the created_at and modified_at timestamps of flat rows missing them"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000, help="Flat rows updated per statement")
+
+    def handle(self, *args, **options):
+        flat_model = get_attachment_flat_model()
+        if not flat_model_is_managed() or not flat_model_has_field("modified_at"):
+            self.stdout.write("{} has no timestamps to backfill".format(flat_model._meta.label))
+            return
+
+        attachments = Attachment.all_objects.filter(pk=OuterRef("attachment_id"))
+        queryset = flat_model.objects.filter(Q(created_at__isnull=True) | Q(modified_at__isnull=True))
+        bounds = queryset.aggregate(first_pk=Min("pk"), last_pk=Max("pk"))
+        updated = 0
+        if bounds["first_pk"] is None:
+            self.stdout.write("Backfilled 0 flat rows")
+            return
+        # walk primary key ranges, each batch is one indexed UPDATE
+        for start in range(bounds["first_pk"], bounds["last_pk"] + 1, options["batch_size"]):
+            updated += queryset.filter(pk__gte=start, pk__lt=start + options["batch_size"]).update(
+                created_at=Subquery(attachments.values("created")[:1]),
+                modified_at=Subquery(attachments.values("modified")[:1]),
+            )
+        self.stdout.write("Backfilled {} flat rows".format(updated))
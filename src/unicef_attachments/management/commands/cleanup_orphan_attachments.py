@@ -0,0 +1,118 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from unicef_attachments.models import Attachment
+from unicef_attachments.utils import get_attachment_flat_model
+
+
+class RateLimiter:
+    """Allow at most `rate` calls per second, across threads"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self.lock = threading.Lock()
+        self.next_call = time.monotonic()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_call - now
+            self.next_call = max(now, self.next_call) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+class Command(BaseCommand):
+    help = "Delete attachments that were uploaded but never linked to an object"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--ttl-hours", type=int, default=24, help="Age after which unlinked uploads are removed")
+        parser.add_argument("--batch-size", type=int, default=500, help="Attachments removed per batch")
+        parser.add_argument("--workers", type=int, default=4, help="Number of parallel storage workers")
+        parser.add_argument("--rate", type=float, default=0, help="Max storage calls per second, 0 for no limit")
+        parser.add_argument("--dry-run", action="store_true", help="Report what would be removed")
+
+    def get_queryset(self, ttl_hours):
+        # backed by the partial index on created for unlinked attachments
+        return Attachment.all_objects.filter(
+            content_type__isnull=True,
+            object_id__isnull=True,
+            created__lt=timezone.now() - timedelta(hours=ttl_hours),
+            links__isnull=True,
+        ).order_by("created", "pk")
+
+    def delete_files(self, attachment):
+        reclaimed = 0
+        for field_file in (attachment.file, attachment.preview):
+            if not field_file:
+                continue
+            self.rate_limiter.wait()
+            try:
+                reclaimed += field_file.storage.size(field_file.name)
+            except OSError:
+                continue
+            if not self.dry_run:
+                self.rate_limiter.wait()
+                field_file.storage.delete(field_file.name)
+        return reclaimed
+
+    def delete_rows(self, batch, ttl_hours, flat_model):
+        """Delete the rows of the batch that are still orphaned, return them
+
+        Uploads linked since the batch was selected are kept, the
+        remaining rows are locked so they can not be linked meanwhile.
+        """
+        with transaction.atomic():
+            pks = set(
+                self.get_queryset(ttl_hours)
+                .filter(pk__in=[attachment.pk for attachment in batch])
+                .select_for_update(of=("self",))
+                .values_list("pk", flat=True)
+            )
+            if flat_model._meta.managed:
+                flat_model.objects.filter(attachment_id__in=pks).delete()
+            Attachment.all_objects.filter(pk__in=pks).delete()
+        return [attachment for attachment in batch if attachment.pk in pks]
+
+    def handle(self, *args, **options):
+        self.dry_run = options["dry_run"]
+        self.rate_limiter = RateLimiter(options["rate"])
+        queryset = self.get_queryset(options["ttl_hours"]).only("pk", "created", "file", "preview")
+        flat_model = get_attachment_flat_model()
+
+        removed = reclaimed = 0
+        last = None
+        with ThreadPoolExecutor(max_workers=options["workers"]) as executor:
+            while True:
+                batch_qs = queryset
+                if last is not None:
+                    # deleted rows are gone, a dry run has to page through
+                    batch_qs = batch_qs.filter(created__gte=last.created).exclude(
+                        created=last.created,
+                        pk__lte=last.pk,
+                    )
+                batch = list(batch_qs[: options["batch_size"]])
+                if not batch:
+                    break
+                last = batch[-1]
+                if not self.dry_run:
+                    batch = self.delete_rows(batch, options["ttl_hours"], flat_model)
+                # files of removed rows only, once the delete is committed
+                reclaimed += sum(executor.map(self.delete_files, batch))
+                removed += len(batch)
+
+        self.stdout.write(
+            "{} {} orphaned attachments, {} bytes reclaimed".format(
+                "Would remove" if self.dry_run else "Removed",
+                removed,
+                reclaimed,
+            )
+        )
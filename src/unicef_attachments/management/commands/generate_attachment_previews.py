@@ -0,0 +1,23 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from unicef_attachments import previews
+from unicef_attachments.models import Attachment
+
+
+class Command(BaseCommand):
+    help = "Generate previews for existing image attachments"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4, help="Number of parallel workers")
+
+    def handle(self, *args, **options):
+        if previews.Image is None:
+            raise CommandError("Pillow is required to generate previews")
+
+        queryset = Attachment.objects.exclude(file__isnull=True).exclude(file="").only("pk", "file", "preview")
+        pks = [attachment.pk for attachment in queryset.iterator() if previews.needs_preview(attachment)]
+        with ThreadPoolExecutor(max_workers=options["workers"]) as executor:
+            list(executor.map(previews.generate_preview_for_pk, pks))
+        self.stdout.write("Generated previews for {} attachments".format(len(pks)))
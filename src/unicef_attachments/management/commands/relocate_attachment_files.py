@@ -0,0 +1,51 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, transaction
+
+from unicef_attachments.models import Attachment
+from unicef_attachments.utils import delete_relocated_files, denormalize_many, relocate_attachment_file
+
+
+def relocate(attachment):
+    try:
+        return relocate_attachment_file(attachment)
+    except OSError:
+        return []
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = "Move attachment files to the paths generated by the current file path strategy"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4, help="Number of parallel workers")
+        parser.add_argument("--batch-size", type=int, default=500, help="Attachments updated per batch")
+
+    def handle(self, *args, **options):
+        queryset = (
+            Attachment.all_objects.exclude(file__isnull=True)
+            .exclude(file="")
+            .select_related("content_type")
+            .order_by("pk")
+        )
+        moved = 0
+        last_pk = 0
+        with ThreadPoolExecutor(max_workers=options["workers"]) as executor:
+            while True:
+                batch = list(queryset.filter(pk__gt=last_pk)[: options["batch_size"]])
+                if not batch:
+                    break
+                last_pk = batch[-1].pk
+                replaced = list(executor.map(relocate, batch))
+                relocated = [attachment for attachment, files in zip(batch, replaced) if files]
+                if relocated:
+                    # the old files are only removed once the new names are committed
+                    with transaction.atomic():
+                        Attachment.all_objects.bulk_update(relocated, ["file", "preview"])
+                        denormalize_many(relocated)
+                        transaction.on_commit(partial(delete_relocated_files, [f for files in replaced for f in files]))
+                    moved += len(relocated)
+        self.stdout.write("Relocated {} attachment files".format(moved))
@@ -1,20 +1,24 @@
 # Generated by Django 2.2 on 2019-07-05 17:46
 
-from django.db import migrations
+from django.contrib.postgres.fields import ArrayField
+from django.db import migrations, models
 
 
 def update_group(apps, schema_editor):
     FileType = apps.get_model("unicef_attachments", "filetype")
-    for file_type in FileType.objects.all():
-        file_type.group = [file_type.code]
-        file_type.save()
+    FileType.objects.update(
+        group=models.Func(
+            models.F("code"),
+            function="ARRAY",
+            template="%(function)s[%(expressions)s]",
+            output_field=ArrayField(models.CharField(max_length=64, blank=True)),
+        )
+    )
 
 
 def reverse_update(apps, schema_editor):
     FileType = apps.get_model("unicef_attachments", "filetype")
-    for file_type in FileType.objects.all():
-        file_type.group = []
-        file_type.save()
+    FileType.objects.update(group=[])
 
 
 class Migration(migrations.Migration):
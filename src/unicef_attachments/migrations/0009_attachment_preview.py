@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("unicef_attachments", "0008_attachment_is_active"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="attachment",
+            name="preview",
+            field=models.FileField(blank=True, max_length=1024, null=True, upload_to="", verbose_name="Preview"),
+        ),
+        migrations.AddField(
+            model_name="attachmentflat",
+            name="preview_link",
+            field=models.CharField(blank=True, max_length=1024, verbose_name="Preview Link"),
+        ),
+    ]
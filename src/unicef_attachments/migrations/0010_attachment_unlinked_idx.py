@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:56
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("contenttypes", "0002_remove_content_type_name"),
+        ("unicef_attachments", "0009_attachment_preview"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="attachment",
+            index=models.Index(
+                condition=models.Q(("content_type__isnull", True), ("object_id__isnull", True)),
+                fields=["created"],
+                name="attachment_unlinked_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:57
+
+import django.db.models.manager
+from django.conf import settings
+from django.db import migrations, models
+
+
+def deactivate_flats(apps, schema_editor):
+    AttachmentFlat = apps.get_model("unicef_attachments", "attachmentflat")
+    AttachmentFlat.objects.filter(attachment__is_active=False).update(is_active=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("contenttypes", "0002_remove_content_type_name"),
+        ("unicef_attachments", "0010_attachment_unlinked_idx"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="attachment",
+            options={"base_manager_name": "all_objects", "ordering": ["id"]},
+        ),
+        migrations.AlterModelManagers(
+            name="attachment",
+            managers=[
+                ("objects", django.db.models.manager.Manager()),
+                ("all_objects", django.db.models.manager.Manager()),
+            ],
+        ),
+        migrations.AddField(
+            model_name="attachmentflat",
+            name="is_active",
+            field=models.BooleanField(default=True),
+        ),
+        migrations.RunPython(deactivate_flats, reverse_code=migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="attachment",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["content_type", "object_id"],
+                name="attachment_active_object_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="attachmentflat",
+            index=models.Index(
+                condition=models.Q(("is_active", True)), fields=["attachment"], name="attachmentflat_active_idx"
+            ),
+        ),
+    ]
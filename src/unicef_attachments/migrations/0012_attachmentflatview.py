@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("unicef_attachments", "0011_attachment_soft_delete"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AttachmentFlatView",
+            fields=[
+                ("id", models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("object_link", models.URLField(blank=True, verbose_name="Object Link")),
+                ("file_type", models.CharField(blank=True, max_length=100, verbose_name="File Type")),
+                ("file_link", models.CharField(blank=True, max_length=1024, verbose_name="File Link")),
+                ("filename", models.CharField(blank=True, max_length=1024, verbose_name="File Name")),
+                ("uploaded_by", models.CharField(blank=True, max_length=255, verbose_name="Uploaded by")),
+                ("created", models.CharField(max_length=50, verbose_name="Created")),
+                ("ip_address", models.GenericIPAddressField(default="0.0.0.0")),
+                ("preview_link", models.CharField(blank=True, max_length=1024, verbose_name="Preview Link")),
+                ("is_active", models.BooleanField(default=True)),
+            ],
+            options={
+                "db_table": "unicef_attachments_attachmentflatview",
+                "managed": False,
+            },
+        ),
+    ]
@@ -0,0 +1,132 @@
+from django.conf import settings
+from django.db import migrations
+from django.urls import reverse
+
+# The trigger SQL is frozen here, matching the flat table of this migration.
+# Later migrations changing the flat columns replace the function,
+# `flat_sql.install_flat_triggers` builds it from the current models.
+
+FUNCTION = "unicef_attachments_flat_sync"
+TRIGGERS = {
+    "unicef_attachments_flat_insert": "INSERT",
+    "unicef_attachments_flat_update": "UPDATE",
+}
+
+FILENAME = (
+    "CASE WHEN a.file IS NOT NULL AND a.file <> '' "
+    "THEN regexp_replace(a.file, '^.*/', '') "
+    "ELSE regexp_replace(split_part(split_part(regexp_replace("
+    "a.hyperlink, '^[a-zA-Z][a-zA-Z0-9+.-]*://[^/]*', ''), '?', 1), '#', 1), '^.*/', '') END"
+)
+
+COLUMNS = [
+    ("file_type", "COALESCE(ft.label, '')"),
+    (
+        "file_link",
+        "CASE WHEN n.filename <> '' THEN '{file_prefix}' || a.id || '/' || n.filename "
+        "WHEN a.hyperlink <> '' THEN '{file_prefix}' || a.id || '/' ELSE '' END",
+    ),
+    ("filename", "n.filename"),
+    ("uploaded_by", "COALESCE(btrim(concat(u.first_name, ' ', u.last_name)), '')"),
+    ("ip_address", "a.ip_address"),
+    ("created", "to_char(a.created AT TIME ZONE 'UTC', 'DD Mon YYYY')"),
+    ("preview_link", "CASE WHEN a.preview IS NOT NULL AND a.preview <> '' THEN '{preview_prefix}' || a.id || '/' ELSE '' END"),
+    ("is_active", "a.is_active"),
+]
+
+FUNCTION_SQL = """
+CREATE OR REPLACE FUNCTION {function}() RETURNS trigger AS $$
+BEGIN
+    UPDATE unicef_attachments_attachmentflat f SET {assignments}
+    FROM ({select}) v
+    WHERE f.attachment_id = v.attachment_id;
+
+    INSERT INTO unicef_attachments_attachmentflat (attachment_id, object_link, {names})
+    SELECT v.attachment_id, '', {values} FROM ({select}) v
+    WHERE NOT EXISTS (SELECT 1 FROM unicef_attachments_attachmentflat f WHERE f.attachment_id = v.attachment_id);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql"""
+
+SELECT_SQL = (
+    "SELECT a.id AS attachment_id, {columns} "
+    "FROM changed c JOIN unicef_attachments_attachment a ON a.id = c.id "
+    "CROSS JOIN LATERAL (SELECT {filename} AS filename) n "
+    "LEFT OUTER JOIN unicef_attachments_filetype ft ON ft.id = a.file_type_id "
+    "LEFT OUTER JOIN {user_table} u ON u.{user_pk} = a.uploaded_by_id"
+)
+
+
+def uses_bundled_flat_model():
+    """Triggers are only maintained by migrations for the bundled flat model"""
+    return getattr(settings, "ATTACHMENT_FLAT_MODEL", None) in (None, "unicef_attachments.models.AttachmentFlat")
+
+
+def triggers_installed(schema_editor):
+    if not uses_bundled_flat_model():
+        return False
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_trigger WHERE tgname = ANY(%s)", [list(TRIGGERS)])
+        return cursor.fetchone() is not None
+
+
+def replace_function(apps, schema_editor, columns):
+    """Replace the function of installed triggers, for changed flat columns"""
+    if triggers_installed(schema_editor):
+        schema_editor.execute(get_function_sql(apps, schema_editor, columns))
+
+
+def get_url_prefix(name):
+    # urls end with "<pk>/", strip the sample pk
+    return reverse(name, args=[0])[: -len("0/")]
+
+
+def get_function_sql(apps, schema_editor, columns):
+    user_model = apps.get_model(settings.AUTH_USER_MODEL)
+    prefixes = {
+        "file_prefix": get_url_prefix("attachments:file"),
+        "preview_prefix": get_url_prefix("attachments:preview"),
+    }
+    columns = [(name, sql.format(**prefixes)) for name, sql in columns]
+    select = SELECT_SQL.format(
+        columns=", ".join("{} AS {}".format(sql, name) for name, sql in columns),
+        filename=FILENAME,
+        user_table=schema_editor.quote_name(user_model._meta.db_table),
+        user_pk=schema_editor.quote_name(user_model._meta.pk.column),
+    )
+    return FUNCTION_SQL.format(
+        function=FUNCTION,
+        assignments=", ".join("{0} = v.{0}".format(name) for name, __ in columns),
+        select=select,
+        names=", ".join(name for name, __ in columns),
+        values=", ".join("v.{}".format(name) for name, __ in columns),
+    )
+
+
+def install_triggers(apps, schema_editor):
+    if not getattr(settings, "ATTACHMENT_FLAT_TRIGGERS", False) or not uses_bundled_flat_model():
+        return
+    schema_editor.execute(get_function_sql(apps, schema_editor, COLUMNS))
+    for name, event in TRIGGERS.items():
+        schema_editor.execute("DROP TRIGGER IF EXISTS {} ON unicef_attachments_attachment".format(name))
+        schema_editor.execute(
+            "CREATE TRIGGER {} AFTER {} ON unicef_attachments_attachment REFERENCING NEW TABLE AS changed "
+            "FOR EACH STATEMENT EXECUTE FUNCTION {}()".format(name, event, FUNCTION)
+        )
+
+
+def uninstall_triggers(apps, schema_editor):
+    for name in TRIGGERS:
+        schema_editor.execute("DROP TRIGGER IF EXISTS {} ON unicef_attachments_attachment".format(name))
+    schema_editor.execute("DROP FUNCTION IF EXISTS {}()".format(FUNCTION))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("unicef_attachments", "0012_attachmentflatview"),
+    ]
+
+    operations = [
+        migrations.RunPython(install_triggers, reverse_code=uninstall_triggers),
+    ]
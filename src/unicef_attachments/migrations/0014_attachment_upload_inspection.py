@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("unicef_attachments", "0013_attachment_flat_triggers"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="attachment",
+            name="checksum",
+            field=models.CharField(blank=True, default="", max_length=64, verbose_name="SHA-256 Checksum"),
+        ),
+        migrations.AddField(
+            model_name="attachment",
+            name="file_size",
+            field=models.PositiveBigIntegerField(blank=True, null=True, verbose_name="File Size"),
+        ),
+        migrations.AddField(
+            model_name="attachment",
+            name="mime_type",
+            field=models.CharField(blank=True, default="", max_length=255, verbose_name="MIME Type"),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:08
+
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("unicef_attachments", "0014_attachment_upload_inspection"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="filetype",
+            index=django.contrib.postgres.indexes.GinIndex(fields=["group"], name="filetype_group_gin"),
+        ),
+    ]
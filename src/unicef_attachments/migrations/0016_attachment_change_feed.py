@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:09
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("unicef_attachments", "0015_filetype_group_gin"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AttachmentTombstone",
+            fields=[
+                ("id", models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("attachment_id", models.IntegerField(verbose_name="Attachment ID")),
+                ("modified", models.DateTimeField(default=django.utils.timezone.now, verbose_name="Deleted")),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="attachment",
+            index=models.Index(fields=["modified", "id"], name="attachment_modified_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="attachmenttombstone",
+            index=models.Index(fields=["modified", "attachment_id"], name="attachmenttombstone_feed_idx"),
+        ),
+    ]
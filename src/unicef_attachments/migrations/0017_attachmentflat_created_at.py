@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:15
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+triggers = import_module("unicef_attachments.migrations.0013_attachment_flat_triggers")
+
+COLUMNS = triggers.COLUMNS + [("created_at", "a.created")]
+
+
+def update_triggers(apps, schema_editor):
+    triggers.replace_function(apps, schema_editor, COLUMNS)
+
+
+def revert_triggers(apps, schema_editor):
+    triggers.replace_function(apps, schema_editor, triggers.COLUMNS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("unicef_attachments", "0016_attachment_change_feed"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="attachmentflat",
+            name="created_at",
+            field=models.DateTimeField(blank=True, null=True, verbose_name="Created At"),
+        ),
+        migrations.RunPython(update_triggers, reverse_code=revert_triggers),
+    ]
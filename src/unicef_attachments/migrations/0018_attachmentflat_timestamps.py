@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:17
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+triggers = import_module("unicef_attachments.migrations.0013_attachment_flat_triggers")
+previous = import_module("unicef_attachments.migrations.0017_attachmentflat_created_at")
+
+COLUMNS = previous.COLUMNS + [("modified_at", "a.modified")]
+
+
+def update_triggers(apps, schema_editor):
+    triggers.replace_function(apps, schema_editor, COLUMNS)
+
+
+def revert_triggers(apps, schema_editor):
+    triggers.replace_function(apps, schema_editor, previous.COLUMNS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("unicef_attachments", "0017_attachmentflat_created_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="attachmentflat",
+            name="modified_at",
+            field=models.DateTimeField(blank=True, null=True, verbose_name="Modified At"),
+        ),
+        migrations.AddIndex(
+            model_name="attachmentflat",
+            index=models.Index(
+                condition=models.Q(("is_active", True)), fields=["created_at"], name="attachmentflat_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="attachmentflat",
+            index=models.Index(
+                condition=models.Q(("is_active", True)), fields=["modified_at"], name="attachmentflat_modified_idx"
+            ),
+        ),
+        migrations.RunPython(update_triggers, reverse_code=revert_triggers),
+    ]
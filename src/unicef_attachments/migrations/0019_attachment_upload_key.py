@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("unicef_attachments", "0018_attachmentflat_timestamps"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="attachment",
+            name="upload_key",
+            field=models.CharField(blank=True, default="", max_length=64, verbose_name="Upload Key"),
+        ),
+        migrations.AddConstraint(
+            model_name="attachment",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("upload_key", ""), _negated=True),
+                fields=("upload_key",),
+                name="attachment_upload_key_uniq",
+            ),
+        ),
+    ]
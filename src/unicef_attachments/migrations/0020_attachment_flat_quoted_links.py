@@ -0,0 +1,40 @@
+from importlib import import_module
+
+from django.db import migrations
+
+triggers = import_module("unicef_attachments.migrations.0013_attachment_flat_triggers")
+previous = import_module("unicef_attachments.migrations.0018_attachmentflat_timestamps")
+
+# percent encode the filename as reverse() quotes url arguments
+QUOTED_FILENAME = (
+    "(SELECT string_agg(CASE WHEN q.c ~ '[A-Za-z0-9_.~!$&''()*+,;=:@/-]' THEN q.c "
+    "ELSE regexp_replace(upper(encode(convert_to(q.c, getdatabaseencoding()), 'hex')), "
+    "'(..)', chr(37) || '\\1', 'g') END, '' ORDER BY q.i) "
+    "FROM regexp_split_to_table(n.filename, '') WITH ORDINALITY AS q(c, i))"
+)
+
+FILE_LINK = (
+    "CASE WHEN n.filename <> '' THEN '{file_prefix}' || a.id || '/' || " + QUOTED_FILENAME + " "
+    "WHEN a.hyperlink <> '' THEN '{file_prefix}' || a.id || '/' ELSE '' END"
+)
+
+COLUMNS = [(name, FILE_LINK if name == "file_link" else sql) for name, sql in previous.COLUMNS]
+
+
+def update_triggers(apps, schema_editor):
+    triggers.replace_function(apps, schema_editor, COLUMNS)
+
+
+def revert_triggers(apps, schema_editor):
+    triggers.replace_function(apps, schema_editor, previous.COLUMNS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("unicef_attachments", "0019_attachment_upload_key"),
+    ]
+
+    operations = [
+        migrations.RunPython(update_triggers, reverse_code=revert_triggers),
+    ]
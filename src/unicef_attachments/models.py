@@ -1,22 +1,38 @@
+import hashlib
 import os
+from functools import partial
 from urllib.parse import urlsplit
 
 from django.conf import settings
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Func
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.text import slugify
 from django.utils.translation import gettext as _
 from model_utils.models import TimeStampedModel
 from ordered_model.models import OrderedModel, OrderedModelManager, OrderedModelQuerySet
 
-from unicef_attachments.utils import filepath_prefix, get_denormalize_func
+from unicef_attachments import previews
+from unicef_attachments.utils import (
+    filepath_prefix,
+    flat_model_has_field,
+    flat_model_is_managed,
+    get_attachment_flat_model,
+    get_denormalize_func,
+    get_filepath_strategy_func,
+)
 
+# describe the stored file, set by the inspecting upload views
+INSPECTED_FIELDS = ("checksum", "file_size", "mime_type")
 
-def generate_file_path(attachment, filename):
+
+def get_file_path_parts(attachment):
     if attachment.content_type:
         app = attachment.content_type.app_label
         model_name = attachment.content_type.model
@@ -25,7 +41,7 @@ def generate_file_path(attachment, filename):
         model_name = "tmp"
     obj_pk = attachment.object_id
 
-    file_path = [
+    return [
         filepath_prefix,
         "files",
         app,
@@ -34,18 +50,60 @@ def generate_file_path(attachment, filename):
         obj_pk,
     ]
 
-    file_path.append(os.path.split(filename)[-1])
+
+def join_file_path(file_path):
     # strip all '/'
     file_path = [str(x).strip("/") for x in file_path if x]
     return "/".join(file_path)
 
 
+def default_file_path(attachment, filename):
+    file_path = get_file_path_parts(attachment)
+    file_path.append(os.path.split(filename)[-1])
+    return join_file_path(file_path)
+
+
+def sharded_file_path(attachment, filename):
+    """Fan files out over hash prefixed directories
+
+    files/<app>/<model>/<code>/<pk>/<ab>/<cd>/<filename>
+    The prefix is derived from the filename, so the path is stable
+    for a given attachment and filename.
+    """
+    filename = os.path.split(filename)[-1]
+    digest = hashlib.sha1(filename.encode("utf-8")).hexdigest()
+    depth = getattr(settings, "ATTACHMENT_FILEPATH_SHARD_DEPTH", 2)
+    file_path = get_file_path_parts(attachment)
+    file_path += [digest[pos] + digest[pos + 1] for pos in range(0, depth * 2, 2)]
+    file_path.append(filename)
+    return join_file_path(file_path)
+
+
+def generate_file_path(attachment, filename):
+    return get_filepath_strategy_func()(attachment, filename)
+
+
 class FileTypeQueryset(OrderedModelQuerySet):
     def group_by(self, group):
         if not isinstance(group, list):
             group = [group]
         return self.filter(group__contains=group)
 
+    def group_any(self, groups):
+        """File types in at least one of the groups"""
+        if not isinstance(groups, list):
+            groups = [groups]
+        return self.filter(group__overlap=groups)
+
+    def groups(self):
+        """Distinct group names in alphabetical order"""
+        return (
+            self.annotate(group_name=Func(F("group"), function="unnest"))
+            .order_by("group_name")
+            .values_list("group_name", flat=True)
+            .distinct()
+        )
+
 
 class FileTypeManager(OrderedModelManager):
     def get_queryset(self):
@@ -54,6 +112,12 @@ class FileTypeManager(OrderedModelManager):
     def group_by(self, group):
         return self.get_queryset().group_by(group)
 
+    def group_any(self, groups):
+        return self.get_queryset().group_any(groups)
+
+    def groups(self):
+        return self.get_queryset().groups()
+
 
 class FileType(OrderedModel, models.Model):
     name = models.CharField(max_length=64, verbose_name=_("Name"))
@@ -72,6 +136,42 @@ class FileType(OrderedModel, models.Model):
             "code",
         )
         ordering = ("code", "order")
+        indexes = [
+            GinIndex(fields=["group"], name="filetype_group_gin"),
+        ]
+
+
+class AttachmentQuerySet(models.QuerySet):
+    def active(self):
+        return self.filter(is_active=True)
+
+    def _set_active(self, is_active):
+        """Flag attachments and their flat rows with two UPDATE statements"""
+        with transaction.atomic(using=self.db):
+            if flat_model_is_managed() and flat_model_has_field("is_active"):
+                get_attachment_flat_model().objects.filter(attachment__in=self.values("pk")).update(is_active=is_active)
+            return self.update(is_active=is_active, modified=timezone.now())
+
+    def activate(self):
+        return self._set_active(True)
+
+    def deactivate(self):
+        return self._set_active(False)
+
+
+class ActiveAttachmentQuerySet(AttachmentQuerySet):
+    def activate(self):
+        # inactive attachments are filtered out, so nothing would be updated
+        raise TypeError("Inactive attachments are not visible here, use Attachment.all_objects to activate them.")
+
+
+class AttachmentManager(models.Manager.from_queryset(AttachmentQuerySet)):
+    pass
+
+
+class ActiveAttachmentManager(models.Manager.from_queryset(ActiveAttachmentQuerySet)):
+    def get_queryset(self):
+        return super().get_queryset().filter(is_active=True)
 
 
 class Attachment(TimeStampedModel):
@@ -109,11 +209,49 @@ class Attachment(TimeStampedModel):
     )
     ip_address = models.GenericIPAddressField(default="0.0.0.0")
     is_active = models.BooleanField(default=True)
+    preview = models.FileField(
+        blank=True,
+        null=True,
+        verbose_name=_("Preview"),
+        max_length=1024,
+    )
+    checksum = models.CharField(max_length=64, blank=True, default="", verbose_name=_("SHA-256 Checksum"))
+    file_size = models.PositiveBigIntegerField(blank=True, null=True, verbose_name=_("File Size"))
+    mime_type = models.CharField(max_length=255, blank=True, default="", verbose_name=_("MIME Type"))
+    # set when created from a two phase upload, see `uploads.get_upload_key`
+    upload_key = models.CharField(max_length=64, blank=True, default="", verbose_name=_("Upload Key"))
+
+    objects = ActiveAttachmentManager()
+    all_objects = AttachmentManager()
 
     class Meta:
         ordering = [
             "id",
         ]
+        base_manager_name = "all_objects"
+        indexes = [
+            models.Index(
+                fields=["created"],
+                condition=models.Q(content_type__isnull=True, object_id__isnull=True),
+                name="attachment_unlinked_idx",
+            ),
+            models.Index(
+                fields=["modified", "id"],
+                name="attachment_modified_idx",
+            ),
+            models.Index(
+                fields=["content_type", "object_id"],
+                condition=models.Q(is_active=True),
+                name="attachment_active_object_idx",
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["upload_key"],
+                condition=~models.Q(upload_key=""),
+                name="attachment_upload_key_uniq",
+            ),
+        ]
 
     def __str__(self):
         return str(self.file)
@@ -144,14 +282,52 @@ class Attachment(TimeStampedModel):
 
         return reverse("attachments:file_full", args=[self.pk, self.filename])
 
+    @property
+    def preview_link(self):
+        if not self.preview:
+            return ""
+        return reverse("attachments:preview", args=[self.pk])
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if not instance.get_deferred_fields().intersection(("file",) + INSPECTED_FIELDS):
+            instance._file_state = instance.get_file_state()
+        return instance
+
+    def get_file_state(self):
+        return (self.file.name,) + tuple(getattr(self, name) for name in INSPECTED_FIELDS)
+
+    def reset_inspected_fields(self, update_fields=None):
+        """Clear checksum, size and mime type left over from a replaced file
+
+        Values set along with the new file, as the inspecting upload
+        views do, are kept.
+        """
+        state = getattr(self, "_file_state", None)
+        if state is None or state[0] == self.file.name or state[1:] != self.get_file_state()[1:]:
+            return update_fields
+        for name in INSPECTED_FIELDS:
+            setattr(self, name, self._meta.get_field(name).get_default())
+        if update_fields is not None and "file" in update_fields:
+            update_fields = set(update_fields).union(INSPECTED_FIELDS)
+        return update_fields
+
     def save(self, *args, **kwargs):
+        update_fields = self.reset_inspected_fields(kwargs.get("update_fields"))
+        if update_fields is not None:
+            kwargs["update_fields"] = update_fields
         super().save(*args, **kwargs)
+        self._file_state = self.get_file_state()
 
         # check if we want to denormalize attachment data
         denormalize_func = get_denormalize_func()
         if denormalize_func is not None:
             denormalize_func(self)
 
+        if previews.previews_enabled() and previews.needs_preview(self):
+            transaction.on_commit(partial(previews.queue_preview, self.pk))
+
 
 class AttachmentLink(models.Model):
     attachment = models.ForeignKey(
@@ -173,6 +349,21 @@ class AttachmentLink(models.Model):
         return "{} link".format(self.attachment)
 
 
+class AttachmentTombstone(models.Model):
+    """Record of a deleted attachment for the change feed"""
+
+    attachment_id = models.IntegerField(verbose_name=_("Attachment ID"))
+    modified = models.DateTimeField(default=timezone.now, verbose_name=_("Deleted"))
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["modified", "attachment_id"], name="attachmenttombstone_feed_idx"),
+        ]
+
+    def __str__(self):
+        return str(self.attachment_id)
+
+
 class AttachmentFlat(models.Model):
     attachment = models.ForeignKey(
         Attachment,
@@ -185,6 +376,64 @@ class AttachmentFlat(models.Model):
     uploaded_by = models.CharField(max_length=255, blank=True, verbose_name=_("Uploaded by"))
     created = models.CharField(max_length=50, verbose_name=_("Created"))
     ip_address = models.GenericIPAddressField(default="0.0.0.0")
+    preview_link = models.CharField(max_length=1024, blank=True, verbose_name=_("Preview Link"))
+    is_active = models.BooleanField(default=True)
+    # partition key when partitioned, see `flat_sql.convert_flat_to_partitioned`
+    created_at = models.DateTimeField(null=True, blank=True, verbose_name=_("Created At"))
+    modified_at = models.DateTimeField(null=True, blank=True, verbose_name=_("Modified At"))
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["created_at"],
+                condition=models.Q(is_active=True),
+                name="attachmentflat_created_idx",
+            ),
+            models.Index(
+                fields=["modified_at"],
+                condition=models.Q(is_active=True),
+                name="attachmentflat_modified_idx",
+            ),
+            models.Index(
+                fields=["attachment"],
+                condition=models.Q(is_active=True),
+                name="attachmentflat_active_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return str(self.attachment)
+
+
+class AttachmentFlatView(models.Model):
+    """Flat attachment data provided by a materialized view
+
+    Set ATTACHMENT_FLAT_MODEL to this model to read flat data from
+    the view instead of maintaining AttachmentFlat on save.
+    The view is created and refreshed with the attachment_flat_view command.
+    Object link is not available, as it requires the content object.
+    """
+
+    attachment = models.ForeignKey(
+        Attachment,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+    )
+    object_link = models.URLField(blank=True, verbose_name=_("Object Link"))
+    file_type = models.CharField(max_length=100, blank=True, verbose_name=_("File Type"))
+    file_link = models.CharField(max_length=1024, blank=True, verbose_name=_("File Link"))
+    filename = models.CharField(max_length=1024, blank=True, verbose_name=_("File Name"))
+    uploaded_by = models.CharField(max_length=255, blank=True, verbose_name=_("Uploaded by"))
+    created = models.CharField(max_length=50, verbose_name=_("Created"))
+    ip_address = models.GenericIPAddressField(default="0.0.0.0")
+    preview_link = models.CharField(max_length=1024, blank=True, verbose_name=_("Preview Link"))
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(null=True, blank=True, verbose_name=_("Created At"))
+    modified_at = models.DateTimeField(null=True, blank=True, verbose_name=_("Modified At"))
+
+    class Meta:
+        managed = False
+        db_table = "unicef_attachments_attachmentflatview"
 
     def __str__(self):
         return str(self.attachment)
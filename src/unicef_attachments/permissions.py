@@ -1,5 +1,24 @@
 from rest_framework.permissions import IsAuthenticated
 
 
+def get_attachment_lookup(queryset, lookup):
+    """Lookup of an attachment field relative to the queryset model
+
+    Querysets of flat rows and links reach the attachment
+    through their `attachment` foreign key
+    """
+    if queryset.model._meta.model_name == "attachment":
+        return lookup
+    return "attachment__{}".format(lookup)
+
+
 class AttachmentPermissions(IsAuthenticated):
     """Default attachment permissions"""
+
+    def filter_queryset(self, request, queryset):
+        """Restrict the queryset to the rows the request can access
+
+        Called by the listing, link and file views with querysets
+        of attachments, flat rows or links, see `get_attachment_lookup`
+        """
+        return queryset
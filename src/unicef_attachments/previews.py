@@ -0,0 +1,109 @@
+import io
+import logging
+import mimetypes
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections
+from django.utils import timezone
+
+from unicef_attachments.utils import get_denormalize_func
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PREVIEW_CONTENT_TYPES = [
+    "image/bmp",
+    "image/gif",
+    "image/jpeg",
+    "image/png",
+    "image/tiff",
+    "image/webp",
+]
+
+_executor = None
+
+
+def previews_enabled():
+    return Image is not None and getattr(settings, "ATTACHMENT_PREVIEW_ENABLED", False)
+
+
+def get_preview_name(name):
+    """Preview is stored beside the file it was generated from"""
+    return "{}.preview.png".format(os.path.splitext(name)[0])
+
+
+def is_previewable(attachment):
+    if not attachment.file:
+        return False
+    content_type, _ = mimetypes.guess_type(attachment.file.name)
+    return content_type in getattr(settings, "ATTACHMENT_PREVIEW_CONTENT_TYPES", DEFAULT_PREVIEW_CONTENT_TYPES)
+
+
+def needs_preview(attachment):
+    return is_previewable(attachment) and attachment.preview.name != get_preview_name(attachment.file.name)
+
+
+def generate_preview(attachment):
+    """Generate and store a thumbnail of the attachment image
+
+    Flat data is refreshed afterwards, without saving the attachment
+    to avoid queueing the preview generation again.
+    """
+    from unicef_attachments.models import Attachment
+
+    size = getattr(settings, "ATTACHMENT_PREVIEW_SIZE", (256, 256))
+    with attachment.file.open("rb") as source:
+        image = Image.open(source)
+        image.thumbnail(size)
+        content = io.BytesIO()
+        image.save(content, format="PNG")
+
+    name = get_preview_name(attachment.file.name)
+    storage = attachment.preview.storage
+    if storage.exists(name):
+        storage.delete(name)
+    attachment.preview.name = storage.save(name, ContentFile(content.getvalue()))
+    Attachment.all_objects.filter(pk=attachment.pk).update(
+        preview=attachment.preview.name,
+        modified=timezone.now(),
+    )
+
+    denormalize_func = get_denormalize_func()
+    if denormalize_func is not None:
+        denormalize_func(attachment)
+    return attachment.preview
+
+
+def generate_preview_for_pk(pk):
+    from unicef_attachments.models import Attachment
+
+    close_old_connections()
+    try:
+        attachment = Attachment.all_objects.select_related("file_type", "uploaded_by").get(pk=pk)
+        if needs_preview(attachment):
+            generate_preview(attachment)
+    except Exception:
+        logger.exception("Unable to generate preview for attachment %s", pk)
+    finally:
+        close_old_connections()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, "ATTACHMENT_PREVIEW_WORKERS", 2),
+            thread_name_prefix="attachment-preview",
+        )
+    return _executor
+
+
+def queue_preview(pk):
+    return get_executor().submit(generate_preview_for_pk, pk)
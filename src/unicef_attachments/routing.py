@@ -0,0 +1,34 @@
+from django.conf import settings
+
+PRIMARY_COOKIE_NAME = "attachments_primary"
+
+
+def get_read_your_writes_age():
+    """Seconds a user reads from the primary database after a write"""
+    return getattr(settings, "ATTACHMENT_READ_YOUR_WRITES_AGE", 10)
+
+
+def get_read_database(request):
+    """Database alias for the read queries of the request
+
+    None, meaning the default routing, unless ATTACHMENT_READ_DATABASE
+    is set and the user has not written recently.
+    """
+    alias = getattr(settings, "ATTACHMENT_READ_DATABASE", None)
+    if not alias or request.method not in ("GET", "HEAD", "OPTIONS"):
+        return None
+    if request.COOKIES.get(PRIMARY_COOKIE_NAME):
+        return None
+    return alias
+
+
+def using_read_database(request, queryset):
+    alias = get_read_database(request)
+    return queryset.using(alias) if alias else queryset
+
+
+def pin_primary(response):
+    """Keep the user reading from the primary until replicas catch up"""
+    if getattr(settings, "ATTACHMENT_READ_DATABASE", None):
+        response.set_cookie(PRIMARY_COOKIE_NAME, "1", max_age=get_read_your_writes_age(), httponly=True, samesite="Lax")
+    return response
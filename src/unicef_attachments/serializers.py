@@ -1,6 +1,8 @@
 import types
 
 from django.contrib.auth import get_user_model
+from django.core import signing
+from django.core.exceptions import FieldDoesNotExist, ValidationError as DjangoValidationError
 from django.utils.translation import gettext as _
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
@@ -15,6 +17,7 @@ from unicef_attachments.fields import (
     PermittedAttachmentField,
 )
 from unicef_attachments.models import Attachment, AttachmentLink, FileType
+from unicef_attachments.uploads import get_upload_key, read_upload_token
 from unicef_attachments.utils import get_attachment_flat_model
 from unicef_attachments.validators import SafeFileValidator
 
@@ -47,6 +50,7 @@ class BaseAttachmentSerializer(UserContextSerializerMixin, serializers.ModelSeri
     #  so it's not possible to extract direct url to bypass permissions
     file = PermittedAttachmentField(read_field=AbsoluteUrlField())
     hyperlink = PermittedAttachmentField(read_field=AbsoluteUrlField())
+    preview_link = AbsoluteUrlField(label=_("Preview"))
 
     def _validate_attachment(self, validated_data, instance=None):
         file_attachment = validated_data.get("file", None) or (instance.file if instance else None)
@@ -75,6 +79,7 @@ class BaseAttachmentSerializer(UserContextSerializerMixin, serializers.ModelSeri
             "uploaded_by",
             "ip_address",
             "filename",
+            "preview_link",
         ]
         extra_kwargs = {
             "created": {
@@ -113,6 +118,89 @@ class AttachmentFlatSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
+class ValuesSerializer:
+    """Read only serialization of `.values()` rows
+
+    Field accessors are compiled once from a model serializer,
+    each row is then mapped to the same output the serializer would give,
+    without creating model instances or binding fields per row.
+    Fields sourced from a relation that is null are omitted,
+    as the serializer does for read only fields.
+    Only plain value and primary key fields, sourced from
+    model fields, are supported.
+    """
+
+    supported_fields = (
+        serializers.BooleanField,
+        serializers.CharField,
+        serializers.DateField,
+        serializers.DateTimeField,
+        serializers.DecimalField,
+        serializers.FloatField,
+        serializers.IntegerField,
+        serializers.PrimaryKeyRelatedField,
+    )
+
+    def __init__(self, serializer_class):
+        self.accessors = []
+        self.supported = True
+        model = serializer_class.Meta.model
+        for name, field in serializer_class().fields.items():
+            if field.write_only:
+                continue
+            if not isinstance(field, self.supported_fields) or not self.is_model_field(model, field.source_attrs):
+                self.supported = False
+                continue
+            if isinstance(field, serializers.PrimaryKeyRelatedField):
+                to_representation = None
+            else:
+                to_representation = field.to_representation
+            self.accessors.append((name, "__".join(field.source_attrs), to_representation, len(field.source_attrs) > 1))
+
+    @staticmethod
+    def is_model_field(model, source_attrs):
+        if not source_attrs:
+            return False
+        for attr in source_attrs:
+            if model is None:
+                return False
+            if attr == "pk":
+                attr = model._meta.pk.name
+            try:
+                field = model._meta.get_field(attr)
+            except FieldDoesNotExist:
+                # attname of foreign keys, e.g. attachment_id
+                field = next((f for f in model._meta.concrete_fields if f.attname == attr), None)
+                if field is None:
+                    return False
+                model = None
+                continue
+            model = field.related_model
+        return True
+
+    @property
+    def lookups(self):
+        return list(dict.fromkeys(lookup for _, lookup, _, _ in self.accessors))
+
+    def serialize(self, queryset):
+        data = []
+        accessors = self.accessors
+        for row in queryset.values(*self.lookups):
+            item = {}
+            for name, lookup, to_representation, nested in accessors:
+                value = row[lookup]
+                if value is None:
+                    if nested:
+                        continue
+                    item[name] = None
+                elif to_representation is None:
+                    item[name] = value
+                else:
+                    item[name] = to_representation(value)
+            data.append(item)
+        return data
+
+
 class AttachmentLinkSerializer(serializers.ModelSerializer):
     filename = serializers.CharField(
         source="attachment.filename",
@@ -121,6 +209,7 @@ class AttachmentLinkSerializer(serializers.ModelSerializer):
     url = serializers.CharField(source="attachment.url", read_only=True)
     file_type = serializers.CharField(source="attachment.file_type.label", read_only=True)
     created = serializers.DateTimeField(source="attachment.created", format="%d %b %Y", read_only=True)
+    preview_link = serializers.CharField(source="attachment.preview_link", read_only=True)
 
     class Meta:
         model = AttachmentLink
@@ -131,6 +220,7 @@ class AttachmentLinkSerializer(serializers.ModelSerializer):
             "url",
             "file_type",
             "created",
+            "preview_link",
         )
 
 
@@ -144,6 +234,47 @@ class AttachmentFileUploadSerializer(serializers.ModelSerializer):
         fields = ["file", "uploaded_by", "ip_address"]
 
 
+class AttachmentReassignSerializer(serializers.Serializer):
+    target = serializers.IntegerField()
+    code = serializers.CharField(max_length=64, required=False)
+    relocate = serializers.BooleanField(default=False)
+
+
+class AttachmentUploadTokenSerializer(serializers.Serializer):
+    filename = serializers.CharField(max_length=255)
+
+
+class AttachmentUploadFinalizeSerializer(serializers.Serializer):
+    token = serializers.CharField()
+
+    def validate_token(self, value):
+        try:
+            payload = read_upload_token(value)
+        except signing.SignatureExpired:
+            raise ValidationError(_("Upload token has expired."))
+        except signing.BadSignature:
+            raise ValidationError(_("Invalid upload token."))
+
+        if payload["user"] != self.context["request"].user.pk:
+            raise ValidationError(_("Invalid upload token."))
+
+        path = payload["path"]
+        storage = Attachment.file.field.storage
+        if not storage.exists(path):
+            raise ValidationError(_("File has not been uploaded."))
+        if Attachment.all_objects.filter(upload_key=get_upload_key(path)).exists():
+            raise ValidationError(_("Upload has already been finalized."))
+
+        with storage.open(path, "rb") as data_file:
+            buffer = data_file.read(SafeFileValidator().mime_lookup_length)
+        try:
+            SafeFileValidator().validate_buffer(buffer)
+        except DjangoValidationError as e:
+            storage.delete(path)
+            raise ValidationError(e.messages)
+        return path
+
+
 def validate_attachment(cls, data):
     """We expect the attachment pk to be part of the data provided
 
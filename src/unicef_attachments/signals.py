@@ -0,0 +1,47 @@
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from unicef_attachments import flat_sql
+from unicef_attachments.models import Attachment, AttachmentTombstone, FileType
+
+
+@receiver(post_delete, sender=Attachment)
+def record_tombstone(sender, instance, using, **kwargs):
+    AttachmentTombstone.objects.using(using).create(attachment_id=instance.pk)
+
+
+@receiver(pre_save, sender=FileType)
+def check_file_type_label(sender, instance, raw, using, update_fields, **kwargs):
+    instance._flat_label_changed = False
+    if raw or instance.pk is None or (update_fields is not None and "label" not in update_fields):
+        return
+    previous = sender.objects.using(using).filter(pk=instance.pk).values_list("label", flat=True).first()
+    instance._flat_label_changed = previous is not None and previous != instance.label
+
+
+@receiver(post_save, sender=FileType)
+def propagate_file_type_label(sender, instance, using, **kwargs):
+    if getattr(instance, "_flat_label_changed", False):
+        transaction.on_commit(partial(flat_sql.update_flat_file_type, instance.pk), using=using)
+
+
+@receiver(pre_save, sender=settings.AUTH_USER_MODEL)
+def check_user_name(sender, instance, raw, using, update_fields, **kwargs):
+    instance._flat_name_changed = False
+    if raw or instance.pk is None:
+        return
+    # skip the frequent saves not touching the name, e.g. last_login
+    if update_fields is not None and flat_sql.user_name_in_sql() and not flat_sql.USER_NAME_FIELDS & set(update_fields):
+        return
+    previous = sender._default_manager.using(using).filter(pk=instance.pk).first()
+    instance._flat_name_changed = previous is not None and previous.get_full_name() != instance.get_full_name()
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def propagate_user_name(sender, instance, using, **kwargs):
+    if getattr(instance, "_flat_name_changed", False):
+        transaction.on_commit(partial(flat_sql.update_flat_uploaded_by, instance.pk), using=using)
@@ -0,0 +1,227 @@
+import logging
+import mimetypes
+import os
+import re
+import uuid
+import zipfile
+from urllib.parse import quote
+
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.http import http_date
+
+try:
+    from django.utils.http import content_disposition_header
+except ImportError:  # pragma: no cover, Django < 4.2
+
+    def content_disposition_header(as_attachment, filename):
+        disposition = "attachment" if as_attachment else "inline"
+        if not filename:
+            return disposition if as_attachment else None
+        try:
+            filename.encode("ascii")
+        except UnicodeEncodeError:
+            return "{}; filename*=utf-8''{}".format(disposition, quote(filename))
+        return '{}; filename="{}"'.format(disposition, filename.replace("\\", "\\\\").replace('"', r"\""))
+
+
+logger = logging.getLogger(__name__)
+
+RANGE_CHUNK_SIZE = 64 * 1024
+MAX_RANGES = 16
+RANGE_SPEC_RE = re.compile(r"^\s*(\d*)\s*-\s*(\d*)\s*$")
+
+
+class StreamBuffer:
+    """Write only, non seekable file like object
+
+    Collects the bytes written to it, so they can be handed
+    out as they are produced
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def get_archive_name(attachment, names):
+    """Return a unique name for the attachment within the archive"""
+    name = attachment.filename
+    if name in names:
+        root, ext = os.path.splitext(name)
+        name = "{}_{}{}".format(root, attachment.pk, ext)
+    names.add(name)
+    return name
+
+
+def zip_attachments(attachments):
+    """Generate the bytes of a zip archive holding the attachment files
+
+    Files are read from storage in chunks and written to the archive
+    as they are read, so neither the archive nor a whole file
+    are kept in memory or on disk.
+    Files are stored uncompressed, as most documents are compressed already.
+    """
+    buffer = StreamBuffer()
+    names = set()
+    with zipfile.ZipFile(buffer, mode="w", compression=zipfile.ZIP_STORED) as archive:
+        for attachment in attachments:
+            if not attachment.file:
+                continue
+            info = zipfile.ZipInfo(
+                get_archive_name(attachment, names),
+                date_time=attachment.modified.timetuple()[:6],
+            )
+            try:
+                source = attachment.file.open("rb")
+            except OSError:
+                logger.warning("Unable to read file for attachment %s", attachment.pk)
+                continue
+            with source, archive.open(info, mode="w", force_zip64=True) as target:
+                for chunk in source.chunks():
+                    target.write(chunk)
+                    yield buffer.pop()
+            yield buffer.pop()
+    yield buffer.pop()
+
+
+def parse_range_header(header, size):
+    """Byte ranges of a Range header, as inclusive (start, end) tuples
+
+    Returns None when the header is missing, malformed or asks for
+    too many ranges, the whole file is served then.
+    An empty list means none of the ranges can be satisfied.
+    """
+    if not header:
+        return None
+    unit, __, specs = header.partition("=")
+    if unit.strip().lower() != "bytes" or not specs:
+        return None
+
+    ranges = []
+    for spec in specs.split(","):
+        match = RANGE_SPEC_RE.match(spec)
+        if match is None:
+            return None
+        first, last = match.groups()
+        if not first:
+            # suffix range, the last bytes of the file
+            if not last:
+                return None
+            if int(last) == 0 or size == 0:
+                continue
+            ranges.append((max(size - int(last), 0), size - 1))
+            continue
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        if start >= size:
+            continue
+        ranges.append((start, min(int(last), size - 1) if last else size - 1))
+    if len(ranges) > MAX_RANGES:
+        return None
+    return ranges
+
+
+def read_range(source, start, end):
+    """Generate the bytes from start to end (inclusive) of an open file"""
+    source.seek(start)
+    remaining = end - start + 1
+    while remaining > 0:
+        data = source.read(min(RANGE_CHUNK_SIZE, remaining))
+        if not data:
+            break
+        remaining -= len(data)
+        yield data
+
+
+def stream_ranges(field_file, parts, closing=b""):
+    """Generate the file bytes of each (header, start, end) part
+
+    Only the requested ranges are read from storage
+    """
+    source = field_file.storage.open(field_file.name, "rb")
+    try:
+        for header, start, end in parts:
+            if header:
+                yield header
+            yield from read_range(source, start, end)
+        if closing:
+            yield closing
+    finally:
+        source.close()
+
+
+def get_etag(attachment):
+    return '"{}"'.format(attachment.checksum or "{}-{}".format(attachment.pk, int(attachment.modified.timestamp())))
+
+
+def range_file_response(request, attachment):
+    """Serve the attachment file, honouring Range and If-Range headers
+
+    A single range is served as 206 Partial Content, several
+    as a multipart/byteranges body.
+    """
+    field_file = attachment.file
+    size = field_file.size
+    content_type = attachment.mime_type or mimetypes.guess_type(attachment.filename)[0] or "application/octet-stream"
+    etag = get_etag(attachment)
+    last_modified = http_date(attachment.modified.timestamp())
+
+    ranges = None
+    if_range = request.headers.get("If-Range")
+    if if_range is None or if_range in (etag, last_modified):
+        ranges = parse_range_header(request.headers.get("Range"), size)
+
+    if ranges == []:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = "bytes */{}".format(size)
+        return response
+
+    if ranges is None:
+        response = StreamingHttpResponse(stream_ranges(field_file, [(b"", 0, size - 1)]), content_type=content_type)
+        response["Content-Length"] = size
+    elif len(ranges) == 1:
+        start, end = ranges[0]
+        response = StreamingHttpResponse(
+            stream_ranges(field_file, [(b"", start, end)]),
+            status=206,
+            content_type=content_type,
+        )
+        response["Content-Range"] = "bytes {}-{}/{}".format(start, end, size)
+        response["Content-Length"] = end - start + 1
+    else:
+        boundary = uuid.uuid4().hex
+        parts = [
+            (
+                "\r\n--{}\r\nContent-Type: {}\r\nContent-Range: bytes {}-{}/{}\r\n\r\n".format(
+                    boundary, content_type, start, end, size
+                ).encode("ascii"),
+                start,
+                end,
+            )
+            for start, end in ranges
+        ]
+        closing = "\r\n--{}--\r\n".format(boundary).encode("ascii")
+        response = StreamingHttpResponse(
+            stream_ranges(field_file, parts, closing),
+            status=206,
+            content_type="multipart/byteranges; boundary={}".format(boundary),
+        )
+        response["Content-Length"] = sum(len(header) + end - start + 1 for header, start, end in parts) + len(closing)
+
+    response["Accept-Ranges"] = "bytes"
+    response["ETag"] = etag
+    response["Last-Modified"] = last_modified
+    response["Content-Disposition"] = content_disposition_header(False, attachment.filename)
+    return response
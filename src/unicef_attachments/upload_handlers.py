@@ -0,0 +1,98 @@
+import hashlib
+
+from django import forms
+from django.conf import settings
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+from django.utils.translation import gettext as _
+
+from unicef_attachments.validators import SafeFileValidator
+
+
+def get_max_upload_size():
+    return getattr(settings, "ATTACHMENT_MAX_UPLOAD_SIZE", None)
+
+
+class UploadInspection:
+    """What was learnt about an uploaded file while receiving it"""
+
+    def __init__(self):
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self.head = b""
+        self.mime_type = None
+        self.errors = []
+
+    @property
+    def checksum(self):
+        return self.sha256.hexdigest()
+
+    def as_values(self):
+        """Attachment field values for the inspected file"""
+        return {
+            "checksum": self.checksum,
+            "file_size": self.size,
+            "mime_type": self.mime_type or "",
+        }
+
+
+class InspectingUploadHandler(FileUploadHandler):
+    """Hash, measure and sniff uploaded files as the chunks arrive
+
+    Needs to be the first upload handler, chunks are passed on untouched
+    to the handlers that store the file. A disallowed file type or an
+    oversize file stops the upload without reading the rest of the body.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.validator = SafeFileValidator()
+        self.max_size = get_max_upload_size()
+        self.inspections = {}
+        self.inspection = None
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.inspection = UploadInspection()
+        self.inspections[self.field_name] = self.inspection
+
+    def sniff(self):
+        try:
+            self.inspection.mime_type = self.validator.validate_buffer(self.inspection.head, self.content_type)
+        except forms.ValidationError as e:
+            self.abort(e.messages)
+
+    def abort(self, errors):
+        self.inspection.errors = errors
+        raise StopUpload(connection_reset=True)
+
+    def receive_data_chunk(self, raw_data, start):
+        inspection = self.inspection
+        inspection.sha256.update(raw_data)
+        inspection.size += len(raw_data)
+        if self.max_size is not None and inspection.size > self.max_size:
+            self.abort([_("File is larger than the maximum of {} bytes.").format(self.max_size)])
+        if inspection.mime_type is None:
+            inspection.head += raw_data[: self.validator.mime_lookup_length - len(inspection.head)]
+            if len(inspection.head) >= self.validator.mime_lookup_length:
+                self.sniff()
+        return raw_data
+
+    def file_complete(self, file_size):
+        if self.inspection.mime_type is None:
+            self.sniff()
+        # let the following handlers return the file object
+        return None
+
+
+def add_inspecting_upload_handler(request):
+    """Inspect files uploaded with request, before its body is parsed"""
+    handler = InspectingUploadHandler(request)
+    request.upload_handlers.insert(0, handler)
+    return handler
+
+
+def get_upload_inspection(request, field_name="file"):
+    for handler in request.upload_handlers:
+        if isinstance(handler, InspectingUploadHandler):
+            return handler.inspections.get(field_name)
+    return None
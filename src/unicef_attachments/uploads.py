@@ -0,0 +1,66 @@
+"""Two phase uploads, bypassing the API workers for the file bytes
+
+1. the API issues a signed, short lived token for a target path
+2. the bytes are written straight to storage with that token
+3. the API finalizes the upload, validating the file and
+   creating the attachment
+"""
+
+import hashlib
+import os
+import uuid
+
+from django.conf import settings
+from django.core import signing
+
+from unicef_attachments.models import Attachment, generate_file_path
+
+UPLOAD_TOKEN_SALT = "unicef_attachments.uploads"
+
+
+def get_upload_token_max_age():
+    return getattr(settings, "ATTACHMENT_UPLOAD_TOKEN_MAX_AGE", 15 * 60)
+
+
+def generate_upload_path(filename):
+    """Unique path for an upload not yet linked to an attachment"""
+    dirname, basename = os.path.split(generate_file_path(Attachment(), filename))
+    return "/".join(x for x in [dirname, uuid.uuid4().hex, basename] if x)
+
+
+def create_upload_token(user, filename):
+    path = generate_upload_path(filename)
+    return signing.dumps({"path": path, "user": user.pk}, salt=UPLOAD_TOKEN_SALT), path
+
+
+def read_upload_token(token):
+    """Return the token payload
+
+    Raises signing.BadSignature, or signing.SignatureExpired, for invalid tokens
+    """
+    return signing.loads(token, salt=UPLOAD_TOKEN_SALT, max_age=get_upload_token_max_age())
+
+
+def get_upload_key(path):
+    """Indexed key of an upload, recorded on the attachment when finalized"""
+    return hashlib.sha256(path.encode("utf-8")).hexdigest()
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class LimitedStream:
+    """Read only stream raising UploadTooLarge past max_size bytes"""
+
+    def __init__(self, stream, max_size=None):
+        self.stream = stream
+        self.max_size = max_size
+        self.size = 0
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.size += len(data)
+        if self.max_size is not None and self.size > self.max_size:
+            raise UploadTooLarge()
+        return data
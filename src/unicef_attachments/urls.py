@@ -8,11 +8,42 @@ urlpatterns = (
     re_path(r"^$", view=views.AttachmentListView.as_view(), name="list"),
     re_path(r"^file/(?P<pk>\d+)/$", view=views.AttachmentFileView.as_view(), name="file"),
     re_path(r"^file/(?P<pk>\d+)/(?P<filename>.+)$", view=views.AttachmentFileView.as_view(), name="file_full"),
+    re_path(r"^preview/(?P<pk>\d+)/$", view=views.AttachmentPreviewView.as_view(), name="preview"),
     re_path(
         r"^links/(?P<app>[\w\.]+)/(?P<model>\w+)/(?P<object_pk>\d+)/$",
         view=views.AttachmentLinkListCreateView.as_view(),
         name="link",
     ),
+    re_path(
+        r"^batch/(?P<app>[\w\.]+)/(?P<model>\w+)/$",
+        view=views.AttachmentBatchListView.as_view(),
+        name="batch",
+    ),
+    re_path(r"^feed/$", view=views.AttachmentFeedView.as_view(), name="feed"),
     re_path(r"^links/(?P<pk>\d+)/$", view=views.AttachmentLinkDeleteView.as_view(), name="link-delete"),
+    re_path(
+        r"^zip/(?P<app>[\w\.]+)/(?P<model>\w+)/(?P<object_pk>\d+)/$",
+        view=views.AttachmentZipView.as_view(),
+        name="zip",
+    ),
+    re_path(
+        r"^reassign/(?P<app>[\w\.]+)/(?P<model>\w+)/(?P<object_pk>\d+)/$",
+        view=views.AttachmentReassignView.as_view(),
+        name="reassign",
+    ),
     re_path(r"^upload/$", view=views.AttachmentCreateView.as_view(), name="create"),
+    re_path(r"^upload/token/$", view=views.AttachmentUploadTokenView.as_view(), name="upload-token"),
+    re_path(
+        r"^upload/receive/(?P<token>[\w\-:.]+)/$",
+        view=views.AttachmentUploadReceiveView.as_view(),
+        name="upload-receive",
+    ),
+    re_path(r"^upload/finalize/$", view=views.AttachmentUploadFinalizeView.as_view(), name="upload-finalize"),
+    re_path(r"^async/file/(?P<pk>\d+)/$", view=views.AsyncAttachmentFileView.as_view(), name="file-async"),
+    re_path(
+        r"^async/file/(?P<pk>\d+)/(?P<filename>.+)$",
+        view=views.AsyncAttachmentFileView.as_view(),
+        name="file_full-async",
+    ),
+    re_path(r"^async/upload/$", view=views.AsyncAttachmentCreateView.as_view(), name="create-async"),
 )
@@ -1,7 +1,16 @@
+import hashlib
+import os
+import threading
 from collections import defaultdict
+from functools import partial
 
 from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import caches
 from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+from django.utils import timezone
 from django.utils.encoding import smart_str
 
 
@@ -30,6 +39,28 @@ def get_filepath_prefix_func():
 filepath_prefix = get_filepath_prefix_func()()
 
 
+def _filepath_strategy():
+    from unicef_attachments.models import default_file_path
+
+    return default_file_path
+
+
+def get_filepath_strategy_func():
+    try:
+        dotted_path = settings.ATTACHMENT_FILEPATH_STRATEGY
+        assert dotted_path is not None
+        module, func_name = dotted_path.rsplit(".", 1)
+        module, func = smart_str(module), smart_str(func_name)
+        func = getattr(__import__(module, {}, {}, [func]), func)
+        return func
+    except ImportError as e:
+        raise ImproperlyConfigured(
+            "Could not import ATTACHMENT_FILEPATH_STRATEGY {}: {}".format(settings.ATTACHMENT_FILEPATH_STRATEGY, e)
+        )
+    except (AssertionError, AttributeError):
+        return _filepath_strategy()
+
+
 def _attachment_flat_model():
     from unicef_attachments.models import AttachmentFlat
 
@@ -52,6 +83,25 @@ def get_attachment_flat_model():
         return _attachment_flat_model()
 
 
+def flat_model_has_field(name):
+    return any(field.name == name for field in get_attachment_flat_model()._meta.concrete_fields)
+
+
+def get_flat_field_names(flat_model):
+    return {field.name for field in flat_model._meta.concrete_fields} - {"id", "attachment"}
+
+
+def get_flat_model_values(flat_model, values):
+    """Only the values of fields present on the flat model"""
+    field_names = get_flat_field_names(flat_model)
+    return {key: value for key, value in values.items() if key in field_names}
+
+
+def flat_model_is_managed():
+    """Unmanaged flat models (database views) are not written to"""
+    return get_attachment_flat_model()._meta.managed
+
+
 def _attachment_permissions():
     from unicef_attachments.permissions import AttachmentPermissions
 
@@ -88,20 +138,179 @@ def get_object_link(obj):
         return ""
 
 
+def get_object_links(attachments):
+    """Map attachment pk to object link
+
+    Content objects are loaded with a single query per model,
+    rather than a query per attachment
+    """
+    by_content_type = defaultdict(list)
+    for attachment in attachments:
+        if attachment.content_type_id and attachment.object_id:
+            by_content_type[attachment.content_type_id].append(attachment)
+
+    links = {}
+    for content_type_id, items in by_content_type.items():
+        model_cls = ContentType.objects.get_for_id(content_type_id).model_class()
+        if model_cls is None:
+            continue
+        objects = model_cls._base_manager.in_bulk({attachment.object_id for attachment in items})
+        for attachment in items:
+            try:
+                links[attachment.pk] = objects[attachment.object_id].get_object_url()
+            except (KeyError, AttributeError):
+                links[attachment.pk] = ""
+    return links
+
+
+def get_attachment_flat_values(attachment, object_link):
+    return {
+        "object_link": object_link,
+        "file_type": get_file_type(attachment),
+        "file_link": attachment.file_link,
+        "filename": attachment.filename,
+        "uploaded_by": attachment.uploaded_by.get_full_name() if attachment.uploaded_by else "",
+        "ip_address": attachment.ip_address,
+        "created": attachment.created.strftime("%d %b %Y"),
+        "preview_link": attachment.preview_link,
+        "is_active": attachment.is_active,
+        "created_at": attachment.created,
+        "modified_at": attachment.modified,
+    }
+
+
+class DenormalizeStats:
+    """Count flat rows written and writes skipped as nothing changed"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.written = 0
+            self.skipped = 0
+
+    def add(self, written=0, skipped=0):
+        with self.lock:
+            self.written += written
+            self.skipped += skipped
+
+    def as_dict(self):
+        with self.lock:
+            return {"written": self.written, "skipped": self.skipped}
+
+
+denormalize_stats = DenormalizeStats()
+
+
+def set_changed_values(flat, values):
+    """Set values on the flat row, return True if any changed"""
+    changed = False
+    for key, value in values.items():
+        if getattr(flat, key) != value:
+            setattr(flat, key, value)
+            changed = True
+    return changed
+
+
 def denormalize_attachment(attachment):
-    uploaded_by = attachment.uploaded_by.get_full_name() if attachment.uploaded_by else ""
-    flat, created = get_attachment_flat_model().objects.update_or_create(
-        attachment=attachment,
-        defaults={
-            "object_link": get_object_link(attachment),
-            "file_type": get_file_type(attachment),
-            "file_link": attachment.file_link,
-            "filename": attachment.filename,
-            "uploaded_by": uploaded_by,
-            "ip_address": attachment.ip_address,
-            "created": attachment.created.strftime("%d %b %Y"),
-        },
-    )
+    if not flat_model_is_managed():
+        return None
+    flat_model = get_attachment_flat_model()
+    values = get_flat_model_values(flat_model, get_attachment_flat_values(attachment, get_object_link(attachment)))
+    flat = flat_model.objects.filter(attachment=attachment).first()
+    if flat is None:
+        flat = flat_model.objects.create(attachment=attachment, **values)
+    elif set_changed_values(flat, values):
+        flat_model.objects.filter(pk=flat.pk).update(**values)
+    else:
+        denormalize_stats.add(skipped=1)
+        return flat
+    denormalize_stats.add(written=1)
+    return flat
+
+
+def denormalize_attachments(attachments, batch_size=500):
+    """Denormalize many attachments at once
+
+    Content objects, file types and users are loaded in bulk,
+    flat values are computed in memory and the flat rows
+    are updated/created with bulk queries.
+    Only the fields present on the flat model are set.
+    """
+    attachments = list(attachments)
+    if not attachments or not flat_model_is_managed():
+        return []
+
+    flat_model = get_attachment_flat_model()
+    field_names = get_flat_field_names(flat_model)
+
+    prefetch_related_objects(attachments, "file_type", "uploaded_by")
+    object_links = get_object_links(attachments)
+
+    existing = defaultdict(list)
+    for flat in flat_model.objects.filter(attachment__in=attachments):
+        existing[flat.attachment_id].append(flat)
+
+    flats, to_update, to_create = [], [], []
+    for attachment in attachments:
+        values = get_flat_model_values(
+            flat_model, get_attachment_flat_values(attachment, object_links.get(attachment.pk, ""))
+        )
+        if attachment.pk in existing:
+            for flat in existing[attachment.pk]:
+                if set_changed_values(flat, values):
+                    to_update.append(flat)
+                flats.append(flat)
+        else:
+            flat = flat_model(attachment=attachment, **values)
+            to_create.append(flat)
+            flats.append(flat)
+
+    with transaction.atomic():
+        if to_update:
+            flat_model.objects.bulk_update(to_update, fields=sorted(field_names), batch_size=batch_size)
+        flat_model.objects.bulk_create(to_create, batch_size=batch_size)
+    denormalize_stats.add(written=len(to_update) + len(to_create), skipped=len(flats) - len(to_update) - len(to_create))
+    return flats
+
+
+def denormalize_object_links(attachments, batch_size=500):
+    """Only set the object link of existing flat rows
+
+    Used when the remaining flat values are maintained by
+    database triggers, see `flat_sql.install_flat_triggers`
+    """
+    attachments = list(attachments)
+    if not attachments or not flat_model_is_managed():
+        return []
+
+    flat_model = get_attachment_flat_model()
+    object_links = get_object_links(attachments)
+    flats = list(flat_model.objects.filter(attachment__in=attachments))
+    for flat in flats:
+        flat.object_link = object_links.get(flat.attachment_id, "")
+    flat_model.objects.bulk_update(flats, fields=["object_link"], batch_size=batch_size)
+    return flats
+
+
+def denormalize_object_link(attachment):
+    flats = denormalize_object_links([attachment])
+    return flats[0] if flats else None
+
+
+def get_attachment_flat(attachment):
+    """Flat row of the attachment
+
+    If there is no flat row yet, e.g. a database view that has
+    not been refreshed, the values are computed in memory
+    """
+    flat_model = get_attachment_flat_model()
+    flat = flat_model.objects.filter(attachment=attachment).first()
+    if flat is None:
+        values = get_attachment_flat_values(attachment, get_object_link(attachment))
+        flat = flat_model(attachment=attachment, **get_flat_model_values(flat_model, values))
     return flat
 
 
@@ -118,9 +327,25 @@ def get_denormalize_func():
             "Could not import ATTACHMENT_DENORMALIZE_FUNC {}: {}".format(settings.ATTACHMENT_DENORMALIZE_FUNC, e)
         )
     except (AssertionError, AttributeError):
+        if getattr(settings, "ATTACHMENT_FLAT_TRIGGERS", False):
+            return denormalize_object_link
         return denormalize_attachment
 
 
+def denormalize_many(attachments):
+    """Denormalize attachments with the configured ATTACHMENT_DENORMALIZE_FUNC
+
+    The bundled functions are run in bulk, a custom function
+    is called for each attachment. Returns the results.
+    """
+    denormalize_func = get_denormalize_func()
+    if denormalize_func is denormalize_attachment:
+        return denormalize_attachments(attachments)
+    if denormalize_func is denormalize_object_link:
+        return denormalize_object_links(attachments)
+    return [denormalize_func(attachment) for attachment in attachments]
+
+
 def get_matching_key(file_type, keys):
     key = (file_type.label.lower(), file_type.name.lower())
     for k in keys:
@@ -136,7 +361,9 @@ def cleanup_filetypes():
     Update the group record for primary record
     Update all attachment file type fields with primary record
     Remove duplicate file type records
+    Refresh the flat file type of the moved attachments
     """
+    from unicef_attachments import flat_sql
     from unicef_attachments.models import Attachment, FileType
 
     # get duplicates
@@ -154,10 +381,148 @@ def cleanup_filetypes():
                     primary_file_type.group = []
                 primary_file_type.group += group
                 primary_file_type.save()
-                Attachment.objects.filter(file_type__pk=pk).update(
+                Attachment.all_objects.filter(file_type__pk=pk).update(
                     file_type=primary_file_type,
+                    modified=timezone.now(),
                 )
                 FileType.objects.get(pk=pk).delete()
+            flat_sql.update_flat_file_type(primary_pk)
+
+
+def relocate_attachment_file(attachment):
+    """Copy the attachment file, and its preview, to the paths generated for it
+
+    Returns the (storage, name) of the replaced files, an empty list
+    if the file is already in place. The replaced files are left in
+    storage, to be removed with `delete_relocated_files` once the new
+    names are committed. The attachment itself is not saved.
+    """
+    from unicef_attachments.previews import get_preview_name
+
+    if not attachment.file:
+        return []
+
+    field = attachment.file.field
+    current = attachment.file.name
+    target = field.generate_filename(attachment, os.path.basename(current))
+    if os.path.dirname(target) == os.path.dirname(current):
+        return []
+
+    storage = attachment.file.storage
+    with storage.open(current, "rb") as source:
+        attachment.file.name = storage.save(target, source, max_length=field.max_length)
+    replaced = [(storage, current)]
+
+    if attachment.preview:
+        preview_storage = attachment.preview.storage
+        preview = attachment.preview.name
+        with preview_storage.open(preview, "rb") as source:
+            attachment.preview.name = preview_storage.save(
+                get_preview_name(attachment.file.name),
+                source,
+                max_length=attachment.preview.field.max_length,
+            )
+        replaced.append((preview_storage, preview))
+    return replaced
+
+
+def delete_relocated_files(replaced):
+    """Remove the files replaced by `relocate_attachment_file`"""
+    for storage, name in replaced:
+        try:
+            storage.delete(name)
+        except OSError:
+            continue
+
+
+def reassign_attachments(
+    source_content_type,
+    source_id,
+    target_content_type,
+    target_id,
+    code=None,
+    relocate=False,
+    queryset=None,
+):
+    """Move the attachments of the source object to the target object
+
+    Attachments are re-pointed with a single UPDATE and the flat rows
+    refreshed in one batched pass. With relocate, files and previews
+    are copied to the paths generated for the target object,
+    the old files are removed once the transaction commits.
+    Only the attachments of queryset, all by default, are moved.
+    Returns the moved attachments.
+    """
+    from unicef_attachments.models import Attachment
+
+    if queryset is None:
+        queryset = Attachment.all_objects.all()
+    queryset = queryset.filter(content_type=source_content_type, object_id=source_id)
+    if code is not None:
+        queryset = queryset.filter(code=code)
+
+    with transaction.atomic():
+        pks = list(queryset.select_for_update(of=("self",)).values_list("pk", flat=True))
+        if not pks:
+            return []
+        Attachment.all_objects.filter(pk__in=pks).update(
+            content_type=target_content_type,
+            object_id=target_id,
+            modified=timezone.now(),
+        )
+        attachments = list(Attachment.all_objects.filter(pk__in=pks).select_related("content_type"))
+        if relocate:
+            relocated, replaced = [], []
+            for attachment in attachments:
+                files = relocate_attachment_file(attachment)
+                if files:
+                    relocated.append(attachment)
+                    replaced += files
+            if relocated:
+                Attachment.all_objects.bulk_update(relocated, ["file", "preview"])
+                # rows keep pointing at the old files if the transaction rolls back
+                transaction.on_commit(partial(delete_relocated_files, replaced))
+        denormalize_many(attachments)
+    return attachments
+
+
+def get_file_url_cache_timeout(storage):
+    """Seconds a generated file url can be reused for
+
+    Defaults to a minute less than the signature expiry of storages
+    that sign urls (`querystring_expire`), other storages are not cached
+    """
+    timeout = getattr(settings, "ATTACHMENT_URL_CACHE_TIMEOUT", None)
+    if timeout is None:
+        expire = getattr(storage, "querystring_expire", None)
+        timeout = max(expire - 60, 0) if expire else 0
+    return timeout
+
+
+def get_file_url(attachment, field_name="file"):
+    """Url of the attachment file, reusing previously generated urls
+
+    Cache key includes the file name, so a changed file gets a new url
+    """
+    field_file = getattr(attachment, field_name)
+    if not field_file:
+        return attachment.hyperlink if field_name == "file" else ""
+
+    timeout = get_file_url_cache_timeout(field_file.storage)
+    if not timeout:
+        return field_file.url
+
+    cache = caches[getattr(settings, "ATTACHMENT_URL_CACHE", "default")]
+    key = "attachments:url:{}:{}:{}".format(
+        attachment.pk,
+        field_name,
+        hashlib.md5(field_file.name.encode("utf-8")).hexdigest(),
+    )
+    url = cache.get(key)
+    if url is None:
+        url = field_file.url
+        cache.set(key, url, timeout)
+    return url
 
 
 def get_client_ip(request):
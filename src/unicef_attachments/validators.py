@@ -20,13 +20,22 @@ class SafeFileValidator:
         )
 
     def __call__(self, value):
-        errors = []
+        if getattr(value, "inspection", None) is not None:
+            # already sniffed by the upload handler while receiving it
+            return
         data_file = value.file
-        uploaded_content_type = getattr(data_file, "content_type", "")
+        buffer = data_file.read(self.mime_lookup_length)
+        data_file.seek(0)
+        self.validate_buffer(buffer, getattr(data_file, "content_type", ""))
+
+    def validate_buffer(self, buffer, uploaded_content_type=""):
+        """Validate the content type of the file, given its first bytes
 
+        Returns the detected content type
+        """
+        errors = []
         mg = magic.Magic(mime=True)
-        content_type_magic = mg.from_buffer(data_file.read(self.mime_lookup_length))
-        data_file.seek(0)
+        content_type_magic = mg.from_buffer(buffer)
 
         # Prefer mime-type from magic over mime-type from http header
         if uploaded_content_type != content_type_magic:
@@ -36,3 +45,4 @@ class SafeFileValidator:
             errors.append(_(f"Unsupported file type: {content_type_magic}."))
         if errors:
             raise forms.ValidationError(errors)
+        return content_type_magic
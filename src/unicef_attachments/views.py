@@ -1,44 +1,153 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from urllib.parse import urljoin
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
-from django.db import transaction
+from django.core import signing
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.files import File
+from django.db import IntegrityError, transaction
 from django.db.models import Q
-from django.http import Http404, HttpResponseNotFound, HttpResponseRedirect
+from django.http import Http404, HttpResponseNotFound, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.decorators import method_decorator
 from django.utils.translation import gettext as _
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
 from drf_querystringfilter.backend import QueryStringFilterBackend
-from rest_framework.exceptions import NotFound
+from rest_framework import status
+from rest_framework.exceptions import (
+    APIException,
+    AuthenticationFailed,
+    NotAuthenticated,
+    NotFound,
+    PermissionDenied,
+    ValidationError,
+)
+from rest_framework.filters import OrderingFilter
 from rest_framework.generics import (
     CreateAPIView,
     DestroyAPIView,
+    GenericAPIView,
     ListAPIView,
     ListCreateAPIView,
     RetrieveAPIView,
     UpdateAPIView,
 )
 from rest_framework.parsers import FormParser, MultiPartParser
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.request import Request
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 
+from unicef_attachments.feed import decode_cursor, encode_cursor, get_changes
 from unicef_attachments.models import Attachment, AttachmentLink
+from unicef_attachments.routing import get_read_database, pin_primary, using_read_database
 from unicef_attachments.serializers import (
     AttachmentFileUploadSerializer,
     AttachmentFlatSerializer,
     AttachmentLinkSerializer,
+    AttachmentReassignSerializer,
+    AttachmentUploadFinalizeSerializer,
+    AttachmentUploadTokenSerializer,
+    BaseAttachmentSerializer,
+    ValuesSerializer,
+)
+from unicef_attachments.streaming import range_file_response, zip_attachments
+from unicef_attachments.upload_handlers import add_inspecting_upload_handler, get_max_upload_size, get_upload_inspection
+from unicef_attachments.uploads import (
+    create_upload_token,
+    get_upload_key,
+    LimitedStream,
+    read_upload_token,
+    UploadTooLarge,
+)
+from unicef_attachments.utils import (
+    flat_model_has_field,
+    get_attachment_flat,
+    get_attachment_flat_model,
+    get_attachment_permissions,
+    get_client_ip,
+    get_file_url,
+    reassign_attachments,
 )
-from unicef_attachments.utils import get_attachment_flat_model, get_attachment_permissions, get_client_ip
+from unicef_attachments.validators import SafeFileValidator
+
+
+def filter_permitted(permissions, request, queryset):
+    """Apply the queryset hooks of the permissions
+
+    Permission classes without a `filter_queryset` method are skipped
+    """
+    for permission in permissions:
+        filter_queryset = getattr(permission, "filter_queryset", None)
+        if filter_queryset is not None:
+            queryset = filter_queryset(request, queryset)
+    return queryset
+
+
+class PermissionFilterMixin:
+    """Restrict querysets with the attachment permissions in SQL"""
+
+    def filter_permitted(self, queryset):
+        return filter_permitted(self.get_permissions(), self.request, queryset)
+
+    def filter_queryset(self, queryset):
+        return self.filter_permitted(super().filter_queryset(queryset))
 
 
-class AttachmentListView(ListAPIView):
+class ReadDatabaseMixin:
+    """Route reads to ATTACHMENT_READ_DATABASE, pin writers to the primary"""
+
+    def filter_queryset(self, queryset):
+        return using_read_database(self.request, super().filter_queryset(queryset))
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if request.method not in SAFE_METHODS and status.is_success(response.status_code):
+            pin_primary(response)
+        return response
+
+
+class AttachmentListView(ReadDatabaseMixin, PermissionFilterMixin, ListAPIView):
     queryset = get_attachment_flat_model().objects.exclude(
         Q(attachment__file__isnull=True) | Q(attachment__file__exact=""),
         Q(attachment__hyperlink__isnull=True) | Q(attachment__hyperlink__exact=""),
     )
     permission_classes = (get_attachment_permissions(),)
     serializer_class = AttachmentFlatSerializer
-    filter_backends = (QueryStringFilterBackend,)
+    filter_backends = (QueryStringFilterBackend, OrderingFilter)
     filter_fields = [f for f in AttachmentFlatSerializer().fields]
+    ordering_fields = ["id", "created_at", "modified_at"]
+    values_serializers = {}
+
+    def drf_ignore_filter(self, request, field):
+        return field == api_settings.ORDERING_PARAM
 
+    def get_values_serializer(self):
+        serializer_class = self.get_serializer_class()
+        if serializer_class not in self.values_serializers:
+            self.values_serializers[serializer_class] = ValuesSerializer(serializer_class)
+        return self.values_serializers[serializer_class]
 
-class AttachmentLinkListCreateView(ListCreateAPIView):
+    def list(self, request, *args, **kwargs):
+        values_serializer = self.get_values_serializer()
+        if self.paginator is not None or not values_serializer.supported:
+            return super().list(request, *args, **kwargs)
+        return Response(values_serializer.serialize(self.filter_queryset(self.get_queryset())))
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if flat_model_has_field("is_active"):
+            return queryset.filter(is_active=True)
+        return queryset.filter(attachment__is_active=True)
+
+
+class AttachmentLinkListCreateView(ReadDatabaseMixin, PermissionFilterMixin, ListCreateAPIView):
     permission_classes = (get_attachment_permissions(),)
     serializer_class = AttachmentLinkSerializer
 
@@ -63,6 +172,7 @@ class AttachmentLinkListCreateView(ListCreateAPIView):
         return AttachmentLink.objects.filter(
             content_type=self.content_type,
             object_id=self.object_id,
+            attachment__is_active=True,
         )
 
     def perform_create(self, serializer):
@@ -74,13 +184,160 @@ class AttachmentLinkListCreateView(ListCreateAPIView):
         instance.save()
 
 
-class AttachmentLinkDeleteView(DestroyAPIView):
+class ContentTypeMixin:
+    def get_content_type(self):
+        try:
+            return ContentType.objects.get_by_natural_key(
+                self.kwargs.get("app"),
+                self.kwargs.get("model"),
+            )
+        except ContentType.DoesNotExist:
+            raise NotFound()
+
+
+class AttachmentBatchListView(ReadDatabaseMixin, PermissionFilterMixin, ContentTypeMixin, GenericAPIView):
+    """Attachments and attachment links for many objects of one model
+
+    Object ids are provided as a comma separated `ids` query param,
+    the response is keyed by object id.
+    """
+
+    permission_classes = (get_attachment_permissions(),)
+    serializer_class = BaseAttachmentSerializer
+
+    def get_object_ids(self):
+        try:
+            return [int(pk) for pk in self.request.query_params.get("ids", "").split(",") if pk]
+        except ValueError:
+            raise ValidationError({"ids": _("Expected a comma separated list of integers.")})
+
+    def get_queryset(self):
+        return Attachment.objects.filter(
+            content_type=self.content_type,
+            object_id__in=self.object_ids,
+        ).select_related("file_type", "uploaded_by")
+
+    def get_link_queryset(self):
+        return AttachmentLink.objects.filter(
+            content_type=self.content_type,
+            object_id__in=self.object_ids,
+            attachment__is_active=True,
+        ).select_related("attachment__file_type")
+
+    def get(self, request, *args, **kwargs):
+        self.content_type = self.get_content_type()
+        self.object_ids = self.get_object_ids()
+        data = {pk: {"attachments": [], "links": []} for pk in self.object_ids}
+        attachments = using_read_database(request, self.filter_permitted(self.get_queryset()))
+        for attachment, attachment_data in zip(attachments, self.get_serializer(attachments, many=True).data):
+            data[attachment.object_id]["attachments"].append(attachment_data)
+        links = using_read_database(request, self.filter_permitted(self.get_link_queryset()))
+        for link, link_data in zip(links, AttachmentLinkSerializer(links, many=True).data):
+            data[link.object_id]["links"].append(link_data)
+        return Response(data)
+
+
+class AttachmentFeedView(ReadDatabaseMixin, PermissionFilterMixin, GenericAPIView):
+    """Attachment changes after a cursor, for incremental replication
+
+    Changes are ordered by (modified, id), the returned `cursor` is
+    passed back to get the following changes. Deleted and deactivated
+    attachments are returned as tombstones.
+    """
+
+    permission_classes = (get_attachment_permissions(),)
+    serializer_class = BaseAttachmentSerializer
+    default_limit = 500
+    max_limit = 1000
+
+    def get_position(self):
+        cursor = self.request.query_params.get("cursor")
+        if not cursor:
+            return None
+        try:
+            return decode_cursor(cursor)
+        except ValueError:
+            raise ValidationError({"cursor": _("Invalid cursor.")})
+
+    def get_limit(self):
+        try:
+            limit = int(self.request.query_params.get("limit", self.default_limit))
+        except ValueError:
+            raise ValidationError({"limit": _("Expected an integer.")})
+        return max(1, min(limit, self.max_limit))
+
+    def get(self, request, *args, **kwargs):
+        limit = self.get_limit()
+        cursor = request.query_params.get("cursor")
+        changes = get_changes(
+            self.get_position(),
+            limit,
+            using=get_read_database(request),
+            queryset=self.filter_permitted(Attachment.all_objects.all()),
+        )
+
+        attachments, flats, tombstones = [], [], []
+        for modified, pk, attachment, flat, reason in changes:
+            if attachment is None:
+                tombstones.append({"id": pk, "modified": modified, "reason": reason})
+            else:
+                attachments.append(attachment)
+                flats.append(flat)
+        attachment_data = self.get_serializer(attachments, many=True).data
+        if changes:
+            cursor = encode_cursor(*changes[-1][:2])
+        return Response(
+            {
+                "cursor": cursor,
+                "more": len(changes) == limit,
+                "changes": [
+                    {
+                        "id": attachment.pk,
+                        "modified": attachment.modified,
+                        "attachment": data,
+                        "flat": AttachmentFlatSerializer(flat).data if flat is not None else None,
+                    }
+                    for attachment, flat, data in zip(attachments, flats, attachment_data)
+                ],
+                "tombstones": tombstones,
+            }
+        )
+
+
+class AttachmentReassignView(ReadDatabaseMixin, PermissionFilterMixin, ContentTypeMixin, GenericAPIView):
+    """Move the attachments of an object to another object of the same model"""
+
+    permission_classes = (get_attachment_permissions(),)
+    serializer_class = AttachmentReassignSerializer
+
+    @transaction.atomic
+    def post(self, request, *args, **kwargs):
+        content_type = self.get_content_type()
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        if not content_type.model_class()._default_manager.filter(pk=data["target"]).exists():
+            raise ValidationError({"target": _("Object does not exist.")})
+
+        attachments = reassign_attachments(
+            content_type,
+            self.kwargs.get("object_pk"),
+            content_type,
+            data["target"],
+            code=data.get("code"),
+            relocate=data["relocate"],
+            queryset=self.filter_permitted(Attachment.all_objects.all()),
+        )
+        return Response({"reassigned": len(attachments)})
+
+
+class AttachmentLinkDeleteView(ReadDatabaseMixin, PermissionFilterMixin, DestroyAPIView):
     queryset = AttachmentLink.objects.all()
     permission_classes = (get_attachment_permissions(),)
     serializer_class = AttachmentLinkSerializer
 
 
-class AttachmentFileView(RetrieveAPIView):
+class AttachmentFileView(ReadDatabaseMixin, PermissionFilterMixin, RetrieveAPIView):
     queryset = Attachment.objects.all()
     permission_classes = (get_attachment_permissions(),)
 
@@ -94,11 +351,97 @@ class AttachmentFileView(RetrieveAPIView):
         if not attachment.file and not attachment.hyperlink:
             return HttpResponseNotFound(_("Attachment has no file or hyperlink"))
 
-        url = urljoin("https://{}".format(self.request.get_host()), attachment.url)
+        if attachment.file and "download" in request.query_params:
+            # serve the bytes, supporting resumed downloads and seeking
+            return range_file_response(request, attachment)
+
+        url = urljoin("https://{}".format(self.request.get_host()), get_file_url(attachment))
         return HttpResponseRedirect(url)
 
 
-class AttachmentCreateView(CreateAPIView):
+class AttachmentPreviewView(ReadDatabaseMixin, PermissionFilterMixin, RetrieveAPIView):
+    queryset = Attachment.objects.all()
+    permission_classes = (get_attachment_permissions(),)
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            attachment = self.get_object()
+        except Http404:
+            return HttpResponseNotFound(_("No Attachment matches the given query."))
+
+        if not attachment.preview:
+            return HttpResponseNotFound(_("Attachment has no preview"))
+
+        url = urljoin("https://{}".format(self.request.get_host()), get_file_url(attachment, "preview"))
+        return HttpResponseRedirect(url)
+
+
+class AttachmentZipView(ReadDatabaseMixin, PermissionFilterMixin, ContentTypeMixin, GenericAPIView):
+    """Stream a zip archive of all active attachment files of an object
+
+    Optionally filtered by `code` and `file_type` query params
+    """
+
+    permission_classes = (get_attachment_permissions(),)
+
+    def get_queryset(self):
+        queryset = Attachment.objects.filter(
+            content_type=self.get_content_type(),
+            object_id=self.kwargs.get("object_pk"),
+        )
+        if "code" in self.request.query_params:
+            queryset = queryset.filter(code=self.request.query_params["code"])
+        if "file_type" in self.request.query_params:
+            try:
+                queryset = queryset.filter(file_type_id=int(self.request.query_params["file_type"]))
+            except ValueError:
+                raise ValidationError({"file_type": _("Expected an integer.")})
+        return queryset
+
+    def get(self, request, *args, **kwargs):
+        response = StreamingHttpResponse(
+            zip_attachments(using_read_database(request, self.filter_permitted(self.get_queryset())).iterator()),
+            content_type="application/zip",
+        )
+        response["Content-Disposition"] = 'attachment; filename="{}_{}.zip"'.format(
+            self.kwargs.get("model"),
+            self.kwargs.get("object_pk"),
+        )
+        return response
+
+
+class InspectUploadMixin:
+    """Inspect the uploaded file while the request body is received"""
+
+    upload_field_name = "file"
+
+    def initialize_request(self, request, *args, **kwargs):
+        add_inspecting_upload_handler(request)
+        return super().initialize_request(request, *args, **kwargs)
+
+    def get_upload_inspection(self):
+        return get_upload_inspection(self.request, self.upload_field_name)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method not in ("POST", "PUT", "PATCH") or not hasattr(self, request.method.lower()):
+            return
+        # parse the body, so rejected uploads fail before validation
+        upload = request.FILES.get(self.upload_field_name)
+        inspection = self.get_upload_inspection()
+        if inspection is None:
+            return
+        if inspection.errors:
+            raise ValidationError({self.upload_field_name: inspection.errors})
+        if upload is not None:
+            upload.inspection = inspection
+
+    def get_upload_values(self):
+        inspection = self.get_upload_inspection()
+        return inspection.as_values() if inspection is not None else {}
+
+
+class AttachmentCreateView(ReadDatabaseMixin, InspectUploadMixin, CreateAPIView):
     queryset = Attachment.objects.all()
     permission_classes = (get_attachment_permissions(),)
     serializer_class = AttachmentFileUploadSerializer
@@ -108,16 +451,94 @@ class AttachmentCreateView(CreateAPIView):
     )
 
     def perform_create(self, serializer):
-        self.instance = serializer.save()
+        self.instance = serializer.save(**self.get_upload_values())
 
     @transaction.atomic
     def post(self, *args, **kwargs):
         super().post(*args, **kwargs)
-        attachment_flat = get_attachment_flat_model().objects.filter(attachment=self.instance).first()
-        return Response(AttachmentFlatSerializer(attachment_flat).data)
+        return Response(AttachmentFlatSerializer(get_attachment_flat(self.instance)).data)
+
+
+class AttachmentUploadTokenView(GenericAPIView):
+    """Issue a token to upload a file straight to storage"""
+
+    permission_classes = (get_attachment_permissions(),)
+    serializer_class = AttachmentUploadTokenSerializer
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        token, path = create_upload_token(request.user, serializer.validated_data["filename"])
+        return Response(
+            {
+                "token": token,
+                "path": path,
+                "upload_url": request.build_absolute_uri(reverse("attachments:upload-receive", args=[token])),
+            },
+            status=status.HTTP_201_CREATED,
+        )
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class AttachmentUploadReceiveView(View):
+    """Write the request body to the storage path of the upload token
+
+    Deliberately minimal, the token is the only credential,
+    so it can be served by dedicated upload workers.
+    """
+
+    def put(self, request, token, *args, **kwargs):
+        try:
+            path = read_upload_token(token)["path"]
+        except signing.BadSignature:
+            return JsonResponse({"detail": _("Invalid upload token.")}, status=status.HTTP_403_FORBIDDEN)
+
+        storage = Attachment.file.field.storage
+        if storage.exists(path):
+            return JsonResponse({"detail": _("File has already been uploaded.")}, status=status.HTTP_409_CONFLICT)
+
+        max_size = get_max_upload_size()
+        try:
+            if max_size is not None and int(request.META.get("CONTENT_LENGTH") or 0) > max_size:
+                raise UploadTooLarge()
+            name = storage.save(path, File(LimitedStream(request, max_size), name=os.path.basename(path)))
+        except UploadTooLarge:
+            if storage.exists(path):
+                storage.delete(path)
+            return JsonResponse(
+                {"detail": _("File is larger than the maximum of {} bytes.").format(max_size)},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            )
+        return JsonResponse({"path": name}, status=status.HTTP_201_CREATED)
+
+
+class AttachmentUploadFinalizeView(ReadDatabaseMixin, GenericAPIView):
+    """Create the attachment for a file uploaded with a token"""
+
+    permission_classes = (get_attachment_permissions(),)
+    serializer_class = AttachmentUploadFinalizeSerializer
+
+    @transaction.atomic
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        path = serializer.validated_data["token"]
+        attachment = Attachment(
+            file=path,
+            upload_key=get_upload_key(path),
+            uploaded_by=request.user,
+            ip_address=get_client_ip(request),
+        )
+        try:
+            with transaction.atomic():
+                attachment.save()
+        except IntegrityError:
+            # finalized concurrently
+            raise ValidationError({"token": [_("Upload has already been finalized.")]})
+        return Response(AttachmentFlatSerializer(get_attachment_flat(attachment)).data)
 
 
-class AttachmentUpdateView(UpdateAPIView):
+class AttachmentUpdateView(ReadDatabaseMixin, PermissionFilterMixin, InspectUploadMixin, UpdateAPIView):
     queryset = Attachment.objects.all()
     permission_classes = (get_attachment_permissions(),)
     serializer_class = AttachmentFileUploadSerializer
@@ -131,16 +552,149 @@ class AttachmentUpdateView(UpdateAPIView):
         # this is not set when PATCH request made
         serializer.instance.uploaded_by = serializer.context["request"].user
         serializer.instance.ip_address = get_client_ip(serializer.context["request"])
-        self.instance = serializer.save()
+        self.instance = serializer.save(**self.get_upload_values())
 
     def put(self, *args, **kwargs):
         super().put(*args, **kwargs)
-        return Response(
-            AttachmentFlatSerializer(get_attachment_flat_model().objects.filter(attachment=self.instance).first()).data
-        )
+        return Response(AttachmentFlatSerializer(get_attachment_flat(self.instance)).data)
 
     def patch(self, *args, **kwargs):
         super().patch(*args, **kwargs)
-        return Response(
-            AttachmentFlatSerializer(get_attachment_flat_model().objects.filter(attachment=self.instance).first()).data
+        return Response(AttachmentFlatSerializer(get_attachment_flat(self.instance)).data)
+
+
+_async_executor = None
+
+
+def get_async_executor():
+    """Bounded executor for blocking storage and validation work of the async views"""
+    global _async_executor
+    if _async_executor is None:
+        _async_executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, "ATTACHMENT_ASYNC_WORKERS", 4),
+            thread_name_prefix="attachment-async",
         )
+    return _async_executor
+
+
+async def run_in_executor(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(get_async_executor(), partial(func, *args))
+
+
+class AsyncAttachmentViewMixin:
+    """Native async views, for deployments running under ASGI
+
+    Database access goes through sync_to_async, rather than the async
+    queryset methods, which are not available before Django 4.2.
+
+    Requests are authenticated with DEFAULT_AUTHENTICATION_CLASSES and
+    checked with the configured attachment permission class, as the
+    sync views do, in a thread as both may hit the database.
+    """
+
+    permission_classes = (get_attachment_permissions(),)
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        # as APIView does, SessionAuthentication enforces csrf itself.
+        # Set the flag rather than wrap, csrf_exempt only keeps async views async from Django 5.0
+        view.csrf_exempt = True
+        return view
+
+    def get_permissions(self):
+        return [permission() for permission in self.permission_classes]
+
+    def get_authenticators(self):
+        return [authentication() for authentication in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+
+    def permission_denied(self, request, message=None):
+        if request.authenticators and not request.successful_authenticator:
+            raise NotAuthenticated()
+        raise PermissionDenied(detail=message)
+
+    def authenticate(self, request):
+        """Authenticated DRF request, raises APIException when not permitted"""
+        request = Request(request, authenticators=self.get_authenticators())
+        request.user  # runs the authenticators
+        for permission in self.get_permissions():
+            if not permission.has_permission(request, self):
+                self.permission_denied(request, getattr(permission, "message", None))
+        return request
+
+    def handle_exception(self, request, exc):
+        if isinstance(exc, (NotAuthenticated, AuthenticationFailed)):
+            authenticators = self.get_authenticators()
+            if authenticators and authenticators[0].authenticate_header(request):
+                exc.status_code = status.HTTP_401_UNAUTHORIZED
+            else:
+                exc.status_code = status.HTTP_403_FORBIDDEN
+        return JsonResponse({"detail": str(exc.detail)}, status=exc.status_code)
+
+    async def check_permissions(self, request):
+        try:
+            self.request = await sync_to_async(self.authenticate)(request)
+        except APIException as exc:
+            return self.handle_exception(request, exc)
+        request.user = self.request.user
+        return None
+
+
+class AsyncAttachmentFileView(AsyncAttachmentViewMixin, View):
+    async def get(self, request, *args, **kwargs):
+        denied = await self.check_permissions(request)
+        if denied:
+            return denied
+
+        queryset = filter_permitted(self.get_permissions(), self.request, Attachment.objects.all())
+        queryset = using_read_database(request, queryset)
+        attachment = await sync_to_async(queryset.filter(pk=kwargs.get("pk")).first)()
+        if attachment is None:
+            return HttpResponseNotFound(_("No Attachment matches the given query."))
+
+        if not attachment.file and not attachment.hyperlink:
+            return HttpResponseNotFound(_("Attachment has no file or hyperlink"))
+
+        # storage backends may sign or look up urls remotely
+        url = await run_in_executor(get_file_url, attachment)
+        return HttpResponseRedirect(urljoin("https://{}".format(request.get_host()), url))
+
+
+class AsyncAttachmentCreateView(AsyncAttachmentViewMixin, View):
+    async def post(self, request, *args, **kwargs):
+        # before authentication, which may read the body for the csrf token
+        handler = add_inspecting_upload_handler(request)
+        denied = await self.check_permissions(request)
+        if denied:
+            return denied
+
+        files = await run_in_executor(lambda: request.FILES)
+        inspection = handler.inspections.get("file")
+        if inspection is not None and inspection.errors:
+            return JsonResponse({"file": inspection.errors}, status=status.HTTP_400_BAD_REQUEST)
+        upload = files.get("file")
+        if upload is None:
+            return JsonResponse({"file": [_("No file was submitted.")]}, status=status.HTTP_400_BAD_REQUEST)
+        upload.inspection = inspection
+        try:
+            await run_in_executor(SafeFileValidator(), upload)
+        except DjangoValidationError as e:
+            return JsonResponse({"file": e.messages}, status=status.HTTP_400_BAD_REQUEST)
+
+        attachment = Attachment(
+            uploaded_by=request.user,
+            ip_address=get_client_ip(request),
+            **inspection.as_values(),
+        )
+        await run_in_executor(partial(attachment.file.save, upload.name, upload, save=False))
+        await sync_to_async(attachment.save)()
+
+        flat = await sync_to_async(
+            get_attachment_flat_model()
+            .objects.select_related("attachment__file_type")
+            .filter(attachment=attachment)
+            .first
+        )()
+        if flat is None:
+            flat = await sync_to_async(get_attachment_flat)(attachment)
+        return pin_primary(JsonResponse(AttachmentFlatSerializer(flat).data))
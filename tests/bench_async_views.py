@@ -0,0 +1,58 @@
+"""Concurrent downloads through the sync and async file views
+
+Storage url generation is slowed down to stand in for a remote
+storage backend. Not collected by default, run with
+    pytest tests/bench_async_views.py
+"""
+
+import asyncio
+import time
+
+from asgiref.sync import async_to_sync
+from django.core.files.storage import FileSystemStorage
+from django.test import AsyncClient, Client
+from django.urls import reverse
+
+import pytest
+from unittest.mock import patch
+
+from tests.factories import AttachmentFactory, UserFactory
+
+pytestmark = pytest.mark.django_db
+
+REQUESTS = 40
+STORAGE_LATENCY = 0.02
+
+
+def slow_url(self, name):
+    time.sleep(STORAGE_LATENCY)
+    return "/media/{}".format(name)
+
+
+def requests_per_second(async_client, url):
+    async def run():
+        return await asyncio.gather(*[async_client.get(url) for _ in range(REQUESTS)])
+
+    start = time.perf_counter()
+    responses = async_to_sync(run)()
+    assert all(response.status_code == 302 for response in responses)
+    return REQUESTS / (time.perf_counter() - start)
+
+
+def test_bench_async_views():
+    attachment = AttachmentFactory(file="bench.pdf")
+    client = Client()
+    client.force_login(UserFactory())
+    async_client = AsyncClient()
+    async_client.cookies = client.cookies
+
+    with patch.object(FileSystemStorage, "url", slow_url):
+        sync_rate = requests_per_second(async_client, reverse("attachments:file", args=[attachment.pk]))
+        async_rate = requests_per_second(async_client, reverse("attachments:file-async", args=[attachment.pk]))
+    print(
+        "\nAttachmentFileView: {:.0f} req/s, AsyncAttachmentFileView: {:.0f} req/s ({:.1f}x)".format(
+            sync_rate,
+            async_rate,
+            async_rate / sync_rate,
+        )
+    )
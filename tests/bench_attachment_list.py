@@ -0,0 +1,48 @@
+"""Rows per second of the attachment list serializers
+
+Not collected by default, run with
+    pytest tests/bench_attachment_list.py
+"""
+
+import time
+
+import pytest
+
+from tests.factories import AttachmentFileTypeFactory, UserFactory
+from unicef_attachments.models import Attachment, AttachmentFlat
+from unicef_attachments.serializers import AttachmentFlatSerializer, ValuesSerializer
+from unicef_attachments.utils import denormalize_attachments
+
+pytestmark = pytest.mark.django_db
+
+ROWS = 5000
+
+
+def rows_per_second(func):
+    start = time.perf_counter()
+    data = func()
+    return data, len(data) / (time.perf_counter() - start)
+
+
+def test_bench_attachment_list():
+    file_type = AttachmentFileTypeFactory()
+    user = UserFactory()
+    attachments = Attachment.objects.bulk_create(
+        [Attachment(file="file_{}.pdf".format(i), file_type=file_type, uploaded_by=user) for i in range(ROWS)]
+    )
+    denormalize_attachments(attachments)
+    queryset = AttachmentFlat.objects.order_by("pk")
+    values_serializer = ValuesSerializer(AttachmentFlatSerializer)
+
+    serializer_data, serializer_rate = rows_per_second(
+        lambda: AttachmentFlatSerializer(queryset.select_related("attachment__file_type"), many=True).data
+    )
+    values_data, values_rate = rows_per_second(lambda: values_serializer.serialize(queryset))
+    assert values_data == serializer_data
+    print(
+        "\nAttachmentFlatSerializer: {:.0f} rows/s, ValuesSerializer: {:.0f} rows/s ({:.1f}x)".format(
+            serializer_rate,
+            values_rate,
+            values_rate / serializer_rate,
+        )
+    )
@@ -1,4 +1,5 @@
 from django.db import models
+from django.urls import reverse
 from unicef_djangolib.fields import CodedGenericRelation
 
 from unicef_attachments.models import Attachment
@@ -31,6 +32,9 @@ class Book(models.Model):
     def __str__(self):
         return self.name
 
+    def get_object_url(self):
+        return reverse("sample:book-detail", args=[self.pk])
+
 
 class AttachmentFlatOverride(models.Model):
     attachment = models.ForeignKey(
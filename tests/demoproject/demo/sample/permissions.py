@@ -1,5 +1,14 @@
 from rest_framework.permissions import IsAdminUser
 
+from unicef_attachments.permissions import AttachmentPermissions, get_attachment_lookup
+
 
 class AttachmentPermOverride(IsAdminUser):
     """Demo permission override"""
+
+
+class OwnAttachmentPermissions(AttachmentPermissions):
+    """Demo permissions limited to attachments uploaded by the user"""
+
+    def filter_queryset(self, request, queryset):
+        return queryset.filter(**{get_attachment_lookup(queryset, "uploaded_by"): request.user})
@@ -81,7 +81,15 @@ DATABASES = {
         "HOST": "127.0.0.1",
         "NAME": "unicef_attachments",
         "USER": "postgres",
-    }
+    },
+    # stands in for a read replica, see ATTACHMENT_READ_DATABASE
+    "replica": {
+        "ENGINE": "django.db.backends.postgresql",
+        "HOST": "127.0.0.1",
+        "NAME": "unicef_attachments",
+        "USER": "postgres",
+        "TEST": {"MIRROR": "default"},
+    },
 }
 
 
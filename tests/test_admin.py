@@ -1,6 +1,11 @@
 from django.urls import reverse
 
 import pytest
+from unittest.mock import patch
+
+from tests.factories import AttachmentFactory, AttachmentFileTypeFactory, UserFactory
+from unicef_attachments.admin import ApproximateCountPaginator
+from unicef_attachments.models import Attachment, AttachmentFlat
 
 pytestmark = pytest.mark.django_db
 
@@ -31,3 +36,67 @@ def test_attachment_inline_post(client, author, superuser, upload_file):
     )
     assert response.status_code == 200
     assert author.profile_image.exists()
+
+
+def test_attachment_changelist_inactive(client, superuser):
+    attachment = AttachmentFactory(file="inactive.pdf", is_active=False)
+    client.force_login(superuser)
+    response = client.get(reverse("admin:unicef_attachments_attachment_changelist"))
+    assert response.status_code == 200
+    assert list(response.context["cl"].result_list) == [attachment]
+
+
+def test_attachment_changelist_queries(client, superuser, django_assert_max_num_queries):
+    AttachmentFactory.create_batch(5, file="listed.pdf")
+    client.force_login(superuser)
+    url = reverse("admin:unicef_attachments_attachment_changelist")
+    with django_assert_max_num_queries(12) as captured:
+        response = client.get(url)
+    assert response.status_code == 200
+    AttachmentFactory.create_batch(5, file="listed.pdf")
+    with django_assert_max_num_queries(len(captured)):
+        client.get(url)
+
+
+def test_attachment_inline_queries(client, author, superuser, django_assert_max_num_queries):
+    file_type = AttachmentFileTypeFactory(code="author_profile_image")
+    AttachmentFactory(content_object=author, file_type=file_type, code=file_type.code, file="inline.pdf")
+    client.force_login(superuser)
+    url = reverse("admin:sample_author_change", args=[author.pk])
+    with django_assert_max_num_queries(20) as captured:
+        client.get(url)
+    AttachmentFactory.create_batch(
+        3, content_object=author, file_type=file_type, code=file_type.code, uploaded_by=UserFactory()
+    )
+    with django_assert_max_num_queries(len(captured)):
+        client.get(url)
+
+
+def test_approximate_count_paginator():
+    AttachmentFactory.create_batch(3, file="counted.pdf")
+    queryset = Attachment.all_objects.all()
+    paginator = ApproximateCountPaginator(queryset, 10)
+    with patch.object(ApproximateCountPaginator, "get_estimate", return_value=50000):
+        assert paginator.count == 50000
+    paginator = ApproximateCountPaginator(queryset.filter(file="counted.pdf"), 10)
+    with patch.object(ApproximateCountPaginator, "get_estimate", return_value=50000):
+        assert paginator.count == 3
+    assert ApproximateCountPaginator(queryset, 10).get_estimate() < 10000
+    assert ApproximateCountPaginator(queryset, 10).count == 3
+
+
+def test_attachment_admin_actions(client, superuser):
+    attachments = AttachmentFactory.create_batch(2, file="action.pdf")
+    AttachmentFlat.objects.filter(attachment__in=attachments).update(filename="stale")
+    client.force_login(superuser)
+    url = reverse("admin:unicef_attachments_attachment_changelist")
+    selected = [attachment.pk for attachment in attachments]
+
+    response = client.post(url, {"action": "denormalize_selected", "_selected_action": selected})
+    assert response.status_code == 302
+    assert set(AttachmentFlat.objects.values_list("filename", flat=True)) == {"action.pdf"}
+
+    response = client.post(url, {"action": "deactivate_selected", "_selected_action": selected})
+    assert response.status_code == 302
+    assert not Attachment.objects.filter(pk__in=selected).exists()
+    assert not AttachmentFlat.objects.filter(attachment__in=selected, is_active=True).exists()
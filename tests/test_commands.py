@@ -0,0 +1,77 @@
+import io
+from datetime import timedelta
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.utils import timezone
+
+import pytest
+
+from tests.factories import AttachmentFactory, AttachmentLinkFactory
+from unicef_attachments.management.commands.cleanup_orphan_attachments import Command
+from unicef_attachments.models import Attachment, AttachmentFlat
+
+pytestmark = pytest.mark.django_db
+
+
+def orphan(**kwargs):
+    attachment = AttachmentFactory(file=SimpleUploadedFile("orphan.txt", b"orphaned"), **kwargs)
+    Attachment.objects.filter(pk=attachment.pk).update(created=timezone.now() - timedelta(days=2))
+    return attachment
+
+
+def test_cleanup_orphan_attachments(author):
+    stale = orphan()
+    linked = orphan(content_object=author)
+    recent = AttachmentFactory(file=SimpleUploadedFile("recent.txt", b"recent"))
+    storage = stale.file.storage
+    stdout = io.StringIO()
+    call_command("cleanup_orphan_attachments", ttl_hours=24, batch_size=1, stdout=stdout)
+    assert "Removed 1 orphaned attachments, 8 bytes reclaimed" in stdout.getvalue()
+    assert not Attachment.objects.filter(pk=stale.pk).exists()
+    assert not AttachmentFlat.objects.filter(attachment_id=stale.pk).exists()
+    assert not storage.exists(stale.file.name)
+    assert Attachment.objects.filter(pk__in=[linked.pk, recent.pk]).count() == 2
+
+
+def test_cleanup_orphan_attachments_with_links(book):
+    attachment = orphan()
+    AttachmentLinkFactory(attachment=attachment, content_object=book)
+    call_command("cleanup_orphan_attachments", stdout=io.StringIO())
+    assert Attachment.objects.filter(pk=attachment.pk).exists()
+
+
+def test_cleanup_orphan_attachments_linked_meanwhile(book):
+    attachment = orphan()
+    storage = attachment.file.storage
+    command = Command()
+    stale = list(command.get_queryset(24))
+    AttachmentLinkFactory(attachment=attachment, content_object=book)
+    assert command.delete_rows(stale, 24, AttachmentFlat) == []
+    assert Attachment.objects.filter(pk=attachment.pk).exists()
+    assert storage.exists(attachment.file.name)
+
+
+def test_cleanup_orphan_attachments_dry_run():
+    attachments = [orphan(), orphan()]
+    stdout = io.StringIO()
+    call_command("cleanup_orphan_attachments", dry_run=True, batch_size=1, rate=1000, stdout=stdout)
+    assert "Would remove 2 orphaned attachments, 16 bytes reclaimed" in stdout.getvalue()
+    assert Attachment.objects.filter(pk__in=[a.pk for a in attachments]).count() == 2
+    assert attachments[0].file.storage.exists(attachments[0].file.name)
+
+
+def test_backfill_attachment_flat_timestamps():
+    attachments = AttachmentFactory.create_batch(3, file="timestamps.pdf")
+    AttachmentFlat.objects.update(created_at=None, modified_at=None)
+    stdout = io.StringIO()
+    call_command("backfill_attachment_flat_timestamps", batch_size=2, stdout=stdout)
+    assert "Backfilled 3 flat rows" in stdout.getvalue()
+    for attachment in attachments:
+        flat = AttachmentFlat.objects.get(attachment=attachment)
+        assert flat.created_at == attachment.created
+        assert flat.modified_at == attachment.modified
+
+    stdout = io.StringIO()
+    call_command("backfill_attachment_flat_timestamps", stdout=stdout)
+    assert "Backfilled 0 flat rows" in stdout.getvalue()
@@ -0,0 +1,288 @@
+import io
+from datetime import datetime, timezone
+from importlib import import_module
+
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+import pytest
+
+from tests.factories import AttachmentFactory, AttachmentFileTypeFactory, UserFactory
+from unicef_attachments import flat_sql
+from unicef_attachments.models import Attachment, AttachmentFlat, AttachmentFlatView
+from unicef_attachments.serializers import AttachmentFlatSerializer
+from unicef_attachments.utils import (
+    denormalize_attachment,
+    denormalize_object_link,
+    denormalize_object_links,
+    get_attachment_flat,
+    get_denormalize_func,
+)
+from unicef_attachments.views import AttachmentListView
+
+pytestmark = pytest.mark.django_db
+
+FLAT_FIELDS = [
+    "file_type",
+    "file_link",
+    "filename",
+    "uploaded_by",
+    "ip_address",
+    "created",
+    "preview_link",
+    "is_active",
+    "created_at",
+    "modified_at",
+]
+
+
+@pytest.fixture
+def attachments(file_type, author):
+    user = UserFactory(first_name="Jane", last_name="Doe")
+    return [
+        AttachmentFactory(file_type=file_type, content_object=author, file="files/sample/test.pdf", uploaded_by=user),
+        AttachmentFactory(hyperlink="https://example.com/path/sample.pdf?query=1#top"),
+        AttachmentFactory(hyperlink="https://example.com"),
+        AttachmentFactory(file="image.png", preview="image.preview.png", is_active=False),
+        AttachmentFactory(),
+        # links are quoted as reverse() does
+        AttachmentFactory(file="files/sample/résumé ü.pdf"),
+        AttachmentFactory(hyperlink="https://example.com/a%20b.pdf"),
+    ]
+
+
+def test_attachment_flat_view(attachments):
+    call_command("attachment_flat_view", create=True, stdout=io.StringIO())
+    for attachment in attachments:
+        flat = AttachmentFlat.objects.get(attachment=attachment)
+        view = AttachmentFlatView.objects.get(attachment=attachment)
+        for field in FLAT_FIELDS:
+            assert getattr(view, field) == getattr(flat, field), field
+        assert view.object_link == ""
+
+
+def test_attachment_flat_view_list_ordering(attachments, user):
+    call_command("attachment_flat_view", create=True, stdout=io.StringIO())
+
+    class FlatViewSerializer(AttachmentFlatSerializer):
+        class Meta(AttachmentFlatSerializer.Meta):
+            model = AttachmentFlatView
+
+    class FlatViewListView(AttachmentListView):
+        queryset = AttachmentFlatView.objects.all()
+        serializer_class = FlatViewSerializer
+        filter_fields = [f for f in FlatViewSerializer().fields]
+
+    active = sorted((a for a in attachments if a.is_active), key=lambda a: a.created)
+    request = APIRequestFactory().get("/", {"ordering": "-created_at"})
+    force_authenticate(request, user)
+    response = FlatViewListView.as_view()(request)
+    assert response.status_code == 200
+    assert [row["id"] for row in response.data] == [a.pk for a in reversed(active)]
+
+    request = APIRequestFactory().get("/", {"created_at__gte": active[1].created.isoformat()})
+    force_authenticate(request, user)
+    response = FlatViewListView.as_view()(request)
+    assert response.status_code == 200
+    assert sorted(row["id"] for row in response.data) == sorted(a.pk for a in active[1:])
+
+    call_command("attachment_flat_view", drop=True, stdout=io.StringIO())
+
+
+def test_attachment_flat_view_refresh(attachments, settings):
+    call_command("attachment_flat_view", create=True, stdout=io.StringIO())
+    settings.ATTACHMENT_FLAT_MODEL = "unicef_attachments.models.AttachmentFlatView"
+    attachment = AttachmentFactory(file="new.pdf")
+    assert denormalize_attachment(attachment) is None
+    assert not AttachmentFlatView.objects.filter(attachment=attachment).exists()
+    assert get_attachment_flat(attachment).filename == "new.pdf"
+
+    call_command("attachment_flat_view", stdout=io.StringIO())
+    assert AttachmentFlatView.objects.get(attachment=attachment).filename == "new.pdf"
+
+    call_command("attachment_flat_view", drop=True, stdout=io.StringIO())
+
+
+def test_attachment_flat_triggers(settings, book, file_type):
+    settings.ATTACHMENT_FLAT_TRIGGERS = True
+    assert get_denormalize_func() == denormalize_object_link
+    call_command("attachment_flat_triggers", stdout=io.StringIO())
+
+    content_type = ContentType.objects.get_for_model(book)
+    attachments = Attachment.objects.bulk_create(
+        [
+            Attachment(file="bulk.pdf", file_type=file_type, content_type=content_type, object_id=book.pk),
+            Attachment(hyperlink="https://example.com/bulk.pdf"),
+            Attachment(file="résumé ü.pdf"),
+            Attachment(hyperlink="https://example.com/a%20b.pdf"),
+        ]
+    )
+    flat = AttachmentFlat.objects.get(attachment=attachments[0])
+    assert flat.filename == "bulk.pdf"
+    assert flat.file_type == file_type.label
+    assert flat.file_link == attachments[0].file_link
+    assert flat.created_at == attachments[0].created
+    assert flat.object_link == ""
+    assert AttachmentFlat.objects.get(attachment=attachments[1]).filename == "bulk.pdf"
+    for attachment in attachments[2:]:
+        flat = AttachmentFlat.objects.get(attachment=attachment)
+        assert (flat.filename, flat.file_link) == (attachment.filename, attachment.file_link)
+
+    Attachment.objects.filter(pk=attachments[0].pk).update(file="renamed.pdf")
+    assert AttachmentFlat.objects.filter(attachment=attachments[0]).get().filename == "renamed.pdf"
+
+    denormalize_object_links(attachments)
+    assert AttachmentFlat.objects.get(attachment=attachments[0]).object_link == book.get_object_url()
+
+    attachment = AttachmentFactory(content_object=book, file="saved.pdf")
+    flat = AttachmentFlat.objects.get(attachment=attachment)
+    assert flat.filename == "saved.pdf"
+    assert flat.object_link == book.get_object_url()
+
+    call_command("attachment_flat_triggers", uninstall=True, stdout=io.StringIO())
+    Attachment.objects.filter(pk=attachments[0].pk).update(file="again.pdf")
+    assert AttachmentFlat.objects.get(attachment=attachments[0]).filename == "renamed.pdf"
+
+
+def test_attachment_flat_trigger_migrations(settings, file_type):
+    settings.ATTACHMENT_FLAT_TRIGGERS = True
+    initial = import_module("unicef_attachments.migrations.0013_attachment_flat_triggers")
+    timestamps = import_module("unicef_attachments.migrations.0018_attachmentflat_timestamps")
+    quoted = import_module("unicef_attachments.migrations.0020_attachment_flat_quoted_links")
+    with connection.schema_editor() as schema_editor:
+        # nothing to replace before the triggers are installed
+        timestamps.update_triggers(apps, schema_editor)
+        assert not initial.triggers_installed(schema_editor)
+        initial.install_triggers(apps, schema_editor)
+
+    attachment = Attachment.objects.bulk_create([Attachment(file="frozen.pdf", file_type=file_type)])[0]
+    flat = AttachmentFlat.objects.get(attachment=attachment)
+    assert flat.filename == "frozen.pdf"
+    assert flat.file_type == file_type.label
+    assert flat.file_link == attachment.file_link
+    assert flat.created_at is None
+
+    with connection.schema_editor() as schema_editor:
+        timestamps.update_triggers(apps, schema_editor)
+    attachment = Attachment.objects.bulk_create([Attachment(hyperlink="https://example.com/frozen.pdf")])[0]
+    flat = AttachmentFlat.objects.get(attachment=attachment)
+    assert flat.filename == "frozen.pdf"
+    assert flat.created_at == attachment.created
+    assert flat.modified_at == attachment.modified
+
+    with connection.schema_editor() as schema_editor:
+        quoted.update_triggers(apps, schema_editor)
+    attachments = Attachment.objects.bulk_create(
+        [Attachment(file="résumé ü.pdf"), Attachment(hyperlink="https://example.com/a%20b.pdf")]
+    )
+    for attachment in attachments:
+        flat = AttachmentFlat.objects.get(attachment=attachment)
+        assert (flat.filename, flat.file_link) == (attachment.filename, attachment.file_link)
+        assert flat.modified_at == attachment.modified
+
+    with connection.schema_editor() as schema_editor:
+        initial.uninstall_triggers(apps, schema_editor)
+        assert not initial.triggers_installed(schema_editor)
+
+
+def partition_names():
+    return [name for name, __, __ in flat_sql.get_partitions(AttachmentFlat._meta.db_table)]
+
+
+def test_attachment_flat_partitions(attachments):
+    table = AttachmentFlat._meta.db_table
+    now = "--now=2026-10-19T12:00:00+00:00"
+    with pytest.raises(CommandError):
+        call_command("attachment_flat_partitions", now, stdout=io.StringIO())
+
+    stdout = io.StringIO()
+    call_command("attachment_flat_partitions", now, convert=True, months=2, stdout=stdout)
+    assert flat_sql.is_partitioned(table)
+    assert "Created {}_p202611".format(table) in stdout.getvalue()
+    assert partition_names() == [table + "_legacy", table + "_p202611", table + "_p202612"]
+    for attachment in attachments:
+        assert AttachmentFlat.objects.get(attachment=attachment).created_at == attachment.created
+
+    attachment = AttachmentFactory(file="partitioned.pdf")
+    Attachment.objects.filter(pk=attachment.pk).update(created=datetime(2026, 11, 2, tzinfo=timezone.utc))
+    attachment.refresh_from_db()
+    attachment.file = "moved.pdf"
+    attachment.save()
+    flat = AttachmentFlat.objects.get(attachment=attachment)
+    assert flat.filename == "moved.pdf"
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT attachment_id FROM {}_p202611".format(table))
+        assert cursor.fetchall() == [(attachment.pk,)]
+
+    stdout = io.StringIO()
+    call_command("attachment_flat_partitions", now, months=3, retain_months=-1, stdout=stdout)
+    assert "Created {}_p202701".format(table) in stdout.getvalue()
+    assert "Detached {}_legacy".format(table) in stdout.getvalue()
+    assert partition_names() == [table + "_p202611", table + "_p202612", table + "_p202701"]
+    assert list(AttachmentFlat.objects.values_list("attachment", flat=True)) == [attachment.pk]
+
+    with pytest.raises(CommandError):
+        call_command("attachment_flat_partitions", now, convert=True, stdout=io.StringIO())
+
+
+def test_file_type_label_propagation(settings, file_type, django_capture_on_commit_callbacks):
+    settings.ATTACHMENT_FLAT_PROPAGATE_BATCH_SIZE = 2
+    attachments = AttachmentFactory.create_batch(3, file_type=file_type, file="typed.pdf")
+    other = AttachmentFactory(file_type=AttachmentFileTypeFactory(label="Other"), file="other.pdf")
+    modified = Attachment.objects.get(pk=attachments[0].pk).modified
+
+    with django_capture_on_commit_callbacks(execute=True) as callbacks:
+        file_type.label = "Renamed"
+        file_type.save()
+    assert len(callbacks) == 1
+    for attachment in attachments:
+        assert AttachmentFlat.objects.get(attachment=attachment).file_type == "Renamed"
+    # reported by the change feed
+    assert Attachment.objects.get(pk=attachments[0].pk).modified > modified
+    assert Attachment.objects.get(pk=other.pk).modified == other.modified
+    assert AttachmentFlat.objects.get(attachment=other).file_type == "Other"
+
+    with django_capture_on_commit_callbacks() as callbacks:
+        file_type.save()
+    assert not callbacks
+    assert flat_sql.update_flat_file_type(file_type.pk) == 0
+
+
+def test_user_name_propagation(django_capture_on_commit_callbacks, django_assert_num_queries):
+    user = UserFactory(first_name="Jane", last_name="Doe")
+    attachment = AttachmentFactory(uploaded_by=user, file="named.pdf")
+    assert AttachmentFlat.objects.get(attachment=attachment).uploaded_by == "Jane Doe"
+
+    with django_capture_on_commit_callbacks(execute=True) as callbacks:
+        user.last_name = "Smith"
+        user.save()
+    assert len(callbacks) == 1
+    assert AttachmentFlat.objects.get(attachment=attachment).uploaded_by == "Jane Smith"
+
+    with django_capture_on_commit_callbacks() as callbacks, django_assert_num_queries(1):
+        user.save(update_fields=["last_login"])
+    assert not callbacks
+
+
+def test_user_name_propagation_custom_full_name(monkeypatch, settings, django_capture_on_commit_callbacks):
+    settings.ATTACHMENT_FLAT_PROPAGATE_BATCH_SIZE = 1
+    user_model = get_user_model()
+    monkeypatch.setattr(user_model, "get_full_name", lambda user: user.email)
+    assert not flat_sql.user_name_in_sql()
+    user = UserFactory(email="jane@example.com")
+    attachments = AttachmentFactory.create_batch(2, uploaded_by=user, file="named.pdf")
+    assert AttachmentFlat.objects.get(attachment=attachments[0]).uploaded_by == "jane@example.com"
+
+    with django_capture_on_commit_callbacks(execute=True) as callbacks:
+        user.email = "doe@example.com"
+        user.save(update_fields=["email"])
+    assert len(callbacks) == 1
+    for attachment in attachments:
+        assert AttachmentFlat.objects.get(attachment=attachment).uploaded_by == "doe@example.com"
+        assert Attachment.objects.get(pk=attachment.pk).modified > attachment.modified
+    assert flat_sql.update_flat_uploaded_by(user.pk) == 0
@@ -1,3 +1,7 @@
+import hashlib
+import importlib
+
+from django.apps import apps as django_apps
 from django.core.exceptions import ValidationError
 from django.core.files.uploadedfile import SimpleUploadedFile
 
@@ -116,3 +120,98 @@ def test_file_type_group_by():
         file_type_1,
     ]
     assert list(models.FileType.objects.group_by("group3")) == [file_type_3]
+
+
+def test_file_type_group_any():
+    file_type_1 = AttachmentFileTypeFactory(label="ft1", code="a", group=["group1", "group2"])
+    file_type_2 = AttachmentFileTypeFactory(label="ft2", code="b", group=["group2"])
+    AttachmentFileTypeFactory(label="ft3", code="c", group=["group3"])
+    assert list(models.FileType.objects.group_any("group1")) == [file_type_1]
+    assert list(models.FileType.objects.group_any(["group1", "group2"])) == [file_type_1, file_type_2]
+    assert not models.FileType.objects.group_any(["group4"]).exists()
+
+
+def test_file_type_groups():
+    AttachmentFileTypeFactory(label="ft1", code="a", group=["group2", "group1"])
+    AttachmentFileTypeFactory(label="ft2", code="b", group=["group1"])
+    AttachmentFileTypeFactory(label="ft3", code="c", group=None)
+    assert list(models.FileType.objects.groups()) == ["group1", "group2"]
+
+
+def test_file_type_group_migration():
+    migration = importlib.import_module("unicef_attachments.migrations.0005_auto_20190705_1746")
+    file_type = AttachmentFileTypeFactory(code="code1", group=None)
+    migration.update_group(django_apps, None)
+    file_type.refresh_from_db()
+    assert file_type.group == ["code1"]
+    migration.reverse_update(django_apps, None)
+    file_type.refresh_from_db()
+    assert file_type.group == []
+
+
+def test_generate_file_path_sharded(settings, author):
+    settings.ATTACHMENT_FILEPATH_STRATEGY = "unicef_attachments.models.sharded_file_path"
+    attachment = AttachmentFactory(content_object=author, code="author-image")
+    digest = hashlib.sha1(b"test.pdf").hexdigest()
+    file_path = models.generate_file_path(attachment, "path/test.pdf")
+    assert file_path == "/".join(
+        ["files", "sample", "author", attachment.code, str(author.pk), digest[:2], digest[2:4], "test.pdf"]
+    )
+
+
+def test_generate_file_path_sharded_no_content_type(settings):
+    settings.ATTACHMENT_FILEPATH_STRATEGY = "unicef_attachments.models.sharded_file_path"
+    settings.ATTACHMENT_FILEPATH_SHARD_DEPTH = 1
+    attachment = AttachmentFactory()
+    digest = hashlib.sha1(b"test.pdf").hexdigest()
+    file_path = models.generate_file_path(attachment, "test.pdf")
+    assert file_path == "/".join(["files", "unknown", "tmp", digest[:2], "test.pdf"])
+
+
+def test_attachment_manager_active(author):
+    active = AttachmentFactory(content_object=author, file="active.pdf")
+    inactive = AttachmentFactory(content_object=author, file="inactive.pdf", is_active=False)
+    assert list(models.Attachment.objects.all()) == [active]
+    assert list(models.Attachment.all_objects.all()) == [active, inactive]
+    assert list(models.Attachment.all_objects.active()) == [active]
+    assert models.AttachmentFlat.objects.get(attachment=inactive).attachment == inactive
+
+
+def test_attachment_deactivate_activate(django_assert_num_queries, author):
+    attachment = AttachmentFactory(content_object=author, file="test.pdf")
+    # savepoint, flat update, attachment update, release
+    with django_assert_num_queries(4):
+        assert models.Attachment.objects.filter(pk=attachment.pk).deactivate() == 1
+    assert not models.Attachment.objects.filter(pk=attachment.pk).exists()
+    assert not models.AttachmentFlat.objects.get(attachment=attachment).is_active
+
+    with pytest.raises(TypeError):
+        models.Attachment.objects.filter(pk=attachment.pk).activate()
+    assert models.Attachment.all_objects.filter(pk=attachment.pk).activate() == 1
+    assert models.Attachment.objects.filter(pk=attachment.pk).exists()
+    assert models.AttachmentFlat.objects.get(attachment=attachment).is_active
+
+
+def test_attachment_replaced_file_inspected_fields(author):
+    attachment = AttachmentFactory(content_object=author, file="inspected.pdf")
+    models.Attachment.objects.filter(pk=attachment.pk).update(checksum="a" * 64, file_size=12, mime_type="text/plain")
+
+    attachment = models.Attachment.objects.get(pk=attachment.pk)
+    attachment.code = "unchanged"
+    attachment.save()
+    attachment.refresh_from_db()
+    assert (attachment.checksum, attachment.file_size, attachment.mime_type) == ("a" * 64, 12, "text/plain")
+
+    attachment = models.Attachment.objects.get(pk=attachment.pk)
+    attachment.file = "replaced.pdf"
+    attachment.save(update_fields=["file"])
+    attachment.refresh_from_db()
+    assert (attachment.checksum, attachment.file_size, attachment.mime_type) == ("", None, "")
+
+    # values set along with the new file are kept
+    attachment.file = "inspected-again.pdf"
+    attachment.checksum = "b" * 64
+    attachment.file_size = 5
+    attachment.save()
+    attachment.refresh_from_db()
+    assert (attachment.checksum, attachment.file_size) == ("b" * 64, 5)
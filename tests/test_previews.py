@@ -0,0 +1,72 @@
+import io
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from PIL import Image
+
+import pytest
+from unittest.mock import patch
+
+from tests.factories import AttachmentFactory
+from unicef_attachments import previews
+from unicef_attachments.models import Attachment, AttachmentFlat
+
+pytestmark = pytest.mark.django_db
+
+
+def image_file(name="image.png", size=(800, 600)):
+    content = io.BytesIO()
+    Image.new("RGB", size, "red").save(content, format="PNG")
+    return SimpleUploadedFile(name, content.getvalue(), content_type="image/png")
+
+
+def test_get_preview_name():
+    assert previews.get_preview_name("files/sample/author/1/image.jpg") == "files/sample/author/1/image.preview.png"
+
+
+def test_is_previewable():
+    assert previews.is_previewable(AttachmentFactory(file="image.jpg"))
+    assert not previews.is_previewable(AttachmentFactory(file="test.pdf"))
+    assert not previews.is_previewable(AttachmentFactory(hyperlink="https://example.com/image.jpg"))
+
+
+def test_generate_preview(author):
+    attachment = AttachmentFactory(content_object=author, file=image_file())
+    assert previews.needs_preview(attachment)
+    modified = attachment.modified
+    preview = previews.generate_preview(attachment)
+    assert preview.name == previews.get_preview_name(attachment.file.name)
+    with preview.open("rb") as source:
+        assert Image.open(source).size == (256, 192)
+
+    attachment.refresh_from_db()
+    assert not previews.needs_preview(attachment)
+    assert attachment.preview_link
+    assert attachment.modified > modified
+    flat = AttachmentFlat.objects.get(attachment=attachment)
+    assert flat.preview_link == attachment.preview_link
+
+
+def test_save_queues_preview(settings, django_capture_on_commit_callbacks):
+    settings.ATTACHMENT_PREVIEW_ENABLED = True
+    with patch("unicef_attachments.previews.queue_preview") as mock_queue:
+        with django_capture_on_commit_callbacks(execute=True):
+            attachment = AttachmentFactory(file=image_file())
+            AttachmentFactory(file="test.pdf")
+    mock_queue.assert_called_once_with(attachment.pk)
+
+
+def test_save_previews_disabled(django_capture_on_commit_callbacks):
+    with patch("unicef_attachments.previews.queue_preview") as mock_queue:
+        with django_capture_on_commit_callbacks(execute=True):
+            AttachmentFactory(file=image_file())
+    mock_queue.assert_not_called()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_generate_attachment_previews_command():
+    attachment = AttachmentFactory(file=image_file())
+    AttachmentFactory(file="test.pdf")
+    call_command("generate_attachment_previews", workers=2, stdout=io.StringIO())
+    attachment = Attachment.objects.get(pk=attachment.pk)
+    assert attachment.preview.name == previews.get_preview_name(attachment.file.name)
@@ -5,8 +5,13 @@ from rest_framework.exceptions import ValidationError
 import pytest
 
 from tests.factories import AttachmentFactory, AttachmentFileTypeFactory, UserFactory
-from unicef_attachments.models import Attachment
-from unicef_attachments.serializers import Base64AttachmentSerializer
+from unicef_attachments.models import Attachment, AttachmentFlat
+from unicef_attachments.serializers import (
+    AttachmentFlatSerializer,
+    AttachmentLinkSerializer,
+    Base64AttachmentSerializer,
+    ValuesSerializer,
+)
 
 from demo.sample.serializers import AuthorOverrideSerializer, AuthorSerializer
 
@@ -180,3 +185,19 @@ def test_attachment_serializer_override(attachment_empty):
 
     attachment = Attachment.objects.get(pk=attachment_empty.pk)
     assert attachment.code
+
+
+def test_values_serializer(author, user):
+    file_type = AttachmentFileTypeFactory()
+    AttachmentFactory(content_object=author, file="test.pdf", file_type=file_type, uploaded_by=user)
+    AttachmentFactory(hyperlink="https://example.com/sample.pdf")
+    AttachmentFactory(file="inactive.pdf", is_active=False)
+    queryset = AttachmentFlat.objects.order_by("pk")
+    values_serializer = ValuesSerializer(AttachmentFlatSerializer)
+    assert values_serializer.supported
+    assert values_serializer.serialize(queryset) == AttachmentFlatSerializer(queryset, many=True).data
+
+
+def test_values_serializer_unsupported():
+    assert not ValuesSerializer(AttachmentLinkSerializer).supported
+    assert not ValuesSerializer(Base64AttachmentSerializer).supported
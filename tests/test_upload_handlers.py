@@ -0,0 +1,65 @@
+import hashlib
+import io
+
+from django.core.files.uploadhandler import StopUpload
+
+import pytest
+
+from unicef_attachments.upload_handlers import InspectingUploadHandler
+from unicef_attachments.uploads import LimitedStream, UploadTooLarge
+
+
+def start_file(handler, name="sample.txt"):
+    handler.new_file("file", name, "text/plain", None)
+    return handler.inspections["file"]
+
+
+def test_handler_inspects_chunks():
+    handler = InspectingUploadHandler()
+    inspection = start_file(handler)
+    assert handler.receive_data_chunk(b"hello ", 0) == b"hello "
+    assert handler.receive_data_chunk(b"world!", 6) == b"world!"
+    assert handler.file_complete(12) is None
+    assert inspection.as_values() == {
+        "checksum": hashlib.sha256(b"hello world!").hexdigest(),
+        "file_size": 12,
+        "mime_type": "text/plain",
+    }
+
+
+def test_handler_sniffs_first_bytes(settings):
+    settings.ATTACHMENT_INVALID_FILE_TYPES = ["text/plain"]
+    handler = InspectingUploadHandler()
+    inspection = start_file(handler)
+    with pytest.raises(StopUpload):
+        handler.receive_data_chunk(b"x" * handler.validator.mime_lookup_length, 0)
+    assert inspection.errors == ["Unsupported file type: text/plain."]
+    assert inspection.size == handler.validator.mime_lookup_length
+
+
+def test_handler_sniffs_small_file_on_complete(settings):
+    settings.ATTACHMENT_INVALID_FILE_TYPES = ["text/plain"]
+    handler = InspectingUploadHandler()
+    inspection = start_file(handler)
+    handler.receive_data_chunk(b"small", 0)
+    with pytest.raises(StopUpload):
+        handler.file_complete(5)
+    assert inspection.errors
+
+
+def test_handler_max_size(settings):
+    settings.ATTACHMENT_MAX_UPLOAD_SIZE = 8
+    handler = InspectingUploadHandler()
+    inspection = start_file(handler)
+    handler.receive_data_chunk(b"1234", 0)
+    with pytest.raises(StopUpload):
+        handler.receive_data_chunk(b"56789", 4)
+    assert inspection.errors == ["File is larger than the maximum of 8 bytes."]
+
+
+def test_limited_stream():
+    stream = LimitedStream(io.BytesIO(b"0123456789"), max_size=8)
+    assert stream.read(4) == b"0123"
+    with pytest.raises(UploadTooLarge):
+        stream.read(6)
+    assert LimitedStream(io.BytesIO(b"0123456789")).read() == b"0123456789"
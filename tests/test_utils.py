@@ -1,11 +1,23 @@
+import io
+import uuid
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
 from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import transaction
 
 import pytest
+from unittest.mock import patch
 
-from tests.factories import AttachmentFactory, AttachmentFileTypeFactory
+from tests.factories import AttachmentFactory, AttachmentFileTypeFactory, BookFactory
 from unicef_attachments import utils
-from unicef_attachments.models import AttachmentFlat, FileType
+from unicef_attachments.models import Attachment, AttachmentFlat, default_file_path, FileType, sharded_file_path
 from unicef_attachments.permissions import AttachmentPermissions
+from unicef_attachments.previews import get_preview_name
 
 from demo.sample.models import AttachmentFlatOverride
 from demo.sample.permissions import AttachmentPermOverride
@@ -74,6 +86,22 @@ def test_get_denormalize_func_invalid(settings):
         utils.get_denormalize_func()
 
 
+def test_denormalize_many(settings, book):
+    attachments = AttachmentFactory.create_batch(2, content_object=book, file="many.pdf")
+    with patch.object(utils, "denormalize_attachments", return_value=[]) as denormalize_attachments:
+        utils.denormalize_many(attachments)
+    denormalize_attachments.assert_called_once_with(attachments)
+
+    settings.ATTACHMENT_DENORMALIZE_FUNC = "demo.sample.utils.denormalize"
+    AttachmentFlat.objects.update(object_link="stale", filename="stale.pdf")
+    flats = utils.denormalize_many(attachments)
+    assert [flat.attachment_id for flat in flats] == [attachment.pk for attachment in attachments]
+    for flat in AttachmentFlat.objects.filter(attachment__in=attachments):
+        assert flat.object_link == book.get_object_url()
+        # the custom function only sets the object link
+        assert flat.filename == "stale.pdf"
+
+
 def test_get_matching_key(file_type):
     key = (file_type.label.lower(), file_type.name.lower())
 
@@ -118,15 +146,258 @@ def test_cleanup_file_types():
 
     attachment_1.refresh_from_db()
     assert attachment_1.file_type == file_type_1
+    modified = attachment_2.modified
     attachment_2.refresh_from_db()
     assert attachment_2.file_type == file_type_1
+    assert attachment_2.modified > modified
     attachment_3.refresh_from_db()
     assert attachment_3.file_type == file_type_3
     attachment_4.refresh_from_db()
     assert attachment_4.file_type == file_type_1
+    assert AttachmentFlat.objects.get(attachment=attachment_4).file_type == "Other"
 
     assert not FileType.objects.filter(pk=file_type_2.pk).exists()
     assert not FileType.objects.filter(pk=file_type_4.pk).exists()
 
     file_type_1.refresh_from_db()
     assert file_type_1.group == ["ft2", "ft4"]
+
+
+def test_get_object_links(author, book):
+    attachment_author = AttachmentFactory(content_object=author)
+    attachment_book = AttachmentFactory(content_object=book)
+    attachment_empty = AttachmentFactory()
+    assert utils.get_object_links([attachment_author, attachment_book, attachment_empty]) == {
+        attachment_author.pk: "",
+        attachment_book.pk: book.get_object_url(),
+    }
+
+
+def test_denormalize_attachments(django_assert_num_queries, author, book, user):
+    file_type = AttachmentFileTypeFactory(label="Book Cover")
+    attachments = [
+        AttachmentFactory(content_object=book, file="cover.pdf", file_type=file_type, uploaded_by=user),
+        AttachmentFactory(content_object=author, file="author.pdf"),
+    ]
+    AttachmentFlat.objects.filter(attachment=attachments[0]).update(file_type="Stale")
+    AttachmentFlat.objects.filter(attachment=attachments[1]).delete()
+
+    attachments = list(Attachment.objects.filter(pk__in=[a.pk for a in attachments]))
+    # file types, users, flats, content object per model, savepoint, update, create
+    with django_assert_num_queries(9):
+        utils.denormalize_attachments(attachments)
+
+    flat = AttachmentFlat.objects.get(attachment=attachments[0])
+    assert flat.file_type == "Book Cover"
+    assert flat.object_link == book.get_object_url()
+    assert flat.uploaded_by == user.get_full_name()
+    assert flat.filename == "cover.pdf"
+    flat = AttachmentFlat.objects.get(attachment=attachments[1])
+    assert flat.file_link == attachments[1].file_link
+    assert flat.object_link == ""
+
+
+def test_get_filepath_strategy_func_default():
+    assert utils.get_filepath_strategy_func() == default_file_path
+
+
+def test_get_filepath_strategy_func_override(settings):
+    settings.ATTACHMENT_FILEPATH_STRATEGY = "unicef_attachments.models.sharded_file_path"
+    assert utils.get_filepath_strategy_func() == sharded_file_path
+
+
+def test_get_filepath_strategy_func_invalid(settings):
+    settings.ATTACHMENT_FILEPATH_STRATEGY = "demo.wrong.file_path"
+    with pytest.raises(ImproperlyConfigured):
+        utils.get_filepath_strategy_func()
+
+
+def test_relocate_attachment_file(settings):
+    attachment = AttachmentFactory(file=SimpleUploadedFile("relocate.txt", b"relocate me"))
+    assert utils.relocate_attachment_file(attachment) == []
+
+    settings.ATTACHMENT_FILEPATH_STRATEGY = "unicef_attachments.models.sharded_file_path"
+    old_name = attachment.file.name
+    attachment.preview.save(get_preview_name(old_name), ContentFile(b"preview"), save=False)
+    old_preview = attachment.preview.name
+    replaced = utils.relocate_attachment_file(attachment)
+    assert [name for __, name in replaced] == [old_name, old_preview]
+    assert attachment.file.name.startswith("files/unknown/tmp/")
+    assert attachment.file.name != old_name
+    assert attachment.preview.name == get_preview_name(attachment.file.name)
+    # replaced files are kept until the new names are committed
+    assert attachment.file.storage.exists(old_name)
+    with attachment.file.open("rb") as source:
+        assert source.read() == b"relocate me"
+    with attachment.preview.open("rb") as source:
+        assert source.read() == b"preview"
+
+    utils.delete_relocated_files(replaced)
+    assert not attachment.file.storage.exists(old_name)
+    assert not attachment.preview.storage.exists(old_preview)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_relocate_attachment_files_command(settings):
+    filename = "{}.txt".format(uuid.uuid4().hex)
+    attachment = AttachmentFactory(file=SimpleUploadedFile(filename, b"relocate me"))
+    settings.ATTACHMENT_FILEPATH_STRATEGY = "unicef_attachments.models.sharded_file_path"
+    old_name = attachment.file.name
+    call_command("relocate_attachment_files", workers=2, batch_size=1, stdout=io.StringIO())
+    attachment.refresh_from_db()
+    assert attachment.file.name == sharded_file_path(attachment, filename)
+    assert not attachment.file.storage.exists(old_name)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_relocate_attachment_files_command_failed_batch(settings):
+    filename = "{}.txt".format(uuid.uuid4().hex)
+    attachment = AttachmentFactory(file=SimpleUploadedFile(filename, b"relocate me"))
+    old_name = attachment.file.name
+    settings.ATTACHMENT_FILEPATH_STRATEGY = "unicef_attachments.models.sharded_file_path"
+    with patch(
+        "unicef_attachments.management.commands.relocate_attachment_files.denormalize_many",
+        side_effect=RuntimeError,
+    ):
+        with pytest.raises(RuntimeError):
+            call_command("relocate_attachment_files", workers=2, batch_size=1, stdout=io.StringIO())
+    attachment.refresh_from_db()
+    assert attachment.file.name == old_name
+    assert attachment.file.storage.exists(old_name)
+    assert AttachmentFlat.objects.get(attachment=attachment).file_link == attachment.file_link
+
+
+def test_denormalize_attachment_skips_unchanged(django_assert_num_queries, author):
+    attachment = AttachmentFactory(content_object=author, file="test.pdf")
+    utils.denormalize_stats.reset()
+    # flat lookup only, no write
+    with django_assert_num_queries(1):
+        flat = utils.denormalize_attachment(attachment)
+    assert flat.filename == "test.pdf"
+    assert utils.denormalize_stats.as_dict() == {"written": 0, "skipped": 1}
+
+    attachment.file = "changed.pdf"
+    attachment.save()
+    assert AttachmentFlat.objects.get(attachment=attachment).filename == "changed.pdf"
+    assert utils.denormalize_stats.as_dict() == {"written": 1, "skipped": 1}
+
+
+def test_denormalize_attachments_skips_unchanged(author):
+    attachments = [
+        AttachmentFactory(content_object=author, file="first.pdf"),
+        AttachmentFactory(content_object=author, file="second.pdf"),
+    ]
+    AttachmentFlat.objects.filter(attachment=attachments[0]).update(filename="stale.pdf")
+    utils.denormalize_stats.reset()
+    flats = utils.denormalize_attachments(attachments)
+    assert len(flats) == 2
+    assert utils.denormalize_stats.as_dict() == {"written": 1, "skipped": 1}
+    assert AttachmentFlat.objects.get(attachment=attachments[0]).filename == "first.pdf"
+
+
+def test_get_file_url_cache_timeout(settings):
+    storage = FileSystemStorage()
+    assert utils.get_file_url_cache_timeout(storage) == 0
+    storage.querystring_expire = 3600
+    assert utils.get_file_url_cache_timeout(storage) == 3540
+    settings.ATTACHMENT_URL_CACHE_TIMEOUT = 10
+    assert utils.get_file_url_cache_timeout(storage) == 10
+
+
+def test_get_file_url_cached(settings):
+    settings.ATTACHMENT_URL_CACHE_TIMEOUT = 60
+    cache.clear()
+    attachment = AttachmentFactory(file="cached.pdf")
+    with patch.object(FileSystemStorage, "url", side_effect=["/signed/1", "/signed/2", "/signed/3"]) as mock_url:
+        assert utils.get_file_url(attachment) == "/signed/1"
+        assert utils.get_file_url(attachment) == "/signed/1"
+        attachment.file = "changed.pdf"
+        assert utils.get_file_url(attachment) == "/signed/2"
+    assert mock_url.call_count == 2
+
+
+def test_get_file_url_not_cached():
+    attachment = AttachmentFactory(file="cached.pdf")
+    assert utils.get_file_url(attachment) == attachment.file.url
+    attachment = AttachmentFactory(hyperlink="https://example.com/sample.pdf")
+    assert utils.get_file_url(attachment) == "https://example.com/sample.pdf"
+    assert utils.get_file_url(attachment, "preview") == ""
+
+
+def test_reassign_attachments():
+    source, target = BookFactory.create_batch(2)
+    content_type = ContentType.objects.get_for_model(source)
+    moved = AttachmentFactory(content_object=source, code="book-cover", file="cover.pdf")
+    other = AttachmentFactory(content_object=source, code="book-spine", file="spine.pdf")
+
+    attachments = utils.reassign_attachments(content_type, source.pk, content_type, target.pk, code="book-cover")
+    assert [attachment.pk for attachment in attachments] == [moved.pk]
+    moved.refresh_from_db()
+    other.refresh_from_db()
+    assert moved.content_object == target
+    assert other.content_object == source
+    assert AttachmentFlat.objects.get(attachment=moved).object_link == target.get_object_url()
+
+    attachments = utils.reassign_attachments(content_type, source.pk, content_type, target.pk)
+    assert [attachment.pk for attachment in attachments] == [other.pk]
+    assert utils.reassign_attachments(content_type, source.pk, content_type, target.pk) == []
+
+
+def test_reassign_attachments_denormalize_func(settings):
+    settings.ATTACHMENT_DENORMALIZE_FUNC = "demo.sample.utils.denormalize"
+    source, target = BookFactory.create_batch(2)
+    content_type = ContentType.objects.get_for_model(source)
+    attachment = AttachmentFactory(content_object=source, file="cover.pdf")
+    with patch("demo.sample.utils.get_object_link", return_value="custom") as get_object_link:
+        utils.reassign_attachments(content_type, source.pk, content_type, target.pk)
+    assert get_object_link.call_args[0][0].content_object == target
+    assert AttachmentFlat.objects.get(attachment=attachment).object_link == "custom"
+
+
+def test_reassign_attachments_relocate(django_capture_on_commit_callbacks):
+    source, target = BookFactory.create_batch(2)
+    content_type = ContentType.objects.get_for_model(source)
+    filename = "{}.txt".format(uuid.uuid4().hex)
+    attachment = AttachmentFactory(content_object=source, code="book-cover", file=SimpleUploadedFile(filename, b"move"))
+    attachment.preview.save(get_preview_name(attachment.file.name), ContentFile(b"preview"))
+    old_name, old_preview = attachment.file.name, attachment.preview.name
+
+    with django_capture_on_commit_callbacks(execute=True):
+        utils.reassign_attachments(content_type, source.pk, content_type, target.pk, relocate=True)
+        assert attachment.file.storage.exists(old_name)
+    attachment.refresh_from_db()
+    assert attachment.file.name == default_file_path(attachment, filename)
+    assert attachment.preview.name == get_preview_name(attachment.file.name)
+    assert not attachment.file.storage.exists(old_name)
+    assert not attachment.preview.storage.exists(old_preview)
+    assert AttachmentFlat.objects.get(attachment=attachment).file_link == attachment.file_link
+
+
+def test_reassign_attachments_relocate_rollback():
+    source, target = BookFactory.create_batch(2)
+    content_type = ContentType.objects.get_for_model(source)
+    filename = "{}.txt".format(uuid.uuid4().hex)
+    attachment = AttachmentFactory(content_object=source, code="book-cover", file=SimpleUploadedFile(filename, b"keep"))
+    old_name = attachment.file.name
+
+    with pytest.raises(RuntimeError):
+        with transaction.atomic():
+            utils.reassign_attachments(content_type, source.pk, content_type, target.pk, relocate=True)
+            raise RuntimeError()
+    attachment.refresh_from_db()
+    assert attachment.file.name == old_name
+    assert attachment.content_object == source
+    with attachment.file.open("rb") as stored:
+        assert stored.read() == b"keep"
+
+
+def test_denormalize_attachment_custom_flat_model(settings, author):
+    settings.ATTACHMENT_FLAT_MODEL = "demo.sample.models.AttachmentFlatOverride"
+    attachment = AttachmentFactory(content_object=author, file="custom.pdf")
+    flat = AttachmentFlatOverride.objects.get(attachment=attachment)
+    assert flat.object_link == ""
+
+    attachment.file = "changed.pdf"
+    attachment.save()
+    assert AttachmentFlatOverride.objects.filter(attachment=attachment).count() == 1
+    assert utils.get_attachment_flat(attachment) == flat
@@ -1,12 +1,38 @@
+import base64
+import hashlib
+import io
+import zipfile
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
 from django.contrib.contenttypes.models import ContentType
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connections
+from django.test import AsyncClient, Client
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
+from rest_framework.test import APIRequestFactory, force_authenticate
 
 import pytest
 from unittest.mock import Mock, patch
 
-from tests.factories import AttachmentFactory, AttachmentFileTypeFactory
+from tests.factories import (
+    AttachmentFactory,
+    AttachmentFileTypeFactory,
+    AttachmentLinkFactory,
+    BookFactory,
+    UserFactory,
+)
 from unicef_attachments.models import Attachment, AttachmentLink
+from unicef_attachments.permissions import AttachmentPermissions
+from unicef_attachments.routing import PRIMARY_COOKIE_NAME
+from unicef_attachments.streaming import parse_range_header
+from unicef_attachments.uploads import create_upload_token, get_upload_key
+from unicef_attachments.views import AttachmentUpdateView
+
+from demo.sample.permissions import OwnAttachmentPermissions
 
 pytestmark = pytest.mark.django_db
 
@@ -142,6 +168,26 @@ def test_attachment_create_post(client, upload_file, user, headers):
     assert attachment.file_type is None
 
 
+def test_attachment_create_post_inspection(client, upload_file, user, headers):
+    client.force_login(user)
+    response = client.post(reverse("attachments:create"), data={"file": upload_file}, **headers)
+    assert response.status_code == status.HTTP_200_OK
+    attachment = Attachment.objects.get(pk=response.json()["id"])
+    assert attachment.checksum == hashlib.sha256(b"hello world!").hexdigest()
+    assert attachment.file_size == 12
+    assert attachment.mime_type == "text/plain"
+
+
+def test_attachment_create_post_too_large(client, user, headers, settings):
+    settings.ATTACHMENT_MAX_UPLOAD_SIZE = 10
+    client.force_login(user)
+    upload_file = SimpleUploadedFile("large.txt", b"x" * 11)
+    response = client.post(reverse("attachments:create"), data={"file": upload_file}, **headers)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json() == {"file": ["File is larger than the maximum of 10 bytes."]}
+    assert not Attachment.objects.exists()
+
+
 def test_attachment_single_file_field(client, author, user):
     file_type = AttachmentFileTypeFactory(code="author_profile_image")
     attachment = AttachmentFactory(
@@ -227,3 +273,698 @@ def test_attachment_link_delete(client, attachment_link, user):
     )
     assert response.status_code == status.HTTP_204_NO_CONTENT
     assert not attachment_link_qs.exists()
+
+
+def test_attachment_batch_list(client, attachment, attachment_link, author, book, user):
+    client.force_login(user)
+    other = AttachmentFactory(content_object=author, file="other.pdf")
+    content_type = ContentType.objects.get_for_model(author)
+    url = reverse("attachments:batch", args=[content_type.app_label, content_type.model])
+    response = client.get("{}?ids={},404".format(url, author.pk))
+    assert response.status_code == status.HTTP_200_OK
+    data = response.json()
+    assert sorted(data.keys()) == sorted([str(author.pk), "404"])
+    assert [a["id"] for a in data[str(author.pk)]["attachments"]] == [attachment.pk, other.pk]
+    assert data[str(author.pk)]["links"] == []
+    assert data["404"] == {"attachments": [], "links": []}
+
+    content_type = ContentType.objects.get_for_model(book)
+    response = client.get(
+        "{}?ids={}".format(reverse("attachments:batch", args=[content_type.app_label, content_type.model]), book.pk)
+    )
+    data = response.json()
+    assert [link["id"] for link in data[str(book.pk)]["links"]] == [attachment_link.pk]
+
+
+def test_attachment_batch_list_invalid_ids(client, author, user):
+    client.force_login(user)
+    content_type = ContentType.objects.get_for_model(author)
+    url = reverse("attachments:batch", args=[content_type.app_label, content_type.model])
+    response = client.get("{}?ids=1,a".format(url))
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_attachment_batch_list_not_found_content_type(client, user):
+    client.force_login(user)
+    response = client.get("{}?ids=1".format(reverse("attachments:batch", args=["sample", "wrong"])))
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_attachment_zip(client, author, file_type, user):
+    client.force_login(user)
+    first = AttachmentFactory(
+        content_object=author,
+        file=SimpleUploadedFile("report.txt", b"first report"),
+        code="reports",
+        file_type=file_type,
+    )
+    second = AttachmentFactory(
+        content_object=author,
+        file=SimpleUploadedFile("report.txt", b"second report"),
+        code="reports",
+    )
+    AttachmentFactory(content_object=author, file=SimpleUploadedFile("old.txt", b"old"), is_active=False)
+    AttachmentFactory(content_object=author, hyperlink="https://example.com/sample.pdf")
+    AttachmentFactory(content_object=author, file=SimpleUploadedFile("other.txt", b"other"), code="other")
+
+    content_type = ContentType.objects.get_for_model(author)
+    url = reverse("attachments:zip", args=[content_type.app_label, content_type.model, author.pk])
+    response = client.get("{}?code=reports".format(url))
+    assert response.status_code == status.HTTP_200_OK
+    assert response["Content-Type"] == "application/zip"
+    archive = zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content)))
+    assert archive.namelist() == [first.filename, second.filename]
+    assert archive.read(first.filename) == b"first report"
+
+    response = client.get("{}?file_type={}".format(url, file_type.pk))
+    archive = zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content)))
+    assert archive.namelist() == [first.filename]
+
+    response = client.get(url)
+    archive = zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content)))
+    assert len(archive.namelist()) == 3
+
+
+def test_attachment_zip_forbidden(client, author):
+    content_type = ContentType.objects.get_for_model(author)
+    response = client.get(reverse("attachments:zip", args=[content_type.app_label, content_type.model, author.pk]))
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+def test_attachment_zip_invalid_file_type(client, author, user):
+    client.force_login(user)
+    content_type = ContentType.objects.get_for_model(author)
+    url = reverse("attachments:zip", args=[content_type.app_label, content_type.model, author.pk])
+    response = client.get("{}?file_type=wrong".format(url))
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_attachment_preview_redirect(client, attachment, user):
+    attachment.preview = "test.preview.png"
+    attachment.save()
+    client.force_login(user)
+    response = client.get(reverse("attachments:preview", args=[attachment.pk]))
+    assert response.status_code == status.HTTP_302_FOUND
+
+
+def test_attachment_preview_not_found(client, attachment, user):
+    client.force_login(user)
+    response = client.get(reverse("attachments:preview", args=[attachment.pk]))
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_attachment_list_get_inactive(client, attachment, user):
+    Attachment.objects.filter(pk=attachment.pk).deactivate()
+    client.force_login(user)
+    response = client.get(reverse("attachments:list"))
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == []
+
+
+def test_attachment_file_inactive(client, attachment, user):
+    Attachment.objects.filter(pk=attachment.pk).deactivate()
+    client.force_login(user)
+    response = client.get(reverse("attachments:file", args=[attachment.pk]))
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_attachment_link_list_inactive(client, book, attachment_link, user):
+    Attachment.objects.filter(pk=attachment_link.attachment.pk).deactivate()
+    client.force_login(user)
+    content_type = ContentType.objects.get_for_model(book)
+    response = client.get(reverse("attachments:link", args=[content_type.app_label, content_type.model, book.pk]))
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == []
+
+
+def test_attachment_single_file_field_inactive(client, author, user):
+    file_type = AttachmentFileTypeFactory(code="author_profile_image")
+    attachment = AttachmentFactory(content_object=author, file_type=file_type, code=file_type.code, file="test.pdf")
+    AttachmentFactory(
+        content_object=author,
+        file_type=file_type,
+        code=file_type.code,
+        file="inactive.pdf",
+        is_active=False,
+    )
+    client.force_login(user)
+    response = client.get(reverse("sample:author-detail", args=[author.pk]))
+    assert response.json()["profile_image"].endswith(attachment.file.name)
+
+
+def async_client_for(client, user):
+    """Async client sharing the session of a logged in client"""
+    client.force_login(user)
+    async_client = AsyncClient()
+    async_client.cookies = client.cookies
+    return async_client
+
+
+def test_async_attachment_file_redirect(client, attachment, user):
+    async_client = async_client_for(client, user)
+    response = async_to_sync(async_client.get)(reverse("attachments:file-async", args=[attachment.pk]))
+    assert response.status_code == status.HTTP_302_FOUND
+    assert response.url.endswith(attachment.file.url)
+
+
+def test_async_attachment_file_not_found(client, attachment_blank, user):
+    async_client = async_client_for(client, user)
+    response = async_to_sync(async_client.get)(reverse("attachments:file-async", args=[404]))
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    response = async_to_sync(async_client.get)(reverse("attachments:file-async", args=[attachment_blank.pk]))
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_async_attachment_file_forbidden(attachment):
+    response = async_to_sync(AsyncClient().get)(reverse("attachments:file-async", args=[attachment.pk]))
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+def basic_auth(user, password="secret", key="authorization"):
+    # AsyncClient takes plain header names, Client takes WSGI environ keys
+    credentials = base64.b64encode("{}:{}".format(user.username, password).encode("utf-8")).decode("ascii")
+    return {key: "Basic {}".format(credentials)}
+
+
+@pytest.fixture
+def basic_auth_user(user):
+    user.set_password("secret")
+    user.save()
+    return user
+
+
+def test_async_attachment_file_authentication_classes(attachment, basic_auth_user):
+    url = reverse("attachments:file-async", args=[attachment.pk])
+    response = async_to_sync(AsyncClient().get)(url, **basic_auth(basic_auth_user))
+    assert response.status_code == status.HTTP_302_FOUND
+    # same response as the sync view
+    headers = basic_auth(basic_auth_user, key="HTTP_AUTHORIZATION")
+    assert Client().get(reverse("attachments:file", args=[attachment.pk]), **headers).status_code == 302
+
+    response = async_to_sync(AsyncClient().get)(url, **basic_auth(basic_auth_user, "other"))
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+    response = async_to_sync(AsyncClient().get)(url, authorization="Basic bad")
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+    assert "detail" in response.json()
+
+
+def test_async_attachment_create_post_authentication_classes(upload_file, basic_auth_user):
+    response = async_to_sync(AsyncClient().post)(
+        reverse("attachments:create-async"),
+        data={"file": upload_file},
+        **basic_auth(basic_auth_user),
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert Attachment.objects.get(pk=response.json()["id"]).uploaded_by == basic_auth_user
+
+
+def test_async_attachment_create_post_csrf(client, upload_file, basic_auth_user):
+    url = reverse("attachments:create-async")
+    async_client = AsyncClient(enforce_csrf_checks=True)
+    response = async_to_sync(async_client.post)(url, data={"file": upload_file}, **basic_auth(basic_auth_user))
+    assert response.status_code == status.HTTP_200_OK
+
+    # session authentication still requires the token
+    client.force_login(basic_auth_user)
+    async_client.cookies = client.cookies
+    upload_file.seek(0)
+    response = async_to_sync(async_client.post)(url, data={"file": upload_file})
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+    assert "CSRF" in response.json()["detail"]
+
+
+def test_async_attachment_create_post(client, upload_file, user):
+    async_client = async_client_for(client, user)
+    response = async_to_sync(async_client.post)(reverse("attachments:create-async"), data={"file": upload_file})
+    assert response.status_code == status.HTTP_200_OK
+    data = response.json()
+    attachment = Attachment.objects.get(pk=data["id"])
+    assert attachment.uploaded_by == user
+    assert data["file_link"] == attachment.file_link
+    assert data["filename"] == attachment.filename
+
+
+def test_async_attachment_create_post_invalid_type(client, upload_file, user):
+    async_client = async_client_for(client, user)
+    mock_magic = Mock()
+    mock_magic.from_buffer.return_value = "text/x-python"
+    with patch("unicef_attachments.validators.magic.Magic", Mock(return_value=mock_magic)):
+        response = async_to_sync(async_client.post)(reverse("attachments:create-async"), data={"file": upload_file})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json() == {"file": ["Unsupported file type: text/x-python."]}
+    assert not Attachment.objects.exists()
+
+
+def test_async_attachment_create_post_inspection(client, upload_file, user):
+    async_client = async_client_for(client, user)
+    response = async_to_sync(async_client.post)(reverse("attachments:create-async"), data={"file": upload_file})
+    assert response.status_code == status.HTTP_200_OK
+    attachment = Attachment.objects.get(pk=response.json()["id"])
+    assert attachment.checksum == hashlib.sha256(b"hello world!").hexdigest()
+    assert attachment.file_size == 12
+    assert attachment.mime_type == "text/plain"
+
+
+def test_async_attachment_create_post_no_file(client, user):
+    async_client = async_client_for(client, user)
+    response = async_to_sync(async_client.post)(reverse("attachments:create-async"), data={})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_attachment_upload_token_flow(client, user):
+    client.force_login(user)
+    response = client.post(reverse("attachments:upload-token"), data={"filename": "direct.txt"})
+    assert response.status_code == status.HTTP_201_CREATED
+    data = response.json()
+    assert data["path"].startswith("files/unknown/tmp/")
+    assert data["path"].endswith("/direct.txt")
+
+    receive_url = reverse("attachments:upload-receive", args=[data["token"]])
+    assert data["upload_url"].endswith(receive_url)
+    response = Client().put(receive_url, data=b"uploaded directly", content_type="text/plain")
+    assert response.status_code == status.HTTP_201_CREATED
+    assert response.json()["path"] == data["path"]
+
+    response = Client().put(receive_url, data=b"again", content_type="text/plain")
+    assert response.status_code == status.HTTP_409_CONFLICT
+
+    response = client.post(reverse("attachments:upload-finalize"), data={"token": data["token"]})
+    assert response.status_code == status.HTTP_200_OK
+    attachment = Attachment.objects.get(pk=response.json()["id"])
+    assert attachment.file.name == data["path"]
+    assert attachment.upload_key == get_upload_key(data["path"])
+    assert attachment.uploaded_by == user
+    with attachment.file.open("rb") as source:
+        assert source.read() == b"uploaded directly"
+
+    response = client.post(reverse("attachments:upload-finalize"), data={"token": data["token"]})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_attachment_upload_receive_too_large(settings, user):
+    settings.ATTACHMENT_MAX_UPLOAD_SIZE = 8
+    token, path = create_upload_token(user, "large.txt")
+    receive_url = reverse("attachments:upload-receive", args=[token])
+    response = Client().put(receive_url, data=b"larger than allowed", content_type="text/plain")
+    assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    assert not Attachment.file.field.storage.exists(path)
+
+    response = Client().put(receive_url, data=b"allowed", content_type="text/plain")
+    assert response.status_code == status.HTTP_201_CREATED
+
+
+def test_attachment_upload_receive_invalid_token():
+    response = Client().put(
+        reverse("attachments:upload-receive", args=["invalid:token"]),
+        data=b"bytes",
+        content_type="text/plain",
+    )
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+def test_attachment_upload_finalize_not_uploaded(client, user):
+    client.force_login(user)
+    token, path = create_upload_token(user, "missing.txt")
+    response = client.post(reverse("attachments:upload-finalize"), data={"token": token})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json() == {"token": ["File has not been uploaded."]}
+
+
+def test_attachment_upload_finalize_other_user(client, user, superuser):
+    client.force_login(user)
+    token, path = create_upload_token(superuser, "other.txt")
+    response = client.post(reverse("attachments:upload-finalize"), data={"token": token})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json() == {"token": ["Invalid upload token."]}
+
+
+def test_attachment_upload_finalize_invalid_type(client, user):
+    client.force_login(user)
+    token, path = create_upload_token(user, "script.py")
+    Client().put(reverse("attachments:upload-receive", args=[token]), data=b"print(1)", content_type="text/plain")
+    storage = Attachment.file.field.storage
+    assert storage.exists(path)
+    mock_magic = Mock()
+    mock_magic.from_buffer.return_value = "text/x-python"
+    with patch("unicef_attachments.validators.magic.Magic", Mock(return_value=mock_magic)):
+        response = client.post(reverse("attachments:upload-finalize"), data={"token": token})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json() == {"token": ["Unsupported file type: text/x-python."]}
+    assert not storage.exists(path)
+
+
+@pytest.fixture
+def no_feed_lag(settings):
+    settings.ATTACHMENT_FEED_LAG = 0
+
+
+def test_attachment_feed_lag(client, user, settings):
+    settings.ATTACHMENT_FEED_LAG = 60
+    old, recent = AttachmentFactory.create_batch(2, file="feed.pdf")
+    Attachment.objects.filter(pk=old.pk).update(modified=timezone.now() - timedelta(minutes=5))
+    client.force_login(user)
+    data = client.get(reverse("attachments:feed")).json()
+    assert [change["id"] for change in data["changes"]] == [old.pk]
+
+    # the cursor stays behind the held back change
+    settings.ATTACHMENT_FEED_LAG = 0
+    data = client.get(reverse("attachments:feed"), data={"cursor": data["cursor"]}).json()
+    assert [change["id"] for change in data["changes"]] == [recent.pk]
+
+
+def test_attachment_feed(client, user, no_feed_lag):
+    client.force_login(user)
+    first, second, third = AttachmentFactory.create_batch(3, file="feed.pdf")
+    url = reverse("attachments:feed")
+
+    response = client.get(url, data={"limit": 2})
+    assert response.status_code == status.HTTP_200_OK
+    data = response.json()
+    assert [change["id"] for change in data["changes"]] == [first.pk, second.pk]
+    assert data["changes"][0]["flat"]["filename"] == "feed.pdf"
+    assert data["changes"][0]["attachment"]["filename"] == "feed.pdf"
+    assert data["more"]
+
+    Attachment.objects.filter(pk=first.pk).deactivate()
+    second_pk = second.pk
+    second.delete()
+    response = client.get(url, data={"cursor": data["cursor"]})
+    data = response.json()
+    assert [change["id"] for change in data["changes"]] == [third.pk]
+    assert [(tombstone["id"], tombstone["reason"]) for tombstone in data["tombstones"]] == [
+        (first.pk, "deactivated"),
+        (second_pk, "deleted"),
+    ]
+    assert not data["more"]
+
+    response = client.get(url, data={"cursor": data["cursor"]})
+    data_after = response.json()
+    assert data_after["changes"] == data_after["tombstones"] == []
+    assert data_after["cursor"] == data["cursor"]
+
+
+@pytest.mark.parametrize("count", [5, 20])
+def test_attachment_feed_num_queries(client, user, file_type, count, no_feed_lag, django_assert_num_queries):
+    AttachmentFactory.create_batch(count, file="feed.pdf", file_type=file_type, uploaded_by=user)
+    client.force_login(user)
+    # session, user, attachments, tombstones, flat rows
+    with django_assert_num_queries(5):
+        response = client.get(reverse("attachments:feed"))
+    assert len(response.json()["changes"]) == count
+    assert response.json()["changes"][0]["flat"]["file_type_id"] == file_type.pk
+
+
+def test_attachment_feed_invalid_cursor(client, user):
+    client.force_login(user)
+    response = client.get(reverse("attachments:feed"), data={"cursor": "invalid"})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert "cursor" in response.json()
+
+
+def test_attachment_feed_forbidden(client):
+    response = client.get(reverse("attachments:feed"))
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+def test_attachment_reassign(client, user):
+    source, target = BookFactory.create_batch(2)
+    attachments = AttachmentFactory.create_batch(2, content_object=source, code="book-cover", file="cover.pdf")
+    client.force_login(user)
+    response = client.post(
+        reverse("attachments:reassign", args=["sample", "book", source.pk]),
+        data={"target": target.pk},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {"reassigned": 2}
+    for attachment in attachments:
+        attachment.refresh_from_db()
+        assert attachment.object_id == target.pk
+
+
+def test_attachment_reassign_invalid_target(client, book, user):
+    client.force_login(user)
+    response = client.post(
+        reverse("attachments:reassign", args=["sample", "book", book.pk]),
+        data={"target": 0},
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert "target" in response.json()
+
+
+@pytest.fixture
+def own_attachment_permissions():
+    with patch.object(AttachmentPermissions, "filter_queryset", OwnAttachmentPermissions.filter_queryset):
+        yield
+
+
+def test_attachment_list_permission_filter(client, user, own_attachment_permissions):
+    own = AttachmentFactory(file="own.pdf", uploaded_by=user)
+    AttachmentFactory(file="other.pdf", uploaded_by=UserFactory())
+    client.force_login(user)
+    response = client.get(reverse("attachments:list"))
+    assert response.status_code == status.HTTP_200_OK
+    assert [row["attachment"] for row in response.json()] == [own.pk]
+
+
+def test_attachment_link_list_permission_filter(client, book, user, own_attachment_permissions):
+    own = AttachmentFactory(file="own.pdf", uploaded_by=user)
+    other = AttachmentFactory(file="other.pdf", uploaded_by=UserFactory())
+    for attachment in [own, other]:
+        AttachmentLinkFactory(attachment=attachment, content_object=book)
+    client.force_login(user)
+    response = client.get(reverse("attachments:link", args=["sample", "book", book.pk]))
+    assert response.status_code == status.HTTP_200_OK
+    assert [row["attachment"] for row in response.json()] == [own.pk]
+
+
+def test_attachment_file_permission_filter(client, user, own_attachment_permissions):
+    own = AttachmentFactory(file="own.pdf", uploaded_by=user)
+    other = AttachmentFactory(file="other.pdf", uploaded_by=UserFactory())
+    client.force_login(user)
+    response = client.get(reverse("attachments:file", args=[own.pk]))
+    assert response.status_code == status.HTTP_302_FOUND
+    response = client.get(reverse("attachments:file", args=[other.pk]))
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_async_attachment_file_permission_filter(client, user, own_attachment_permissions):
+    other = AttachmentFactory(file="other.pdf", uploaded_by=UserFactory())
+    async_client = async_client_for(client, user)
+    response = async_to_sync(async_client.get)(reverse("attachments:file-async", args=[other.pk]))
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.fixture
+def read_database(settings):
+    settings.ATTACHMENT_READ_DATABASE = "replica"
+    return "replica"
+
+
+@pytest.mark.django_db(transaction=True, databases=["default", "replica"])
+def test_attachment_list_read_database(client, user, read_database):
+    AttachmentFactory(file="replicated.pdf")
+    client.force_login(user)
+    with CaptureQueriesContext(connections[read_database]) as replica_queries:
+        response = client.get(reverse("attachments:list"))
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.json()) == 1
+    assert any("attachmentflat" in query["sql"] for query in replica_queries.captured_queries)
+
+
+@pytest.mark.django_db(transaction=True, databases=["default", "replica"])
+def test_attachment_file_read_database(client, user, read_database):
+    attachment = AttachmentFactory(file="replicated.pdf")
+    client.force_login(user)
+    with CaptureQueriesContext(connections[read_database]) as replica_queries:
+        response = client.get(reverse("attachments:file", args=[attachment.pk]))
+    assert response.status_code == status.HTTP_302_FOUND
+    assert len(replica_queries.captured_queries) == 1
+
+
+@pytest.mark.django_db(databases=["default", "replica"])
+def test_attachment_read_your_writes(client, upload_file, user, headers, read_database):
+    client.force_login(user)
+    response = client.post(reverse("attachments:create"), data={"file": upload_file}, **headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.cookies[PRIMARY_COOKIE_NAME]["max-age"] == 10
+
+    with CaptureQueriesContext(connections[read_database]) as replica_queries:
+        response = client.get(reverse("attachments:list"))
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.json()) == 1
+    assert not replica_queries.captured_queries
+
+
+def test_attachment_no_read_database(client, upload_file, user, headers):
+    client.force_login(user)
+    response = client.post(reverse("attachments:create"), data={"file": upload_file}, **headers)
+    assert PRIMARY_COOKIE_NAME not in response.cookies
+
+
+def test_attachment_list_created_range(client, user):
+    old, recent = AttachmentFactory.create_batch(2, file="ranged.pdf")
+    Attachment.objects.filter(pk=old.pk).update(created=timezone.now() - timedelta(days=10))
+    old.refresh_from_db()
+    old.save()
+    client.force_login(user)
+    since = (timezone.now() - timedelta(days=1)).isoformat()
+    response = client.get(reverse("attachments:list"), data={"created_at__gte": since})
+    assert response.status_code == status.HTTP_200_OK
+    assert [row["attachment"] for row in response.json()] == [recent.pk]
+    response = client.get(reverse("attachments:list"), data={"created_at__lte": since})
+    assert [row["attachment"] for row in response.json()] == [old.pk]
+
+
+def test_attachment_list_ordering(client, user):
+    first, second = AttachmentFactory.create_batch(2, file="ordered.pdf")
+    client.force_login(user)
+    response = client.get(reverse("attachments:list"), data={"ordering": "-created_at"})
+    assert response.status_code == status.HTTP_200_OK
+    assert [row["attachment"] for row in response.json()] == [second.pk, first.pk]
+    response = client.get(reverse("attachments:list"), data={"ordering": "created_at"})
+    assert [row["attachment"] for row in response.json()] == [first.pk, second.pk]
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        (None, None),
+        ("bytes=0-4", [(0, 4)]),
+        ("bytes=5-", [(5, 11)]),
+        ("bytes=-3", [(9, 11)]),
+        ("bytes=0-0, 10-20", [(0, 0), (10, 11)]),
+        ("bytes=20-30", []),
+        ("bytes=4-2", None),
+        ("items=0-4", None),
+        ("bytes=a-b", None),
+    ],
+)
+def test_parse_range_header(header, expected):
+    assert parse_range_header(header, 12) == expected
+
+
+@pytest.fixture
+def download(user):
+    attachment = AttachmentFactory(file=SimpleUploadedFile("download.txt", b"hello world!"), uploaded_by=user)
+    return attachment, reverse("attachments:file", args=[attachment.pk]) + "?download"
+
+
+def test_attachment_file_download(client, user, download):
+    attachment, url = download
+    client.force_login(user)
+    response = client.get(url)
+    assert response.status_code == status.HTTP_200_OK
+    assert b"".join(response.streaming_content) == b"hello world!"
+    assert response["Content-Length"] == "12"
+    assert response["Accept-Ranges"] == "bytes"
+    assert response["Content-Type"] == "text/plain"
+
+
+def test_attachment_file_download_range(client, user, download):
+    attachment, url = download
+    client.force_login(user)
+    response = client.get(url, HTTP_RANGE="bytes=6-10")
+    assert response.status_code == status.HTTP_206_PARTIAL_CONTENT
+    assert b"".join(response.streaming_content) == b"world"
+    assert response["Content-Range"] == "bytes 6-10/12"
+    assert response["Content-Length"] == "5"
+
+
+def test_attachment_file_download_multiple_ranges(client, user, download):
+    attachment, url = download
+    client.force_login(user)
+    response = client.get(url, HTTP_RANGE="bytes=0-4,-1")
+    assert response.status_code == status.HTTP_206_PARTIAL_CONTENT
+    boundary = response["Content-Type"].split("boundary=")[1]
+    body = b"".join(response.streaming_content)
+    assert len(body) == int(response["Content-Length"])
+    parts = body.split("--{}".format(boundary).encode())
+    assert parts[1].endswith(b"Content-Range: bytes 0-4/12\r\n\r\nhello\r\n")
+    assert parts[2].endswith(b"Content-Range: bytes 11-11/12\r\n\r\n!\r\n")
+    assert parts[3] == b"--\r\n"
+
+
+def test_attachment_file_download_unsatisfiable(client, user, download):
+    attachment, url = download
+    client.force_login(user)
+    response = client.get(url, HTTP_RANGE="bytes=100-")
+    assert response.status_code == status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE
+    assert response["Content-Range"] == "bytes */12"
+
+
+def test_attachment_file_download_if_range(client, user, download):
+    attachment, url = download
+    client.force_login(user)
+    response = client.get(url)
+    etag = response["ETag"]
+    response = client.get(url, HTTP_RANGE="bytes=0-4", HTTP_IF_RANGE=etag)
+    assert response.status_code == status.HTTP_206_PARTIAL_CONTENT
+    response = client.get(url, HTTP_RANGE="bytes=0-4", HTTP_IF_RANGE='"stale"')
+    assert response.status_code == status.HTTP_200_OK
+    assert b"".join(response.streaming_content) == b"hello world!"
+
+
+def test_attachment_file_download_replaced_file(client, user, download):
+    attachment, url = download
+    Attachment.objects.filter(pk=attachment.pk).update(checksum="a" * 64, file_size=12, mime_type="text/plain")
+    client.force_login(user)
+    etag = client.get(url)["ETag"]
+    assert etag == '"{}"'.format("a" * 64)
+
+    attachment = Attachment.objects.get(pk=attachment.pk)
+    attachment.file = SimpleUploadedFile("replaced.txt", b"hello")
+    attachment.save()
+    response = client.get(url)
+    assert b"".join(response.streaming_content) == b"hello"
+    assert response["Content-Length"] == "5"
+    assert response["ETag"] != etag
+    response = client.get(url, HTTP_RANGE="bytes=0-4", HTTP_IF_RANGE=etag)
+    assert response.status_code == status.HTTP_200_OK
+
+
+def test_attachment_update_permission_filter(upload_file, user, own_attachment_permissions):
+    own = AttachmentFactory(file="own.pdf", uploaded_by=user)
+    other = AttachmentFactory(file="other.pdf", uploaded_by=UserFactory())
+    view = AttachmentUpdateView.as_view()
+    factory = APIRequestFactory()
+
+    request = factory.patch("/", {"file": upload_file}, format="multipart")
+    force_authenticate(request, user)
+    response = view(request, pk=other.pk)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    other.refresh_from_db()
+    assert other.file.name == "other.pdf"
+
+    upload_file.seek(0)
+    request = factory.patch("/", {"file": upload_file}, format="multipart")
+    force_authenticate(request, user)
+    response = view(request, pk=own.pk)
+    assert response.status_code == status.HTTP_200_OK
+    own.refresh_from_db()
+    assert own.file.name != "own.pdf"
+
+
+def test_attachment_feed_permission_filter(client, user, own_attachment_permissions, no_feed_lag):
+    own = AttachmentFactory(file="own.pdf", uploaded_by=user)
+    AttachmentFactory(file="other.pdf", uploaded_by=UserFactory())
+    client.force_login(user)
+    response = client.get(reverse("attachments:feed"))
+    assert response.status_code == status.HTTP_200_OK
+    assert [change["id"] for change in response.json()["changes"]] == [own.pk]
+
+
+def test_attachment_reassign_permission_filter(client, user, own_attachment_permissions):
+    source, target = BookFactory.create_batch(2)
+    own = AttachmentFactory(content_object=source, file="own.pdf", uploaded_by=user)
+    other = AttachmentFactory(content_object=source, file="other.pdf", uploaded_by=UserFactory())
+    client.force_login(user)
+    response = client.post(
+        reverse("attachments:reassign", args=["sample", "book", source.pk]),
+        data={"target": target.pk},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {"reassigned": 1}
+    own.refresh_from_db()
+    other.refresh_from_db()
+    assert own.object_id == target.pk
+    assert other.object_id == source.pk